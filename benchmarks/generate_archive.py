@@ -0,0 +1,190 @@
+"""
+Генератор синтетического архива NKVD01/03/04/05/06 (cp866) для бенчмарков.
+
+Структура полей повторяет реальный архив, значения берутся из пулов,
+в которые намеренно подмешаны «грязные» данные: пустые части дат,
+нецифровые коды, ведущие нули, записи дочерних таблиц с несуществующим ключом.
+Один и тот же seed всегда даёт один и тот же набор файлов.
+
+    python benchmarks/generate_archive.py OUT_DIR --rows 1000000 --fanout 1.5 --seed 1
+"""
+import argparse
+import os
+import struct
+import sys
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main  # noqa: E402
+
+GENERATE_CHUNK_ROWS = 100000
+DELETED_SHARE = 0.01
+ORPHAN_SHARE = 0.001
+
+# -----------------------------------------------------------
+# Пулы значений. Пустая строка и мусор встречаются так же, как в живых архивах.
+WORDS = ['Иванов', 'Петров', 'Сидоров', 'Кузнецова', 'ёлка', 'Щука', 'abc', '№5', 'дом 1/2', '']
+DAYS = [''] * 6 + ['x', '00', '0', '1a', '32'] + [str(d) for d in range(1, 32)] + [f'{d:02d}' for d in range(1, 10)]
+MONTHS = [''] * 4 + ['x', '13', '0'] + [str(m) for m in range(1, 13)] + [f'{m:02d}' for m in range(1, 10)]
+YEARS = ([''] * 6 + ['x', '123', '05', '99', '17'] + [str(y) for y in range(1930, 2024, 3)]
+         + [str(y) for y in range(2010, 2024)])
+
+NKVD01_POOLS: Dict[str, List[str]] = {
+    'SNY': WORDS,
+    'OVD': ['', '1', '01', '123', 'ab', '007', '45'],
+    'LI0': ['', '3', '03', '04', '4', '13', '1', 'x'],
+    'VID': ['A', 'Б', ''],
+    'NOM': [''] + [str(v) for v in range(0, 1000000, 7919)] + ['000123', '12-4'],
+    'FAB': [' '.join(t) for t in zip(WORDS, WORDS[3:] + WORDS[:3], WORDS[5:] + WORDS[:5])],
+    'ZAV': ['', '3', '03', '04', '05', '06', '07', '17', 'x', '1', '99', '7'],
+    'VD1': ['1', '2', ''],
+    'GOD': ['17', '18', '05', '', '9'],
+    'KOD': ['0001', '12', '', '0', 'a1'],
+    'UGD': ['', '1', '123', '00045', '12a3', '654321', '0'],
+    'TER': ['', '012', '12', '0', '001', 'x'],
+    'OSS': ['', '08', '9', '09', '53', '56', '57', '58', '1', 'a', '5'],
+    'KUD': ['', '1', '12', '123', 'x', '0', '007'],
+    'ARX': ['A-1', '', 'арх', '00017'],
+    'FAI': WORDS,
+    'DOP': WORDS + ['доп. сведения отсутствуют'],
+}
+DATE_PREFIXES = ['DB', 'DA', 'DI', 'DC', 'DD', 'SN', 'DR', 'RE']
+
+NKVD01_FIELDS: List[Tuple[str, int]] = [
+    ('SNY', 20), ('OVD', 3), ('LI0', 2), ('VID', 4), ('NOM', 10), ('FAB', 40), ('ZAV', 2),
+    ('VD1', 1), ('GOD', 2), ('KOD', 4), ('UGD', 6), ('TER', 3), ('OSS', 2), ('KUD', 3),
+    ('ARX', 10), ('FAI', 30), ('DOP', 50),
+]
+for _prefix in DATE_PREFIXES:
+    NKVD01_FIELDS += [(f'{_prefix}1', 2), (f'{_prefix}2', 2), (f'{_prefix}3', 4)]
+
+CHILD_TABLES: Dict[str, List[Tuple[str, int, List[str]]]] = {
+    'nkvd03': [('STA', 4, ['158', '105', '', 'x2', '0158']), ('ZNA', 3, ['', '0', '002', '10']),
+               ('CHA', 3, ['', '1', '2', '01']), ('PUN', 3, ['', 'а', 'б', '1'])],
+    'nkvd04': [('SFE', 10, ['', 'A1', 'B2', 'A1', 'ВВ'])],
+    'nkvd05': [('LIN', 4, ['', '33', '045', '44', '57', '012', '7', '0', 'x', '100', '1'])],
+    'nkvd06': [('LI2', 4, ['', '01', '02', '01', 'zz'])],
+}
+
+# -----------------------------------------------------------
+def encode_pool(values: List[str], width: int) -> np.ndarray:
+    """ Пул значений -> матрица байт (len(values), width), дополненная пробелами. """
+    out = np.full((len(values), width), ord(' '), dtype=np.uint8)
+    for i, v in enumerate(values):
+        raw = v.encode(main.ENCODING_IN)[:width]
+        out[i, :len(raw)] = np.frombuffer(raw, dtype=np.uint8)
+    return out
+
+def encode_keys(keys: np.ndarray, width: int) -> np.ndarray:
+    """ Целые ключи -> N-поле фиксированной ширины, выровненное вправо. """
+    powers = 10 ** np.arange(width - 1, -1, -1, dtype=np.int64)
+    digits = (keys[:, None] // powers) % 10
+    out = (digits + ord('0')).astype(np.uint8)
+    leading = keys[:, None] < powers
+    leading[:, -1] = False
+    out[leading] = ord(' ')
+    return out
+
+def dbf_header(fields: List[Tuple[str, int]], numeric: List[str], record_count: int) -> bytes:
+    """
+    Заголовок в cp866; поля из numeric помечаются как N(width, 0).
+    Дата последнего изменения фиксирована, чтобы файлы не зависели от дня генерации.
+    """
+    header = bytearray(main.build_dbf_header(fields, record_count, encoding=main.ENCODING_IN))
+    header[1:4] = bytes([100, 1, 1])
+    for i, (name, _) in enumerate(fields):
+        if name in numeric:
+            header[32 + 32 * i + 11] = ord('N')
+    return bytes(header)
+
+# -----------------------------------------------------------
+def write_nkvd01(path: str, rows: int, rng: np.random.Generator):
+    pools = {name: encode_pool(NKVD01_POOLS[name], width) for name, width in NKVD01_FIELDS[:17]}
+    for prefix in DATE_PREFIXES:
+        pools[f'{prefix}1'] = encode_pool(DAYS, 2)
+        pools[f'{prefix}2'] = encode_pool(MONTHS, 2)
+        pools[f'{prefix}3'] = encode_pool(YEARS, 4)
+    record_length = 1 + sum(width for _, width in NKVD01_FIELDS)
+    with open(path, 'wb') as f:
+        f.write(dbf_header(NKVD01_FIELDS, [], rows))
+        for start in range(0, rows, GENERATE_CHUNK_ROWS):
+            n = min(GENERATE_CHUNK_ROWS, rows - start)
+            block = np.empty((n, record_length), dtype=np.uint8)
+            block[:, 0] = np.where(rng.random(n) < DELETED_SHARE, ord('*'), ord(' '))
+            offset = 1
+            for name, width in NKVD01_FIELDS:
+                pool = pools[name]
+                block[:, offset:offset + width] = pool[rng.integers(0, pool.shape[0], n)]
+                offset += width
+            # Целиком пустая дата — отдельный частый случай
+            offset = 1 + sum(width for _, width in NKVD01_FIELDS[:17])
+            for _ in DATE_PREFIXES:
+                blank = rng.random(n) < 0.2
+                block[blank, offset:offset + 8] = ord(' ')
+                offset += 8
+            f.write(block.tobytes())
+        f.write(b'\x1a')
+
+def write_child(path: str, rows: int, fanout: float, columns: List[Tuple[str, int, List[str]]],
+                rng: np.random.Generator) -> int:
+    key_width = max(6, len(str(rows + 10)))
+    fields = [('P99999', key_width)] + [(name, width) for name, width, _ in columns]
+    pools = [encode_pool(values, width) for _, width, values in columns]
+    record_length = 1 + sum(width for _, width in fields)
+    written = 0
+    with open(path, 'wb') as f:
+        f.write(dbf_header(fields, ['P99999'], 0))
+        for start in range(0, rows, GENERATE_CHUNK_ROWS):
+            n = min(GENERATE_CHUNK_ROWS, rows - start)
+            counts = rng.poisson(fanout, n)
+            keys = np.repeat(np.arange(start + 1, start + n + 1, dtype=np.int64), counts)
+            # Осиротевшие записи: ключ, которого нет в NKVD01
+            orphans = rng.random(len(keys)) < ORPHAN_SHARE
+            keys[orphans] = rows + 1 + rng.integers(0, 9, int(orphans.sum()))
+            m = len(keys)
+            block = np.empty((m, record_length), dtype=np.uint8)
+            block[:, 0] = np.where(rng.random(m) < DELETED_SHARE, ord('*'), ord(' '))
+            block[:, 1:1 + key_width] = encode_keys(keys, key_width)
+            offset = 1 + key_width
+            for pool in pools:
+                width = pool.shape[1]
+                block[:, offset:offset + width] = pool[rng.integers(0, pool.shape[0], m)]
+                offset += width
+            f.write(block.tobytes())
+            written += m
+        f.write(b'\x1a')
+        f.seek(4)
+        f.write(struct.pack('<I', written))
+    return written
+
+def generate_archive(directory: str, rows: int, fanout: float = 1.5, seed: int = 1) -> main.ArchivePaths:
+    """ Пишет полный набор NKVD01/03/04/05/06 в directory и возвращает пути архива. """
+    os.makedirs(directory, exist_ok=True)
+    paths = main.archive_paths(directory)
+    streams = np.random.SeedSequence(seed).spawn(1 + len(CHILD_TABLES))
+    write_nkvd01(paths.nkvd01, rows, np.random.default_rng(streams[0]))
+    for stream, (table, columns) in zip(streams[1:], CHILD_TABLES.items()):
+        write_child(getattr(paths, table), rows, fanout, columns, np.random.default_rng(stream))
+    return paths
+
+# -----------------------------------------------------------
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Синтетический архив NKVD для бенчмарков")
+    parser.add_argument('directory', help="каталог, куда писать DBF-файлы")
+    parser.add_argument('--rows', type=int, default=100000, help="число записей NKVD01 (по умолчанию 100000)")
+    parser.add_argument('--fanout', type=float, default=1.5,
+                        help="среднее число записей дочерней таблицы на одну запись NKVD01")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+    if args.rows < 1:
+        parser.error("--rows должно быть положительным")
+    if args.fanout < 0:
+        parser.error("--fanout не может быть отрицательным")
+    return args
+
+if __name__ == "__main__":
+    args = parse_args()
+    generate_archive(args.directory, args.rows, args.fanout, args.seed)
+    print(f"[ok] Архив на {args.rows} записей записан в {args.directory}")
@@ -0,0 +1,190 @@
+"""
+Бенчмарк конвейера по этапам на синтетическом архиве.
+
+Каждый этап (чтение таблиц, построение индексов NKVD03..06, блоки преобразований
+process_dataframe, запись) замеряется отдельно через main.stage_metrics_hook:
+время, строк/с и пик памяти (tracemalloc, если включён --tracemalloc).
+Результат сравнивается с сохранённым baseline; при замедлении этапа больше
+порога скрипт завершается с кодом 1, без файла baseline — с кодом 2.
+Baseline снимается на той машине, где идёт сравнение, и в репозиторий не входит.
+
+    python benchmarks/run_benchmarks.py --rows 200000 --save-baseline
+    python benchmarks/run_benchmarks.py --rows 200000
+    python benchmarks/run_benchmarks.py --rows 200000 --report-only
+    python benchmarks/run_benchmarks.py --rows 1000000 --scaling 1,2,4
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main  # noqa: E402
+from generate_archive import generate_archive  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+DEFAULT_THRESHOLD = 0.25
+# Этапы короче этого времени не сравниваются: шум таймера больше самого этапа
+MIN_COMPARED_SECONDS = 0.05
+
+# -----------------------------------------------------------
+def archive_directory(rows: int, fanout: float, seed: int) -> str:
+    return os.path.join(tempfile.gettempdir(), 'kronos-bench', f'{rows}x{fanout:g}-s{seed}')
+
+def ensure_archive(rows: int, fanout: float, seed: int, directory: Optional[str] = None) -> main.ArchivePaths:
+    directory = directory or archive_directory(rows, fanout, seed)
+    paths = main.archive_paths(directory)
+    if not all(os.path.exists(p) for p in paths[:5]):
+        print(f"[bench] Генерация архива: {rows} записей, fan-out {fanout:g}, seed {seed} -> {directory}")
+        generate_archive(directory, rows, fanout, seed)
+    return paths
+
+def reset_caches():
+    """ Каждый прогон начинается с холодных кэшей, как отдельный запуск конвертера. """
+    main.VALUE_MAPPER_CACHES.clear()
+    main.normalize_date_triple.cache_clear()
+
+def run_once(paths: main.ArchivePaths, trace_memory: bool) -> dict:
+    reset_caches()
+    stats: Dict[str, dict] = {}
+    hook = main.stage_metrics_hook(stats, trace_memory)
+    main.STAGE_HOOKS.append(hook)
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            main.convert_in_memory(paths)
+    finally:
+        total = time.perf_counter() - start
+        main.STAGE_HOOKS.remove(hook)
+        if trace_memory:
+            tracemalloc.stop()
+    return {'total_seconds': total, 'stages': main.finish_stage_metrics(stats)}
+
+def best_of(runs: List[dict]) -> dict:
+    """ По каждому этапу берётся самый быстрый прогон — так меньше влияние фоновой нагрузки. """
+    best = {'total_seconds': min(r['total_seconds'] for r in runs), 'stages': {}}
+    for name in runs[0]['stages']:
+        best['stages'][name] = min((r['stages'][name] for r in runs), key=lambda e: e['seconds'])
+    return best
+
+# -----------------------------------------------------------
+def compare_with_baseline(result: dict, baseline: dict, threshold: float) -> List[str]:
+    """
+    Сравнение по времени на одну запись NKVD01, чтобы baseline, снятый
+    на другом объёме, тоже был применим. Возвращает список регрессий.
+    """
+    rows, base_rows = result['params']['rows'], baseline['params']['rows']
+    regressions = []
+    for name, base in baseline['stages'].items():
+        current = result['stages'].get(name)
+        if current is None or base['seconds'] < MIN_COMPARED_SECONDS:
+            continue
+        ratio = (current['seconds'] / rows) / (base['seconds'] / base_rows)
+        if ratio > 1 + threshold:
+            regressions.append(f"{name}: {ratio:.2f}x от baseline")
+    ratio = (result['total_seconds'] / rows) / (baseline['total_seconds'] / base_rows)
+    if ratio > 1 + threshold:
+        regressions.append(f"total: {ratio:.2f}x от baseline")
+    # Память с объёмом растёт нелинейно, поэтому сравнивается только на том же архиве
+    if result['params'] == baseline['params'] and baseline.get('max_rss_bytes'):
+        ratio = result['max_rss_bytes'] / baseline['max_rss_bytes']
+        if ratio > 1 + threshold:
+            regressions.append(f"ru_maxrss: {ratio:.2f}x от baseline")
+    return regressions
+
+def print_report(result: dict, baseline: Optional[dict]):
+    base_stages = baseline['stages'] if baseline else {}
+    print(f"{'этап':<28}{'сек':>10}{'строк/с':>14}{'пик, МБ':>10}{'baseline':>10}")
+    for name, entry in result['stages'].items():
+        base = base_stages.get(name)
+        base_col = f"{base['seconds']:.3f}" if base else '-'
+        print(f"{name:<28}{entry['seconds']:>10.3f}{entry['rows_per_sec']:>14,.0f}"
+              f"{entry['tracemalloc_peak_bytes'] / 2 ** 20:>10.1f}{base_col:>10}")
+    base_total = f"{baseline['total_seconds']:.3f}" if baseline else '-'
+    print(f"{'total':<28}{result['total_seconds']:>10.3f}{'':>14}{'':>10}{base_total:>10}")
+    print(f"[bench] ru_maxrss: {result['max_rss_bytes'] / 2 ** 20:.1f} МБ")
+
+def run_scaling(paths: main.ArchivePaths, workers: List[int], chunk_rows: Optional[int]):
+    """ Время convert_parallel при разном числе процессов и ускорение относительно первого. """
+    first = None
+    for count in workers:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            if count > 1:
+                main.convert_parallel(count, chunk_rows, paths=paths)
+            else:
+                main.convert_in_memory(paths)
+        elapsed = time.perf_counter() - start
+        first = first or elapsed
+        print(f"[scaling] workers={count}: {elapsed:.3f} с, ускорение {first / elapsed:.2f}x")
+
+# -----------------------------------------------------------
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Бенчмарк конвейера NKVD01 по этапам")
+    parser.add_argument('--rows', type=int, default=100000, help="число записей NKVD01 (по умолчанию 100000)")
+    parser.add_argument('--fanout', type=float, default=1.5)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--archive-dir', help="каталог архива (по умолчанию — кэш во временном каталоге)")
+    parser.add_argument('--repeat', type=int, default=3, help="число прогонов, берётся лучший")
+    parser.add_argument('--tracemalloc', action='store_true', help="замерять пик памяти по этапам")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true', help="записать результат как новый baseline")
+    parser.add_argument('--report-only', action='store_true', help="только отчёт, без сравнения с baseline")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="допустимое замедление относительно baseline (0.25 = 25%%)")
+    parser.add_argument('--json', dest='json_out', help="сохранить результат в JSON")
+    parser.add_argument('--scaling', help="список чисел процессов для convert_parallel, например 1,2,4")
+    parser.add_argument('--chunk-rows', type=int, default=None, help="размер диапазона для --scaling")
+    return parser.parse_args(argv)
+
+def main_bench(argv=None) -> int:
+    args = parse_args(argv)
+    compare = not (args.save_baseline or args.report_only)
+    if compare and not os.path.exists(args.baseline):
+        # без baseline сравнивать не с чем: это ошибка, а не пройденная проверка
+        print(f"[bench] Baseline не найден: {args.baseline}. Снимите его на этой машине "
+              f"(--save-baseline) или запустите с --report-only")
+        return 2
+    paths = ensure_archive(args.rows, args.fanout, args.seed, args.archive_dir)
+    out_dir = tempfile.mkdtemp(prefix='kronos-bench-out-')
+    paths = paths._replace(out=os.path.join(out_dir, main.OUT_DB))
+
+    runs = [run_once(paths, args.tracemalloc) for _ in range(max(1, args.repeat))]
+    result = best_of(runs)
+    result['params'] = {'rows': args.rows, 'fanout': args.fanout, 'seed': args.seed}
+    result['max_rss_bytes'] = main.max_rss_bytes()
+
+    baseline = None
+    if compare:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+
+    if args.json_out:
+        with open(args.json_out, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.scaling:
+        run_scaling(paths, [int(v) for v in args.scaling.split(',')], args.chunk_rows)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"[bench] Baseline сохранён: {args.baseline}")
+        return 0
+    if baseline is None:
+        return 0
+    regressions = compare_with_baseline(result, baseline, args.threshold)
+    for line in regressions:
+        print(f"[regression] {line}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main_bench())
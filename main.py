@@ -1,8 +1,67 @@
-from typing import List, Dict
-import pandas as pd
-import dbf
+from __future__ import annotations
+from typing import Callable, ContextManager, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
 import re
+import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+import contextlib
+import csv
 import datetime
+import glob
+import hashlib
+import importlib.util
+import io
+import json
+from functools import lru_cache
+import mmap
+import multiprocessing
+import os
+import pickle
+import queue
+import shutil
+import signal
+import struct
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import tracemalloc
+import cProfile
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+def lazy_import(name: str):
+    """
+    Модуль, который загружается при первом обращении к его атрибуту.
+    Лёгкий движок (convert_lean) не трогает pandas/numpy/dbf, и на малых
+    архивах их импорт не тратит время запуска.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError(f"No module named {name!r}")
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+dbf = lazy_import('dbf')
+
+def load_columnar_modules():
+    """
+    Загрузить pandas/numpy/dbf в текущем потоке. Загрузка LazyLoader не потокобезопасна:
+    первое обращение к модулю из нескольких потоков сразу видит недозагруженный модуль,
+    поэтому вызывается до запуска пулов потоков (run_concurrently, prefetch).
+    """
+    pd.DataFrame, np.ndarray, dbf.Table
 
 # -----------------------------------------------------------
 # Настройки файлов и кодировок
@@ -15,6 +74,19 @@ OUT_DB = 'NKVD01_new.DBF'
 ENCODING_IN = 'cp866'
 ENCODING_OUT = 'cp1251'
 
+class ArchivePaths(NamedTuple):
+    nkvd01: str
+    nkvd03: str
+    nkvd04: str
+    nkvd05: str
+    nkvd06: str
+    out: str
+
+def archive_paths(directory: str = '') -> ArchivePaths:
+    # набор файлов архива в каталоге (по умолчанию — текущий каталог, как раньше)
+    names = (IN_DB, NKVD03_DB, NKVD04_DB, NKVD05_DB, NKVD06_DB, OUT_DB)
+    return ArchivePaths(*(os.path.join(directory, name) for name in names))
+
 # Даты (day, month, year)
 DATE_GROUPS: Dict[str, List[str]] = {
     'DB': ['DB1', 'DB2', 'DB3'],
@@ -25,6 +97,17 @@ DATE_GROUPS: Dict[str, List[str]] = {
 
 ugd_merge = ['VD1', 'GOD', 'KOD', 'UGD', 'TER']
 
+# Даты DD, SN, DR, RE (day, month, year); собираются после присоединения дочерних таблиц
+EXTRA_DATE_GROUPS: Dict[str, List[str]] = {
+    'DD': ['DD1', 'DD2', 'DD3'],
+    'SN': ['SN1', 'SN2', 'SN3'],
+    'DR': ['DR1', 'DR2', 'DR3'],
+    'RE': ['RE1', 'RE2', 'RE3'],
+}
+
+# Дата DC, начиная с которой UGD_MERGE собирается в новом формате (VD1+GOD+KOD+UGD(6))
+UGD_NEW_FORMAT_CUTOFF = datetime.date(2017, 2, 1)
+
 # ST*/PUNKT
 F1 = "ST1_ZN_CH"
 F2 = "P1_PUNKT"
@@ -38,7 +121,37 @@ SFE_SEPARATOR = ";"
 LIN_SEPARATOR = ";"
 LI2_SEPARATOR = ";"
 
+# Итоговый порядок полей (включил ZAV и POLUCH_IZ, остальные поля не тронуты)
+columns_to_keep = [
+    'ROW_NUM', 'OVD', 'LI0', 'VID', 'NOM', 'DB', 'DA', 'DI',
+    'FAB', 'ZAV', 'POLUCH_IZ',
+    F1, F2, F3, F4, F5, F6,
+    'SFE', 'LIN', 'LI2', 'SNY', 'DD', 'SN', 'VID_ED',
+    'UGD_MERGE', 'DC',
+    'OSS', 'KUD', 'ARX', 'DR', 'FAI', 'DOP', 'RE', 'RE2'
+]
+
+# Текстовые поля, которые попадают в выходной DBF без изменений: они читаются
+# как сырые байты и перекодируются в выходную кодировку по таблице из 256 байт
+PASSTHROUGH_FIELDS = ('SNY', 'ARX', 'FAI', 'DOP', 'FAB', 'NOM', 'VID')
+
+# Поля входных таблиц, которые использует конвейер; остальные поля при чтении не декодируются
+NKVD01_SOURCE_FIELDS = tuple(dict.fromkeys(
+    ['ROW_NUM', 'OVD', 'LI0', 'ZAV', 'OSS', 'KUD'] + list(PASSTHROUGH_FIELDS) + ugd_merge
+    + [part for parts in DATE_GROUPS.values() for part in parts]
+    + [part for parts in EXTRA_DATE_GROUPS.values() for part in parts]))
+LI2_CANDIDATES = ['LI2', 'LI', 'L2', 'VAL', 'VALUE']
+NKVD03_SOURCE_FIELDS = ('P99999', 'STA', 'ZNA', 'CHA', 'PUN')
+NKVD04_SOURCE_FIELDS = ('P99999', 'SFE')
+NKVD05_SOURCE_FIELDS = ('P99999', 'LIN')
+NKVD06_SOURCE_FIELDS = tuple(['P99999'] + LI2_CANDIDATES)
+CHILD_TABLE_LABELS = ('NKVD03', 'NKVD04', 'NKVD05', 'NKVD06')
+
 # -----------------------------------------------------------
+def is_missing(v) -> bool:
+    # пустое значение ридера (None или NaN); скалярные правила проверяют его без pandas
+    return v is None or (isinstance(v, float) and v != v)
+
 def combine_date_parts(fields, row):
     """
     Нормализация даты: если все три поля пусты -> возвращаем пустую строку ''.
@@ -47,12 +160,23 @@ def combine_date_parts(fields, row):
     raw = []
     for f in fields:
         v = row.get(f, '')
-        if pd.isna(v):
+        if is_missing(v):
             v = ''
         raw.append(str(v).strip())
 
     day, month, year = raw
+    return normalize_date_triple(day, month, year)
+
+# Сколько последних троек помнит normalize_date_triple: воркеры --watch/--batch живут
+# долго, и неограниченный кэш рос бы с каждой новой тройкой
+DATE_TRIPLE_CACHE_SIZE = 65536
 
+@lru_cache(maxsize=DATE_TRIPLE_CACHE_SIZE)
+def normalize_date_triple(day: str, month: str, year: str) -> str:
+    """
+    Правила сборки dd.mm.yyyy из уже очищенных (strip) частей даты.
+    Результат кэшируется (LRU на DATE_TRIPLE_CACHE_SIZE троек), повторная тройка не пересчитывается.
+    """
     # если все пустые — оставляем пустое поле
     if (not day) and (not month) and (not year):
         return ''
@@ -92,8 +216,361 @@ def combine_date_parts(fields, row):
 
     return f"{day}.{month}.{year}"
 
+def plain_column(values: pd.Series) -> pd.Series:
+    # категориальная колонка ридера -> object-колонка с теми же значениями (None вместо NA)
+    if not isinstance(getattr(values, 'dtype', None), pd.CategoricalDtype):
+        return values
+    table = np.array(values.cat.categories.tolist() + [None], dtype=object)
+    return pd.Series(table[values.cat.codes.to_numpy()], index=values.index, dtype=object)
+
+def _date_part_column(df: pd.DataFrame, field: str) -> pd.Series:
+    if field not in df.columns:
+        return pd.Series('', index=df.index, dtype=object)
+    col = plain_column(df[field])
+    return col.where(col.notna(), '').astype(str).str.strip()
+
+def combine_date_columns(df: pd.DataFrame, fields: List[str]) -> pd.Series:
+    """
+    Колоночный вариант combine_date_parts: три колонки (день, месяц, год) -> колонка dd.mm.yyyy.
+    Строки сводятся к уникальным тройкам, правила применяются один раз на тройку,
+    затем результат раскладывается обратно по кодам.
+    """
+    day, month, year = (_date_part_column(df, f) for f in fields)
+    codes, uniques = pd.MultiIndex.from_arrays([day, month, year]).factorize()
+    values = np.array([normalize_date_triple(*u) for u in uniques], dtype=object)
+    return pd.Series(values[codes], index=df.index, dtype=object)
+
 # -----------------------------------------------------------
-def read_dbf_with_all_records(path: str, encoding: str = ENCODING_IN) -> pd.DataFrame:
+class DbfField(NamedTuple):
+    name: str
+    type: str
+    offset: int
+    length: int
+    decimals: int
+
+class DbfHeader(NamedTuple):
+    version: int
+    record_count: int
+    header_length: int
+    record_length: int
+    fields: List[DbfField]
+
+# Типы полей, которые умеет разбирать нативный ридер; остальное (memo и т.п.) читаем через dbf
+NATIVE_FIELD_TYPES = {'C', 'N', 'F', 'D', 'L'}
+
+def read_dbf_header(buf, encoding: str = ENCODING_IN) -> DbfHeader:
+    """
+    Разбор заголовка dBase III и дескрипторов полей.
+    Имена полей и смещения вычисляются так же, как в библиотеке dbf.
+    """
+    version = buf[0]
+    record_count, header_length, record_length = struct.unpack('<IHH', bytes(buf[4:12]))
+    fields = []
+    offset = 1
+    pos = 32
+    while pos + 32 <= min(header_length, len(buf)) and buf[pos] != 0x0D:
+        block = bytes(buf[pos:pos + 32])
+        nul = block.find(b'\x00', 0, 11)
+        raw_name = block[:nul] if nul >= 0 else block[:10]
+        name = raw_name.decode(encoding).upper()
+        ftype = chr(block[11])
+        length = block[16]
+        decimals = block[17]
+        fields.append(DbfField(name, ftype, offset, length, decimals))
+        offset += length
+        pos += 32
+    return DbfHeader(version, record_count, header_length, record_length, fields)
+
+def decode_char_column(block: bytes, width: int, encoding: str) -> List[str]:
+    # cp866 однобайтовая, поэтому ширина в символах совпадает с шириной в байтах
+    text = block.decode(encoding)
+    return [text[i:i + width] for i in range(0, len(text), width)]
+
+# C-поля не шире этого читаются через таблицу уникальных значений: категориальной
+# колонкой, если различных значений не больше половины записей, иначе object-колонкой
+CATEGORICAL_MAX_WIDTH = 8
+
+def decode_char_categorical(values: np.ndarray, encoding: str):
+    """
+    Значения C-поля (n x width байт) -> pd.Categorical по уникальным байтовым строкам.
+    Декодируется только каждое уникальное значение; категории различны,
+    т.к. однобайтовая кодировка переводит разные байты в разные символы.
+    """
+    n, width = values.shape
+    keys = np.ascontiguousarray(values).view(np.dtype((np.void, width))).ravel()
+    uniques, codes = np.unique(keys, return_inverse=True)
+    categories = [u.tobytes().decode(encoding) for u in uniques]
+    if len(categories) > n // 2:
+        return np.array(categories, dtype=object)[codes]
+    return pd.Categorical.from_codes(codes.astype(np.int32), categories)
+
+def _numeric_value(raw: bytes, decimals: int):
+    s = raw.replace(b'\x00', b'').strip()
+    if not s or s[0:1] == b'*':
+        return None
+    if decimals == 0:
+        return int(s)
+    return float(s)
+
+def _date_value(raw: bytes):
+    if raw in (b'        ', b'00000000'):
+        return None
+    return datetime.date(int(raw[0:4]), int(raw[4:6]), int(raw[6:8]))
+
+def _logical_value(raw: bytes):
+    if raw in b'tTyY':
+        return True
+    if raw in b'fFnN':
+        return False
+    return None
+
+def decode_dbf_column(records: np.ndarray, field: DbfField, encoding: str, compact: bool = False):
+    """
+    Декодирование одной колонки целиком из буфера записей (n x record_length).
+    Значения совпадают с тем, что отдаёт dbf.Table для dBase III.
+    compact=True: узкие C-поля отдаются через decode_char_categorical.
+    """
+    if compact and field.type == 'C' and 0 < field.length <= CATEGORICAL_MAX_WIDTH and len(records):
+        return decode_char_categorical(records[:, field.offset:field.offset + field.length], encoding)
+    return decode_field_block(records[:, field.offset:field.offset + field.length].tobytes(), field, encoding)
+
+def decode_field_block(block: bytes, field: DbfField, encoding: str) -> list:
+    # значения поля из подряд идущих байт его записей (n x length)
+    width = field.length
+    if field.type == 'C':
+        return decode_char_column(block, width, encoding)
+    raws = [block[i:i + width] for i in range(0, len(block), width)]
+    if field.type in ('N', 'F'):
+        return [_numeric_value(r, field.decimals) for r in raws]
+    if field.type == 'D':
+        return [_date_value(r) for r in raws]
+    return [_logical_value(r) for r in raws]
+
+def native_dbf_layout(mm, encoding: str = ENCODING_IN) -> Optional[Tuple[DbfHeader, int]]:
+    """
+    Заголовок и число реально присутствующих в файле записей,
+    либо None, если формат не поддерживается нативным ридером.
+    """
+    if len(mm) < 32:
+        return None
+    header = read_dbf_header(mm, encoding)
+    if len(mm) < header.header_length or header.record_length == 0:
+        return None
+    if header.version not in (0x03, 0x83):
+        return None
+    if any(f.type not in NATIVE_FIELD_TYPES for f in header.fields):
+        return None
+    if sum(f.length for f in header.fields) + 1 != header.record_length:
+        return None
+    available = max(len(mm) - header.header_length, 0) // header.record_length
+    return header, min(header.record_count, available)
+
+def dbf_record_block(mm, header: DbfHeader, start: int, stop: int) -> np.ndarray:
+    # записи [start, stop) как матрица байт (n x record_length) поверх mmap, без копирования
+    return np.frombuffer(mm, dtype=np.uint8, count=(stop - start) * header.record_length,
+                         offset=header.header_length + start * header.record_length
+                         ).reshape(stop - start, header.record_length)
+
+def projected_fields(header: DbfHeader, columns: Optional[Iterable[str]]) -> List[DbfField]:
+    # поля заголовка, которые нужно декодировать (None — все)
+    if columns is None:
+        return header.fields
+    wanted = set(columns)
+    return [f for f in header.fields if f.name in wanted]
+
+def passthrough_fields(header: DbfHeader, n: int, passthrough: Iterable[str]) -> List[DbfField]:
+    # сырыми байтами отдаются только C-поля и только если в файле есть все записи из заголовка
+    if n == 0 or n < header.record_count:
+        return []
+    wanted = set(passthrough)
+    return [f for f in header.fields if f.name in wanted and f.type == 'C']
+
+def decode_dbf_records(records: np.ndarray, header: DbfHeader, encoding: str,
+                       raw_fields: List[DbfField], columns: Optional[Iterable[str]] = None
+                       ) -> Tuple[Dict[str, object], Dict[str, np.ndarray]]:
+    """
+    Колонки блока записей. Поля из raw_fields не декодируются: их байты копируются
+    в матрицу (n x length), а в колонку кладутся номера строк этой матрицы.
+    При заданном columns читаются только эти поля, узкие C-поля — компактно
+    (decode_char_categorical).
+    """
+    decoded: Dict[str, object] = {}
+    raw_text: Dict[str, np.ndarray] = {}
+    for field in projected_fields(header, columns):
+        if field in raw_fields:
+            # копия, а не вид на mmap (блок из одной записи уже непрерывен, и ascontiguousarray его не копирует)
+            raw_text[field.name] = records[:, field.offset:field.offset + field.length].copy()
+            decoded[field.name] = np.arange(len(records))
+        else:
+            decoded[field.name] = decode_dbf_column(records, field, encoding, compact=columns is not None)
+    return decoded, raw_text
+
+def pad_records(df: pd.DataFrame, record_count: int) -> pd.DataFrame:
+    """
+    Добивка таблицы пустыми записями до record_count строк. Типы как у прежней
+    склейки с кадром из None: object-колонки получают None, числовые — NaN (целые
+    становятся float). Категориальные колонки становятся обычными (plain_column):
+    пустая запись — не значение словаря.
+    """
+    columns = {}
+    for name in df.columns:
+        col = plain_column(df[name])
+        if col.dtype == object:
+            values = np.full(record_count, None, dtype=object)
+            values[:len(col)] = col.to_numpy()
+            columns[name] = values
+        else:
+            columns[name] = col.reindex(pd.RangeIndex(record_count)).to_numpy()
+    return pd.DataFrame(columns, index=pd.RangeIndex(record_count))
+
+def read_dbf_native_passthrough(path: str, encoding: str = ENCODING_IN, passthrough: Iterable[str] = (),
+                                columns: Optional[Iterable[str]] = None
+                                ) -> Optional[Tuple[pd.DataFrame, Dict[str, np.ndarray]]]:
+    """
+    Чтение DBF через mmap: заголовок разбираем сами, колонки декодируем целиком
+    из буфера записей фиксированной ширины, без промежуточного dict на строку.
+    Удалённые записи (флаг '*') читаются, как и в dbf.Table.
+    C-поля из passthrough остаются сырыми байтами, columns ограничивает
+    декодируемые поля (см. decode_dbf_records).
+    Возвращает None, если формат не поддерживается (тогда читаем через dbf).
+    """
+    with open(path, 'rb') as fh:
+        if os.fstat(fh.fileno()).st_size == 0:
+            return None
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            layout = native_dbf_layout(mm, encoding)
+            if layout is None:
+                return None
+            header, n = layout
+            if hasattr(mm, 'madvise'):
+                # файл читается целиком: пусть ядро подкачивает его заранее
+                mm.madvise(mmap.MADV_WILLNEED)
+            records = dbf_record_block(mm, header, 0, n)
+            decoded, raw_text = decode_dbf_records(records, header, encoding,
+                                                   passthrough_fields(header, n, passthrough), columns)
+            del records
+
+    if n == 0:
+        df = pd.DataFrame([])
+    else:
+        df = pd.DataFrame(decoded)
+    # добиваем пустыми строками до числа записей из заголовка (как в старом ридере)
+    if len(df) < header.record_count:
+        df = pad_records(df, header.record_count)
+    return df, raw_text
+
+def read_dbf_native(path: str, encoding: str = ENCODING_IN) -> Optional[pd.DataFrame]:
+    result = read_dbf_native_passthrough(path, encoding)
+    return None if result is None else result[0]
+
+def numeric_field_dtypes(mm, header: DbfHeader, n: int, chunk_rows: int,
+                         columns: Optional[Iterable[str]] = None) -> Dict[str, Optional[str]]:
+    """
+    Тип, который pandas выберет для N/F-колонки при чтении всей таблицы сразу:
+    int64 без пустых значений, float64 при наличии пустых, object (None), если значений нет.
+    Нужен, чтобы блоки при потоковом чтении давали те же str(), что и полное чтение.
+    """
+    dtypes: Dict[str, Optional[str]] = {}
+    numeric = [f for f in projected_fields(header, columns) if f.type in ('N', 'F')]
+    has_value = {f.name: False for f in numeric}
+    has_blank = {f.name: n < header.record_count for f in numeric}
+    for start in range(0, n, chunk_rows):
+        records = dbf_record_block(mm, header, start, min(start + chunk_rows, n))
+        for field in numeric:
+            values = decode_dbf_column(records, field, 'ascii')
+            if any(v is None for v in values):
+                has_blank[field.name] = True
+            if any(v is not None for v in values):
+                has_value[field.name] = True
+        del records
+    for field in numeric:
+        if not has_value[field.name]:
+            dtypes[field.name] = None
+        elif has_blank[field.name] or field.decimals:
+            dtypes[field.name] = 'float64'
+        else:
+            dtypes[field.name] = 'int64'
+    return dtypes
+
+def decode_dbf_chunk(mm, header: DbfHeader, start: int, stop: int,
+                     dtypes: Dict[str, Optional[str]], encoding: str = ENCODING_IN,
+                     passthrough: Iterable[str] = (), columns: Optional[Iterable[str]] = None
+                     ) -> Tuple[pd.DataFrame, Dict[str, np.ndarray]]:
+    # блок записей [start, stop) с типами колонок полного чтения и сквозным индексом
+    records = dbf_record_block(mm, header, start, stop)
+    raw_fields = passthrough_fields(header, header.record_count, passthrough)
+    decoded, raw_text = decode_dbf_records(records, header, encoding, raw_fields, columns)
+    for name, dtype in dtypes.items():
+        if dtype:
+            decoded[name] = pd.Series(decoded[name], dtype=dtype)
+    del records
+    chunk = pd.DataFrame(decoded)
+    chunk.index = pd.RangeIndex(start, stop)
+    return chunk, raw_text
+
+def dbf_chunk_plan(path: str, chunk_rows: int, encoding: str = ENCODING_IN,
+                   columns: Optional[Iterable[str]] = None
+                   ) -> Optional[Tuple[DbfHeader, int, Dict[str, Optional[str]]]]:
+    """
+    Заголовок, число записей и типы числовых колонок для блочного чтения,
+    либо None, если файл не читается нативно или короче, чем указано в заголовке.
+    """
+    with open(path, 'rb') as fh:
+        if os.fstat(fh.fileno()).st_size == 0:
+            return None
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            layout = native_dbf_layout(mm, encoding)
+            if layout is None or layout[1] < layout[0].record_count:
+                return None
+            header, n = layout
+            return header, n, numeric_field_dtypes(mm, header, n, chunk_rows, columns)
+
+def read_dbf_row_range(path: str, start: int, stop: int, header: DbfHeader,
+                       dtypes: Dict[str, Optional[str]], encoding: str = ENCODING_IN,
+                       passthrough: Iterable[str] = (), columns: Optional[Iterable[str]] = None
+                       ) -> Tuple[pd.DataFrame, Dict[str, np.ndarray]]:
+    # чтение диапазона записей по плану dbf_chunk_plan (каждый процесс открывает mmap сам)
+    with open(path, 'rb') as fh:
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return decode_dbf_chunk(mm, header, start, stop, dtypes, encoding, passthrough, columns)
+
+def iter_dbf_chunks(path: str, chunk_rows: int, encoding: str = ENCODING_IN,
+                    passthrough: Iterable[str] = (), columns: Optional[Iterable[str]] = None
+                    ) -> Iterator[Tuple[pd.DataFrame, Dict[str, np.ndarray]]]:
+    """
+    Потоковое чтение DBF блоками по chunk_rows записей (индекс строк сквозной).
+    Типы колонок в каждом блоке совпадают с типами при полном чтении таблицы.
+    Каждый блок отдаётся вместе с сырыми байтами полей из passthrough.
+    """
+    with open(path, 'rb') as fh:
+        mm = None
+        layout = None
+        if os.fstat(fh.fileno()).st_size > 0:
+            mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            layout = native_dbf_layout(mm, encoding)
+        if layout is None:
+            if mm is not None:
+                mm.close()
+            # неподдерживаемый формат: читаем целиком и отдаём срезами
+            df = select_read_columns(read_dbf_with_all_records(path, encoding=encoding), columns)
+            for start in range(0, len(df), chunk_rows):
+                yield df.iloc[start:start + chunk_rows].copy(), {}
+            return
+        with mm:
+            header, n = layout
+            dtypes = numeric_field_dtypes(mm, header, n, chunk_rows, columns)
+            for start in range(0, n, chunk_rows):
+                yield decode_dbf_chunk(mm, header, start, min(start + chunk_rows, n), dtypes, encoding,
+                                       passthrough, columns)
+            # добивка пустыми строками до числа записей из заголовка, как в полном чтении
+            for start in range(n, header.record_count, chunk_rows):
+                stop = min(start + chunk_rows, header.record_count)
+                chunk = pd.DataFrame({f.name: pd.Series([None] * (stop - start), dtype=dtypes.get(f.name) or object)
+                                      for f in projected_fields(header, columns)})
+                chunk.index = pd.RangeIndex(start, stop)
+                yield chunk, {}
+
+def read_dbf_with_dbf_library(path: str, encoding: str = ENCODING_IN) -> pd.DataFrame:
     table = dbf.Table(path, codepage=encoding)
     table.open()
     records = []
@@ -105,14 +582,244 @@ def read_dbf_with_all_records(path: str, encoding: str = ENCODING_IN) -> pd.Data
     df = pd.DataFrame(records)
     total_records = len(table)
     if len(df) < total_records:
-        empty_df = pd.DataFrame([{c: None for c in df.columns}] * (total_records - len(df)))
-        df = pd.concat([df, empty_df], ignore_index=True)
+        df = pad_records(df, total_records)
     table.close()
     return df
 
+def select_read_columns(df: pd.DataFrame, columns: Optional[Iterable[str]]) -> pd.DataFrame:
+    # проекция для ридеров, которые декодируют таблицу целиком (библиотека dbf)
+    if columns is None:
+        return df
+    wanted = set(columns)
+    return df[[c for c in df.columns if c in wanted]]
+
+def read_dbf_passthrough(path: str, passthrough: Iterable[str], encoding: str = ENCODING_IN,
+                         columns: Optional[Iterable[str]] = None) -> Tuple[pd.DataFrame, Dict[str, np.ndarray]]:
+    """
+    Как read_dbf_with_all_records, но C-поля из passthrough читаются сырыми байтами,
+    если это возможно, а при заданном columns — только эти поля.
+    """
+    result = read_dbf_native_passthrough(path, encoding, passthrough, columns)
+    if result is not None:
+        return result
+    return select_read_columns(read_dbf_with_dbf_library(path, encoding), columns), {}
+
+def read_dbf_with_all_records(path: str, encoding: str = ENCODING_IN) -> pd.DataFrame:
+    df = read_dbf_native(path, encoding=encoding)
+    if df is None:
+        df = read_dbf_with_dbf_library(path, encoding=encoding)
+    return df
+
+# -----------------------------------------------------------
+# Кэш разобранных входных таблиц (включается --cache-dir).
+# Запись кэша — каталог с колонками в .npy: числовые колонки и сырые байты
+# passthrough-полей хранятся как есть и открываются через mmap, object-колонки —
+# как коды (.npy) и список уникальных значений (pickle), из которых колонка
+# собирается без повторного декодирования строк.
+INPUT_CACHE_DIR: Optional[str] = None
+INPUT_CACHE_MAX_BYTES = 2 * 1024 ** 3
+INPUT_CACHE_FORMAT = 2
+
+def dbf_cache_key(path: str, encoding: str, passthrough: Iterable[str],
+                  columns: Optional[Iterable[str]] = None) -> dict:
+    # ключ: путь, размер, mtime и хэш заголовка (описания полей) исходного файла
+    st = os.stat(path)
+    with open(path, 'rb') as fh:
+        head = fh.read(32)
+        header_length = struct.unpack('<H', head[8:10])[0] if len(head) >= 10 else len(head)
+        head += fh.read(max(header_length - len(head), 0))
+    return {
+        'format': INPUT_CACHE_FORMAT,
+        'path': os.path.abspath(path),
+        'size': st.st_size,
+        'mtime_ns': st.st_mtime_ns,
+        'header_sha1': hashlib.sha1(head).hexdigest(),
+        'encoding': encoding,
+        'passthrough': sorted(set(passthrough)),
+        'columns': None if columns is None else sorted(set(columns)),
+    }
+
+def dbf_cache_entry(key: dict) -> str:
+    # одна запись кэша на файл+режим чтения: устаревшая версия перезаписывается на месте
+    parts = [key['path'], key['encoding'], key['passthrough'], key['columns']]
+    if 'index' in key:
+        parts.append(key['index'])
+    name = json.dumps(parts, ensure_ascii=False)
+    return os.path.join(INPUT_CACHE_DIR, hashlib.sha1(name.encode('utf-8')).hexdigest()[:20])
+
+def save_cached_table(entry: str, key: dict, df: pd.DataFrame, raw_text: Dict[str, np.ndarray]):
+    tmp = tempfile.mkdtemp(prefix='.tmp-', dir=INPUT_CACHE_DIR)
+    try:
+        columns = []
+        for i, name in enumerate(df.columns):
+            col = df[name]
+            if col.dtype == object:
+                codes, uniques = pd.factorize(col, use_na_sentinel=True)
+                np.save(os.path.join(tmp, f'{i}.codes.npy'), codes.astype(np.int32))
+                with open(os.path.join(tmp, f'{i}.values.pkl'), 'wb') as f:
+                    pickle.dump(list(uniques), f, protocol=pickle.HIGHEST_PROTOCOL)
+                # NA-значение object-колонки у нашего ридера всегда None
+                columns.append({'name': name, 'kind': 'codes'})
+            elif isinstance(col.dtype, pd.CategoricalDtype):
+                np.save(os.path.join(tmp, f'{i}.codes.npy'), col.cat.codes.to_numpy())
+                with open(os.path.join(tmp, f'{i}.values.pkl'), 'wb') as f:
+                    pickle.dump(col.cat.categories.tolist(), f, protocol=pickle.HIGHEST_PROTOCOL)
+                columns.append({'name': name, 'kind': 'category'})
+            else:
+                np.save(os.path.join(tmp, f'{i}.npy'), col.to_numpy())
+                columns.append({'name': name, 'kind': 'array'})
+        for name, block in raw_text.items():
+            np.save(os.path.join(tmp, f'raw.{name}.npy'), block)
+        with open(os.path.join(tmp, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({'key': key, 'rows': len(df), 'columns': columns, 'raw': list(raw_text)},
+                      f, ensure_ascii=False)
+        shutil.rmtree(entry, ignore_errors=True)
+        os.replace(tmp, entry)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+def load_cached_table(entry: str, key: dict) -> Optional[Tuple[pd.DataFrame, Dict[str, np.ndarray]]]:
+    meta_path = os.path.join(entry, 'meta.json')
+    try:
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get('key') != key:
+        return None
+    try:
+        columns = {}
+        for i, column in enumerate(meta['columns']):
+            if column['kind'] == 'codes':
+                codes = np.load(os.path.join(entry, f'{i}.codes.npy'), mmap_mode='r')
+                with open(os.path.join(entry, f'{i}.values.pkl'), 'rb') as f:
+                    values = pickle.load(f)
+                uniques = np.empty(len(values) + 1, dtype=object)
+                uniques[:-1] = values
+                # код -1 (NA) попадает на последний элемент — None
+                columns[column['name']] = uniques[codes]
+            elif column['kind'] == 'category':
+                codes = np.load(os.path.join(entry, f'{i}.codes.npy'))
+                with open(os.path.join(entry, f'{i}.values.pkl'), 'rb') as f:
+                    categories = pickle.load(f)
+                columns[column['name']] = pd.Categorical.from_codes(codes, categories)
+            else:
+                columns[column['name']] = np.load(os.path.join(entry, f'{i}.npy'), mmap_mode='c')
+        raw_text = {name: np.load(os.path.join(entry, f'raw.{name}.npy'), mmap_mode='c') for name in meta['raw']}
+    except (OSError, ValueError, KeyError, pickle.UnpicklingError):
+        return None
+    os.utime(meta_path)  # отметка последнего использования для LRU
+    df = pd.DataFrame(columns) if meta['columns'] else pd.DataFrame([])
+    if len(df) < meta['rows']:
+        df = df.reindex(range(meta['rows']))
+    return df, raw_text
+
+def cache_entry_size(entry: str) -> int:
+    total = 0
+    for name in os.listdir(entry):
+        try:
+            total += os.path.getsize(os.path.join(entry, name))
+        except OSError:
+            pass
+    return total
+
+def evict_input_cache(keep: str, max_bytes: int):
+    """
+    LRU-вытеснение: пока каталог кэша больше max_bytes, удаляются записи
+    с самым старым временем использования (mtime meta.json); keep не трогаем.
+    """
+    entries = []
+    for name in os.listdir(INPUT_CACHE_DIR):
+        entry = os.path.join(INPUT_CACHE_DIR, name)
+        meta_path = os.path.join(entry, 'meta.json')
+        if not os.path.isdir(entry) or not os.path.exists(meta_path):
+            continue
+        entries.append((os.path.getmtime(meta_path), entry, cache_entry_size(entry)))
+    total = sum(size for _, _, size in entries)
+    for _, entry, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        if entry == keep:
+            continue
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
+
+def read_dbf_cached(path: str, passthrough: Iterable[str] = (), encoding: str = ENCODING_IN,
+                    columns: Optional[Iterable[str]] = None) -> Tuple[pd.DataFrame, Dict[str, np.ndarray]]:
+    """
+    read_dbf_passthrough через кэш INPUT_CACHE_DIR (если он задан).
+    Запись кэша действительна, пока совпадают путь, размер, mtime и заголовок файла.
+    """
+    if INPUT_CACHE_DIR is None:
+        return read_dbf_passthrough(path, passthrough, encoding=encoding, columns=columns)
+    os.makedirs(INPUT_CACHE_DIR, exist_ok=True)
+    key = dbf_cache_key(path, encoding, passthrough, columns)
+    entry = dbf_cache_entry(key)
+    cached = load_cached_table(entry, key)
+    if cached is not None:
+        print(f"[cache] {path}: взято из кэша")
+        return cached
+    df, raw_text = read_dbf_passthrough(path, passthrough, encoding=encoding, columns=columns)
+    if isinstance(df.index, pd.RangeIndex) and df.index.start == 0 and df.columns.is_unique:
+        try:
+            save_cached_table(entry, key, df, raw_text)
+            evict_input_cache(entry, INPUT_CACHE_MAX_BYTES)
+        except OSError as e:
+            print(f"[warn] Не удалось сохранить {path} в кэш: {e}")
+    return df, raw_text
+
+# Индексы дочерних таблиц (ChildIndex) хранятся в том же каталоге отдельными записями:
+# ключи, смещения и коды — .npy, таблицы значений — .npy со строками фиксированной ширины.
+CHILD_INDEX_FORMAT = 1
+
+def child_index_cache_key(path: str, label: str, columns: Optional[Iterable[str]]) -> dict:
+    # к ключу исходного файла добавляются вид индекса и версия правил, по которым он строится
+    key = dbf_cache_key(path, ENCODING_IN, (), columns)
+    key.update({'index': label, 'index_format': CHILD_INDEX_FORMAT, 'version': CONVERTER_VERSION})
+    return key
+
+def save_child_index(entry: str, key: dict, index: ChildIndex):
+    tmp = tempfile.mkdtemp(prefix='.tmp-', dir=INPUT_CACHE_DIR)
+    try:
+        np.save(os.path.join(tmp, 'keys.npy'), index.keys)
+        np.save(os.path.join(tmp, 'offsets.npy'), index.offsets)
+        for name in index.codes:
+            np.save(os.path.join(tmp, f'{name}.codes.npy'), index.codes[name])
+            np.save(os.path.join(tmp, f'{name}.values.npy'), np.array(list(index.values[name]), dtype=str))
+        with open(os.path.join(tmp, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({'key': key, 'columns': list(index.codes), 'unparsed': index.unparsed,
+                       'unparsed_samples': index.unparsed_samples}, f, ensure_ascii=False)
+        shutil.rmtree(entry, ignore_errors=True)
+        os.replace(tmp, entry)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+def load_cached_child_index(entry: str, key: dict) -> Optional[ChildIndex]:
+    meta_path = os.path.join(entry, 'meta.json')
+    try:
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if meta.get('key') != key:
+        return None
+    def load(name: str) -> np.ndarray:
+        return np.load(os.path.join(entry, name), allow_pickle=False)
+    try:
+        index = ChildIndex(load('keys.npy'), load('offsets.npy'),
+                           {name: load(f'{name}.codes.npy') for name in meta['columns']},
+                           {name: load(f'{name}.values.npy').astype(object) for name in meta['columns']},
+                           meta['unparsed'], meta['unparsed_samples'])
+    except (OSError, ValueError, KeyError):
+        return None
+    os.utime(meta_path)  # отметка последнего использования для LRU
+    return index
+
 # -----------------------------------------------------------
 def normalize_digits(s) -> str:
-    if s is None or (isinstance(s, float) and pd.isna(s)):
+    if is_missing(s):
         return ''
     s = str(s)
     return ''.join(re.findall(r'\d', s))
@@ -126,71 +833,179 @@ def build_st_zn_ch(sta, zna, cha) -> str:
         return ''
     return f"{sta_d}0{zna_nozeros}{cha_d}"
 
+def digits_column(values: pd.Series) -> pd.Series:
+    # аналог normalize_digits для целой колонки
+    return values.where(values.notna(), '').astype(str).str.replace(r'\D', '', regex=True)
+
+def build_st_zn_ch_columns(sta: pd.Series, zna: pd.Series, cha: pd.Series) -> pd.Series:
+    """
+    Колоночный вариант build_st_zn_ch (те же правила, без прохода по строкам).
+    """
+    sta_d = digits_column(sta)
+    zna_nozeros = digits_column(zna).str.replace('0', '', regex=False)
+    zna_nozeros = zna_nozeros.where(zna_nozeros != '', '0')
+    cha_d = digits_column(cha)
+    result = sta_d + '0' + zna_nozeros + cha_d
+    empty = (sta_d == '') & (zna_nozeros == '') & (cha_d == '')
+    return result.where(~empty, '')
+
 # -----------------------------------------------------------
-def build_nkvd03_map(nkvd03_df: pd.DataFrame) -> Dict[str, List[Dict[str, str]]]:
-    mapping = {}
-    for _, row in nkvd03_df.iterrows():
-        key = str(row.get('P99999', '')).strip()
-        entry = {
-            'STA': '' if pd.isna(row.get('STA')) else row.get('STA'),
-            'ZNA': '' if pd.isna(row.get('ZNA')) else row.get('ZNA'),
-            'CHA': '' if pd.isna(row.get('CHA')) else row.get('CHA'),
-            'PUN': '' if pd.isna(row.get('PUN')) else row.get('PUN'),
-        }
-        mapping.setdefault(key, []).append(entry)
-    return mapping
-
-def build_nkvd04_multi(nkvd04_df: pd.DataFrame) -> Dict[str, List[str]]:
-    multi_map: Dict[str, List[str]] = {}
-    for _, row in nkvd04_df.iterrows():
-        key = str(row.get('P99999', '')).strip()
-        sfe_val = row.get('SFE', '')
-        if pd.isna(sfe_val):
-            continue
-        sfe_s = str(sfe_val).strip()
-        if sfe_s == '':
-            continue
-        multi_map.setdefault(key, []).append(sfe_s)
-    return multi_map
-
-def build_nkvd05_multi(nkvd05_df: pd.DataFrame) -> Dict[str, List[str]]:
-    multi_map: Dict[str, List[str]] = {}
-    for _, row in nkvd05_df.iterrows():
-        key = str(row.get('P99999', '')).strip()
-        lin_val = row.get('LIN', '')
-        if pd.isna(lin_val):
-            continue
-        lin_s = str(lin_val).strip()
-        if lin_s == '':
-            continue
-        multi_map.setdefault(key, []).append(lin_s)
-    return multi_map
-
-def build_nkvd06_multi(nkvd06_df: pd.DataFrame) -> Dict[str, List[str]]:
-    multi_map: Dict[str, List[str]] = {}
-    for _, row in nkvd06_df.iterrows():
-        key = str(row.get('P99999', '')).strip()
-        li2_val = None
-        for candidate in ('LI2', 'LI', 'L2', 'VAL', 'VALUE'):
-            try:
-                li2_val = row.get(candidate)
-            except Exception:
-                li2_val = None
-            if li2_val is not None:
-                break
-        if li2_val is None:
-            li2_val = row.get('LI2', '')
-        if pd.isna(li2_val):
-            continue
-        li2_s = str(li2_val).strip()
-        if li2_s == '':
-            continue
-        multi_map.setdefault(key, []).append(li2_s)
-    return multi_map
+def child_column(child_df: pd.DataFrame, field: str) -> pd.Series:
+    # отсутствующая колонка дочерней таблицы ведёт себя как пустые значения
+    if field not in child_df.columns:
+        return pd.Series([None] * len(child_df), index=child_df.index, dtype=object)
+    return plain_column(child_df[field])
+
+# строка, которая совпадает с str(int) и помещается в int64
+JOIN_KEY_PATTERN = r'0|-?[1-9][0-9]{0,17}'
+
+def integer_join_key(values: pd.Series) -> pd.Series:
+    """
+    Целочисленный ключ связи по строковому представлению значения.
+    Ключ получают только значения, чья строка (после strip) совпадает с str(int),
+    т.е. ровно те, что раньше совпадали со str(ROW_NUM); остальные -> <NA>.
+    """
+    if values.dtype.kind in 'iu':
+        # у целых str(v) не совпадает с шаблоном только за пределами 18 знаков
+        return values.astype('Int64').where((values > -10 ** 18) & (values < 10 ** 18))
+    s = values.astype(str).str.strip()
+    valid = s.str.fullmatch(JOIN_KEY_PATTERN)
+    return pd.to_numeric(s.where(valid, None), errors='coerce').astype('Int64')
+
+class ChildIndex(NamedTuple):
+    """
+    Индекс дочерней таблицы по P99999 в форме CSR: записи отсортированы по целочисленному
+    ключу (внутри ключа — в порядке файла), записи ключа keys[i] — позиции offsets[i]:offsets[i + 1].
+    Колонки значений хранятся словарём: коды (int32) на запись и таблица уникальных строк.
+    unparsed — число записей с непустым P99999, из которого не получился ключ; unparsed_samples — примеры.
+    """
+    keys: np.ndarray
+    offsets: np.ndarray
+    codes: Dict[str, np.ndarray]
+    values: Dict[str, np.ndarray]
+    unparsed: int
+    unparsed_samples: List[str]
+
+def build_child_index(raw_keys: pd.Series, columns: Dict[str, pd.Series],
+                      keep: Optional[pd.Series] = None, distinct: bool = False) -> ChildIndex:
+    """
+    CSR-индекс строковых колонок columns по ключам raw_keys (см. integer_join_key).
+    keep — маска записей, попадающих в индекс; distinct=True оставляет из записей
+    с одинаковыми ключом и значениями только первую.
+    """
+    keys = integer_join_key(raw_keys)
+    valid = keys.notna().to_numpy()
+    bad = raw_keys[~valid]
+    bad = bad[bad.notna()].astype(str).str.strip()
+    bad = bad[bad != '']
+    if keep is not None:
+        valid = valid & keep.to_numpy()
+    key_values = keys.to_numpy(dtype=np.int64, na_value=0)[valid]
+    codes: Dict[str, np.ndarray] = {}
+    values: Dict[str, np.ndarray] = {}
+    for name, col in columns.items():
+        col_codes, uniques = pd.factorize(col.to_numpy(dtype=object)[valid])
+        codes[name] = col_codes.astype(np.int32)
+        values[name] = np.asarray(uniques, dtype=object)
+    if distinct:
+        first = ~pd.DataFrame({'KEY': key_values, **codes}).duplicated().to_numpy()
+        key_values = key_values[first]
+        codes = {name: col_codes[first] for name, col_codes in codes.items()}
+    order = np.argsort(key_values, kind='stable')
+    key_values = key_values[order]
+    unique_keys, starts = np.unique(key_values, return_index=True)
+    return ChildIndex(unique_keys, np.append(starts, len(key_values)).astype(np.int64),
+                      {name: col_codes[order] for name, col_codes in codes.items()}, values,
+                      len(bad), list(dict.fromkeys(bad.head(1000)))[:5])
+
+def child_ranges(index: ChildIndex, row_keys: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    # диапазоны [start, end) записей индекса для родительских ключей; нет ключа — пустой диапазон
+    keys = row_keys.to_numpy(dtype=np.int64, na_value=0)
+    pos = np.searchsorted(index.keys, keys)
+    known = row_keys.notna().to_numpy() & (pos < len(index.keys))
+    known[known] = index.keys[pos[known]] == keys[known]
+    pos = np.where(known, pos, 0)
+    start = np.where(known, index.offsets[pos], 0)
+    end = np.where(known, index.offsets[np.where(known, pos + 1, 0)], 0)
+    return start, end
+
+def child_index_values(index: ChildIndex, column: str, rows: np.ndarray, present: np.ndarray) -> np.ndarray:
+    # значения колонки индекса на позициях rows там, где present, иначе ''
+    result = np.full(len(rows), '', dtype=object)
+    if present.any():
+        result[present] = index.values[column][index.codes[column][rows[present]]]
+    return result
+
+def build_nkvd03_map(nkvd03_df: pd.DataFrame) -> ChildIndex:
+    """
+    Индекс NKVD03 по P99999: ST (см. build_st_zn_ch_columns) и PUN каждой дочерней записи.
+    Первые три записи ключа в порядке файла раскладываются в ST1..ST3_ZN_CH / P1..P3_PUNKT
+    (lookup_nkvd03_values).
+    """
+    sta, zna, cha, pun = (child_column(nkvd03_df, f) for f in ('STA', 'ZNA', 'CHA', 'PUN'))
+    pun = pun.where(pun.notna(), '')
+    pun = pun.where(pun.map(bool), '').astype(str)
+    return build_child_index(child_column(nkvd03_df, 'P99999'),
+                             {'ST': build_st_zn_ch_columns(sta, zna, cha), 'PUN': pun})
+
+def lookup_nkvd03_values(nkvd03_map: ChildIndex, row_keys: pd.Series) -> Dict[str, np.ndarray]:
+    # позиционный разворот по диапазонам ключей: i-я запись -> ST{i}_ZN_CH / P{i}_PUNKT, недостающие — ''
+    start, end = child_ranges(nkvd03_map, row_keys)
+    columns = {}
+    for pos, (st_field, pun_field) in enumerate(((F1, F2), (F3, F4), (F5, F6))):
+        present = end - start > pos
+        columns[st_field] = child_index_values(nkvd03_map, 'ST', start + pos, present)
+        columns[pun_field] = child_index_values(nkvd03_map, 'PUN', start + pos, present)
+    return columns
+
+def aggregate_child_values(child_df: pd.DataFrame,
+                           key_column: str,
+                           value_column: str,
+                           normalizer: Optional[str] = None) -> ChildIndex:
+    """
+    Индекс дочерней таблицы для групповой агрегации: по ключу — уникальные значения
+    в порядке первого появления (как join_unique_preserve_order), через разделитель
+    их склеивает lookup_child_values. Пустые значения отбрасываются; normalizer — имя
+    зарегистрированного маппера (см. VALUE_MAPPERS), он применяется один раз к каждому уникальному значению.
+    """
+    values = child_column(child_df, value_column)
+    values = values.where(values.notna(), '').astype(str).str.strip()
+    if normalizer is not None:
+        values = map_column_values(values, normalizer)
+        values = values.where(values.notna(), '').astype(str).str.strip()
+    return build_child_index(child_column(child_df, key_column), {'VAL': values},
+                             keep=values != '', distinct=True)
+
+def lookup_child_values(index: ChildIndex, row_keys: pd.Series, separator: str) -> np.ndarray:
+    # значения ключа через separator: одиночные берутся выборкой по кодам, склеиваются только группы
+    start, end = child_ranges(index, row_keys)
+    counts = end - start
+    result = child_index_values(index, 'VAL', start, counts == 1)
+    table, codes = index.values['VAL'], index.codes['VAL']
+    for i in np.flatnonzero(counts > 1):
+        result[i] = separator.join(table[codes[start[i]:end[i]]])
+    return result
+
+def resolve_child_column(child_df: pd.DataFrame, candidates: List[str]) -> str:
+    # первая из колонок-кандидатов, присутствующая в таблице (определяется один раз на таблицу)
+    for candidate in candidates:
+        if candidate in child_df.columns:
+            return candidate
+    return candidates[0]
+
+def build_nkvd04_multi(nkvd04_df: pd.DataFrame) -> ChildIndex:
+    return aggregate_child_values(nkvd04_df, 'P99999', 'SFE')
+
+def build_nkvd05_multi(nkvd05_df: pd.DataFrame) -> ChildIndex:
+    return aggregate_child_values(nkvd05_df, 'P99999', 'LIN', normalizer='LIN')
+
+def build_nkvd06_multi(nkvd06_df: pd.DataFrame) -> ChildIndex:
+    li2_column = resolve_child_column(nkvd06_df, LI2_CANDIDATES)
+    return aggregate_child_values(nkvd06_df, 'P99999', li2_column)
 
 # -----------------------------------------------------------
 def map_zav_primary(v) -> str:
-    if v is None or (isinstance(v, float) and pd.isna(v)):
+    if is_missing(v):
         digits = '01'
     else:
         digits = ''.join(re.findall(r'\d', str(v))).strip()
@@ -207,7 +1022,7 @@ def map_zav_primary(v) -> str:
     return '100'
 
 def map_poluch_iz(v) -> str:
-    if v is None or (isinstance(v, float) and pd.isna(v)):
+    if is_missing(v):
         digits = ''
     else:
         digits = ''.join(re.findall(r'\d', str(v))).strip()
@@ -288,13 +1103,12 @@ def should_include_ter_by_dc_date(dc_date: datetime.date) -> bool:
     """
     Возвращает True если TER следует добавлять в OLD-формате.
     Правило: если dc_date отсутствует -> True (поведение старое).
-            если dc_date < 2017-02-01 -> True (старое — добавляем TER).
-            если dc_date >= 2017-02-01 -> False (новый формат — не добавляем TER).
+            если dc_date < UGD_NEW_FORMAT_CUTOFF (2017-02-01) -> True (старое — добавляем TER).
+            если dc_date >= UGD_NEW_FORMAT_CUTOFF -> False (новый формат — не добавляем TER).
     """
     if dc_date is None:
         return True
-    cutoff = datetime.date(2017, 2, 1)
-    return dc_date < cutoff
+    return dc_date < UGD_NEW_FORMAT_CUTOFF
 
 def parse_date_from_dc_string(dc_str: str) -> datetime.date:
     """
@@ -317,8 +1131,8 @@ def parse_date_from_dc_string(dc_str: str) -> datetime.date:
 def build_ugd_merge_for_row_using_dc(row) -> str:
     """
     Новая логика UGD_MERGE:
-      - если DC >= 01.02.2017 => VD1 + GOD + KOD + UGD(6 digits zfilled)
-      - иначе (DC < 01.02.2017 или DC пустое) => UGD(5 digits zfilled) + TER (если TER есть; перед добавлением у TER удаляем первый '0' если есть)
+      - если DC >= UGD_NEW_FORMAT_CUTOFF (01.02.2017) => VD1 + GOD + KOD + UGD(6 digits zfilled)
+      - иначе (DC < UGD_NEW_FORMAT_CUTOFF или DC пустое) => UGD(5 digits zfilled) + TER (если TER есть; перед добавлением у TER удаляем первый '0' если есть)
     UGD берётся из поля 'UGD' (строка), обнуляется слева до 5 или 6 цифр в зависимости от ветки.
     Остальные компоненты (VD1,GOD,KOD) при новой ветке конкатенируются как строки без пробелов.
     """
@@ -333,7 +1147,7 @@ def build_ugd_merge_for_row_using_dc(row) -> str:
     dc_str = row.get('DC', '')
     dc_date = parse_date_from_dc_string(dc_str)
 
-    cutoff = datetime.date(2017, 2, 1)
+    cutoff = UGD_NEW_FORMAT_CUTOFF
     # если dc_date >= cutoff => новый формат (VD1+GOD+KOD+UGD(6))
     if dc_date is not None and dc_date >= cutoff:
         # format UGD to 6 digits (only digits kept)
@@ -358,9 +1172,51 @@ def build_ugd_merge_for_row_using_dc(row) -> str:
         merged = merged.replace(' ', '')
         return merged
 
+def dc_new_format_mask(dc: pd.Series, cutoff: Optional[datetime.date] = None) -> pd.Series:
+    """
+    Колоночный аналог parse_date_from_dc_string(DC) >= cutoff: True там, где DC —
+    корректная дата dd.mm.yyyy не раньше cutoff. Сравнение идёт по целым частям даты.
+    """
+    cutoff = cutoff or UGD_NEW_FORMAT_CUTOFF
+    s = dc.where(dc.notna(), '').astype(str).str.strip()
+    valid = s.str.fullmatch(r'\d{2}\.\d{2}\.\d{4}').fillna(False).astype(bool)
+    parts = s.where(valid, '01.01.0001')
+    day = parts.str.slice(0, 2).astype(int).to_numpy()
+    month = parts.str.slice(3, 5).astype(int).to_numpy()
+    year = parts.str.slice(6, 10).astype(int).to_numpy()
+    leap = ((year % 4 == 0) & (year % 100 != 0)) | (year % 400 == 0)
+    month_days = np.array([0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])[np.clip(month, 0, 12)]
+    month_days = month_days + ((month == 2) & leap)
+    is_date = (year >= 1) & (month >= 1) & (month <= 12) & (day >= 1) & (day <= month_days)
+    cutoff_key = cutoff.year * 10000 + cutoff.month * 100 + cutoff.day
+    return pd.Series(valid.to_numpy() & is_date & (year * 10000 + month * 100 + day >= cutoff_key),
+                     index=dc.index)
+
+def _ugd_part(v) -> str:
+    # как row.get(col, '') or '' в build_ugd_merge_for_row_using_dc, приведённое к строке
+    if not v:
+        return ''
+    return v if isinstance(v, str) else str(v)
+
+def build_ugd_merge_column(df: pd.DataFrame, cutoff: Optional[datetime.date] = None) -> pd.Series:
+    """
+    Колоночный вариант build_ugd_merge_for_row_using_dc:
+      - новый формат (DC >= cutoff): VD1 + GOD + KOD + UGD(6)
+      - старый формат: UGD(5) + TER без первого '0'
+    Пробелы из результата удаляются в обеих ветках.
+    """
+    vd1, god, kod, ugd, ter = (map_column_values(df[col], 'UGD_PART') for col in ugd_merge)
+    ugd_digits = ugd.str.replace(r'\D', '', regex=True)
+    has_ugd = ugd_digits != ''
+    new_format = vd1 + god + kod + ugd_digits.str.zfill(6).where(has_ugd, '')
+    ter = ter.where(ter.str.strip() != '', '').str.replace(r'^0', '', regex=True)
+    old_format = ugd_digits.str.zfill(5).where(has_ugd, '') + ter
+    merged = new_format.where(dc_new_format_mask(df['DC'], cutoff), old_format)
+    return merged.str.replace(' ', '', regex=False)
+
 # -----------------------------------------------------------
 def map_oss_field(v) -> str:
-    if v is None or (isinstance(v, float) and pd.isna(v)):
+    if is_missing(v):
         return ''
     s = str(v).strip()
     if s == '':
@@ -371,7 +1227,7 @@ def map_oss_field(v) -> str:
     return s
 
 def transform_kud(v) -> str:
-    if v is None or (isinstance(v, float) and pd.isna(v)):
+    if is_missing(v):
         return ''
     s = str(v).strip()
     if s == '':
@@ -382,204 +1238,2299 @@ def transform_kud(v) -> str:
     digits_padded = digits.zfill(3)
     return '11150' + digits_padded
 
+def map_ovd_field(v) -> str:
+    # на входе уже строка (fillna('').astype(str))
+    return '11150' + (v if v.strip() != '' else '000')
+
+def map_li0_field(v) -> str:
+    # LI0 transform: keep previous rules, but map '04' -> '0010'
+    s = ('' if is_missing(v) else str(v).strip()) or '13'
+    s = s.zfill(2)
+    if s == '03':
+        # previous special case: 03 -> 25
+        return '0025'
+    if s == '04':
+        # requested mapping: 04 -> 0010
+        return '0010'
+    return '00' + s
+
+def map_vid_ed(v) -> str:
+    return '00001' if str(v) == '0010' else ''
+
 # -----------------------------------------------------------
-def process_dataframe(df: pd.DataFrame,
-                      nkvd03_map: Dict[str, List[Dict[str, str]]],
-                      nkvd04_multi: Dict[str, List[str]],
-                      nkvd05_multi: Dict[str, List[str]],
-                      nkvd06_multi: Dict[str, List[str]]) -> pd.DataFrame:
-    # ROW_NUM
-    if 'ROW_NUM' not in df.columns:
-        df['ROW_NUM'] = range(1, len(df)+1)
+# Словарный слой для поэлементных мапперов: колонка факторизуется,
+# маппер вызывается один раз на уникальное значение, результат раскладывается по кодам.
+# Таблицы значений кэшируются на уровне процесса (между блоками и запусками в одном процессе).
+
+VALUE_MAPPERS: Dict[str, Callable[[object], str]] = {}
+VALUE_MAPPER_CACHES: Dict[str, dict] = {}
+VALUE_MAPPER_CACHE_LIMIT = 100000
+
+def register_value_mapper(name: str, func: Callable[[object], str]):
+    # функция регистрируется как есть: f(значение) -> строка
+    VALUE_MAPPERS[name] = func
+    VALUE_MAPPER_CACHES.pop(name, None)
+
+def _mapper_cache_key(v):
+    # NaN != NaN, а 1 == 1.0 == True: ключ учитывает тип, пустые значения — по типу
+    if v is None or (not isinstance(v, str) and pd.isna(v)):
+        return (type(v), None)
+    return (type(v), v)
+
+def map_column_values(values: pd.Series, name: str) -> pd.Series:
+    """
+    Применение зарегистрированного маппера к колонке через таблицу уникальных значений.
+    Результат совпадает с values.apply(маппер).
+    """
+    func = VALUE_MAPPERS[name]
+    cache = VALUE_MAPPER_CACHES.setdefault(name, {})
+    if len(cache) > VALUE_MAPPER_CACHE_LIMIT:
+        cache.clear()
 
-    # copy SNY
-    df['SNY'] = df.get('SNY', '').fillna('').astype(str)
+    def lookup(v):
+        key = _mapper_cache_key(v)
+        try:
+            return cache[key]
+        except KeyError:
+            result = cache[key] = func(v)
+            return result
+
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # категории ридера уже уникальны; NA в них — None, как в object-колонке
+        table = np.array([lookup(c) for c in values.cat.categories.tolist()] + [lookup(None)], dtype=object)
+        return pd.Series(table[values.cat.codes.to_numpy()], index=values.index, dtype=object)
+
+    if values.dtype == object and pd.api.types.infer_dtype(values, skipna=True) not in ('string', 'empty'):
+        # смешанные типы: factorize склеил бы 1 и 1.0, поэтому ищем по ключу с типом
+        return pd.Series([lookup(v) for v in values.tolist()], index=values.index, dtype=object)
+
+    codes, uniques = pd.factorize(values)
+    table = np.array([lookup(u) for u in uniques.tolist()] + [None], dtype=object)
+    result = table[codes]
+    na_positions = np.flatnonzero(codes == -1)
+    if len(na_positions):
+        raw = values.to_numpy(dtype=object)
+        for pos in na_positions:
+            result[pos] = lookup(raw[pos])
+    return pd.Series(result, index=values.index, dtype=object)
+
+register_value_mapper('OVD', map_ovd_field)
+register_value_mapper('LI0', map_li0_field)
+register_value_mapper('VID_ED', map_vid_ed)
+register_value_mapper('ZAV', map_zav_primary)
+register_value_mapper('POLUCH_IZ', map_poluch_iz)
+register_value_mapper('OSS', map_oss_field)
+register_value_mapper('KUD', transform_kud)
+register_value_mapper('LIN', normalize_lin_value)
+register_value_mapper('UGD_PART', _ugd_part)
 
-    # OVD
-    if 'OVD' in df.columns:
-        df['OVD'] = df['OVD'].fillna('').astype(str)
-        df['OVD'] = df['OVD'].apply(lambda v: '11150' + (v if v.strip() != '' else '000'))
+# -----------------------------------------------------------
+# Этапы конвейера: точки, в которые можно подключить замеры (бенчмарки, профайлер).
+# Хук — фабрика контекстных менеджеров hook(stage); stage — dict с 'name' и 'rows',
+# 'rows' может быть уточнён внутри этапа.
+STAGE_HOOKS: List[Callable[[dict], ContextManager]] = []
+
+@contextlib.contextmanager
+def pipeline_stage(name: str, rows: int = 0) -> Iterator[dict]:
+    stage = {'name': name, 'rows': rows}
+    if not STAGE_HOOKS:
+        yield stage
+        return
+    with contextlib.ExitStack() as stack:
+        for hook in list(STAGE_HOOKS):
+            stack.enter_context(hook(stage))
+        yield stage
+
+def max_rss_bytes() -> int:
+    # пиковый RSS процесса; ru_maxrss — килобайты в Linux, байты в macOS
+    if resource is None:
+        return 0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+def stage_metrics_hook(stats: Dict[str, dict], trace_memory: bool = False) -> Callable[[dict], ContextManager]:
+    """
+    Хук для STAGE_HOOKS: накапливает по имени этапа время (wall/CPU), число строк
+    и вызовов, пиковый RSS процесса на выходе из этапа и, если tracemalloc запущен
+    и trace_memory=True, пик выделенной Python-памяти внутри этапа.
+    """
+    @contextlib.contextmanager
+    def hook(stage: dict):
+        tracing = trace_memory and tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+            traced_before, _ = tracemalloc.get_traced_memory()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            entry = stats.setdefault(stage['name'], {'seconds': 0.0, 'cpu_seconds': 0.0, 'rows': 0, 'calls': 0,
+                                                     'max_rss_bytes': 0, 'tracemalloc_peak_bytes': 0})
+            entry['seconds'] += time.perf_counter() - wall_start
+            entry['cpu_seconds'] += time.process_time() - cpu_start
+            entry['rows'] += stage['rows']
+            entry['calls'] += 1
+            entry['max_rss_bytes'] = max(entry['max_rss_bytes'], max_rss_bytes())
+            if tracing:
+                _, peak = tracemalloc.get_traced_memory()
+                entry['tracemalloc_peak_bytes'] = max(entry['tracemalloc_peak_bytes'], peak - traced_before)
+    return hook
+
+def finish_stage_metrics(stats: Dict[str, dict]) -> Dict[str, dict]:
+    for entry in stats.values():
+        entry['rows_per_sec'] = entry['rows'] / entry['seconds'] if entry['seconds'] > 0 else 0.0
+    return stats
+
+def append_metrics(path: str, record: dict):
+    # JSONL: одна строка на запуск, файл только дописывается
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+@contextlib.contextmanager
+def run_instrumentation(metrics_path: Optional[str], profile_path: Optional[str] = None,
+                        trace_memory: bool = False, mode: str = '') -> Iterator[Dict[str, dict]]:
+    """
+    Замеры всего запуска: этапы через STAGE_HOOKS в metrics_path (JSONL),
+    cProfile всего запуска в profile_path (формат pstats).
+    Этапы, выполняемые в дочерних процессах (--workers, --batch), в метрики не попадают.
+    """
+    stats: Dict[str, dict] = {}
+    if not metrics_path and not profile_path:
+        yield stats
+        return
+    hook = stage_metrics_hook(stats, trace_memory)
+    profiler = cProfile.Profile() if profile_path else None
+    started_tracing = trace_memory and not tracemalloc.is_tracing()
+    if metrics_path:
+        STAGE_HOOKS.append(hook)
+    if started_tracing:
+        tracemalloc.start()
+    started_at = datetime.datetime.now().isoformat(timespec='seconds')
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    status = 'failed'
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield stats
+        status = 'ok'
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile_path)
+        if started_tracing:
+            tracemalloc.stop()
+        if metrics_path:
+            STAGE_HOOKS.remove(hook)
+            append_metrics(metrics_path, {
+                'started_at': started_at,
+                'mode': mode,
+                'status': status,
+                'cwd': os.getcwd(),
+                'seconds': time.perf_counter() - wall_start,
+                'cpu_seconds': time.process_time() - cpu_start,
+                'max_rss_bytes': max_rss_bytes(),
+                'stages': finish_stage_metrics(stats),
+            })
 
-    # LI0 transform: keep previous rules, but map '04' -> '0010'
-    if 'LI0' in df.columns:
-        def li0_transform(v):
-            s = ('' if pd.isna(v) else str(v).strip()) or '13'
-            s = s.zfill(2)
-            if s == '03':
-                # previous special case: 03 -> 25
-                return '0025'
-            if s == '04':
-                # requested mapping: 04 -> 0010
-                return '0010'
-            return '00' + s
-        df['LI0'] = df['LI0'].apply(li0_transform)
-    else:
-        df['LI0'] = ''
-
-    # VID_ED
-    df['VID_ED'] = df['LI0'].apply(lambda v: '00001' if str(v) == '0010' else '')
-
-    # Dates: DB, DA, DI, DC
-    for new_field, parts in DATE_GROUPS.items():
-        df[new_field] = df.apply(lambda row, p=parts: combine_date_parts(p, row), axis=1)
-
-    # ensure ugd_merge cols exist
-    for col in ugd_merge:
-        if col not in df.columns:
-            df[col] = ''
-
-    # build UGD_MERGE using new logic (depends on DC string)
-    df['UGD_MERGE'] = df.apply(build_ugd_merge_for_row_using_dc, axis=1)
-
-    # ST*/PUNKT new fields
-    df[F1] = ''
-    df[F2] = ''
-    df[F3] = ''
-    df[F4] = ''
-    df[F5] = ''
-    df[F6] = ''
-
-    # ZAV and POLUCH_IZ (restored)
-    src_zav_col = 'ZAV' if 'ZAV' in df.columns else None
-    if src_zav_col:
-        orig_zav = df[src_zav_col].copy()
-    else:
-        orig_zav = pd.Series([None] * len(df), index=df.index)
-    df['ZAV'] = orig_zav.apply(map_zav_primary)
-    df['POLUCH_IZ'] = orig_zav.apply(map_poluch_iz)
-
-    # fill ST*/PUNKT from nkvd03_map
-    for idx, row in df.iterrows():
-        key = str(row['ROW_NUM'])
-        entries = nkvd03_map.get(key, [])
-        for i in range(3):
-            if i < len(entries):
-                ent = entries[i]
-                st_zn_ch = build_st_zn_ch(ent['STA'], ent['ZNA'], ent['CHA'])
-                punkt = ent['PUN'] if ent['PUN'] else ''
-                if i == 0:
-                    df.at[idx, F1] = st_zn_ch
-                    df.at[idx, F2] = punkt
-                elif i == 1:
-                    df.at[idx, F3] = st_zn_ch
-                    df.at[idx, F4] = punkt
-                elif i == 2:
-                    df.at[idx, F5] = st_zn_ch
-                    df.at[idx, F6] = punkt
-
-    # SFE from nkvd04_multi
-    def get_sfe_for_row(row):
-        key = str(row.get('ROW_NUM', '')).strip()
-        sfe_list = nkvd04_multi.get(key, [])
-        if not sfe_list:
-            return ''
-        return join_unique_preserve_order(sfe_list, SFE_SEPARATOR)
-    df['SFE'] = df.apply(get_sfe_for_row, axis=1)
-
-    # LIN from nkvd05_multi with new normalization
-    def get_lin_for_row(row):
-        key = str(row.get('ROW_NUM', '')).strip()
-        lin_list = nkvd05_multi.get(key, [])
-        if not lin_list:
-            return ''
-        normalized = [normalize_lin_value(x) for x in lin_list if str(x).strip() != '']
-        normalized = [x for x in normalized if x != '']
-        if not normalized:
-            return ''
-        return join_unique_preserve_order(normalized, LIN_SEPARATOR)
-    df['LIN'] = df.apply(get_lin_for_row, axis=1)
-
-    # LI2 from nkvd06_multi
-    def get_li2_for_row(row):
-        key = str(row.get('ROW_NUM', '')).strip()
-        li2_list = nkvd06_multi.get(key, [])
-        if not li2_list:
-            return ''
-        return join_unique_preserve_order(li2_list, LI2_SEPARATOR)
-    df['LI2'] = df.apply(get_li2_for_row, axis=1)
-
-    # DD and SN from respective triples
-    df['DD'] = df.apply(lambda row: combine_date_parts(['DD1','DD2','DD3'], row), axis=1)
-    df['SN'] = df.apply(lambda row: combine_date_parts(['SN1','SN2','SN3'], row), axis=1)
-
-    # OSS, KUD, ARX, DR, FAI, DOP, RE, RE2 (unchanged behavior)
-    df['OSS'] = df.get('OSS', '').apply(lambda v: map_oss_field(v) if v is not None else '')
-    df['KUD'] = df.get('KUD', '').apply(lambda v: transform_kud(v) if v is not None else '')
-    df['ARX'] = df.get('ARX', '').fillna('').astype(str)
-    df['DR'] = df.apply(lambda row: combine_date_parts(['DR1','DR2','DR3'], row), axis=1)
-    df['FAI'] = df.get('FAI', '').fillna('').astype(str)
-    df['DOP'] = df.get('DOP', '').fillna('').astype(str)
-    df['RE'] = df.apply(lambda row: combine_date_parts(['RE1','RE2','RE3'], row), axis=1)
-    df['RE2'] = df.apply(lambda row: combine_date_parts(['RE1','RE2','RE3'], row), axis=1)
+# -----------------------------------------------------------
+# Совмещение ввода-вывода с вычислениями: независимые чтения и построение индексов
+# идут в пуле потоков, преобразование, кодирование и запись вывода связаны
+# ограниченными очередями. IO_THREADS = 1 — всё последовательно, как раньше
+# (по умолчанию на машине с одним ядром: там потоки только увеличивают пик памяти).
+IO_THREADS = min(5, os.cpu_count() or 1)
+PIPELINE_QUEUE_DEPTH = 2
+WRITE_QUEUE_BLOCKS = 4
+
+def run_concurrently(tasks: List[Callable[[], object]]) -> list:
+    # независимые задачи в пуле из IO_THREADS потоков; результаты в порядке задач
+    if IO_THREADS <= 1 or len(tasks) <= 1:
+        return [task() for task in tasks]
+    load_columnar_modules()
+    with ThreadPoolExecutor(max_workers=min(IO_THREADS, len(tasks))) as pool:
+        futures = [pool.submit(task) for task in tasks]
+        return [future.result() for future in futures]
+
+def prefetch(items: Iterable, depth: int = PIPELINE_QUEUE_DEPTH) -> Iterator:
+    """
+    Ограниченная очередь производитель/потребитель: items вычисляются в фоновом потоке
+    не более чем на depth элементов вперёд. Ошибка производителя пробрасывается потребителю,
+    при остановке потребителя производитель тоже останавливается.
+    """
+    if IO_THREADS <= 1:
+        yield from items
+        return
+    load_columnar_modules()
+    q: queue.Queue = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    done = object()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put((item, None)):
+                    return
+            put((done, None))
+        except BaseException as e:
+            put((done, e))
+
+    thread = threading.Thread(target=produce, name='prefetch', daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = q.get()
+            if error is not None:
+                raise error
+            if item is done:
+                return
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+@contextlib.contextmanager
+def queued_writer(fh, depth: int = WRITE_QUEUE_BLOCKS) -> Iterator[Callable[[bytes], None]]:
+    """
+    Запись блоков в fh из фонового потока: кодирование следующего блока идёт,
+    пока пишется предыдущий. Ошибка записи пробрасывается при следующем блоке или на выходе.
+    """
+    if IO_THREADS <= 1:
+        yield fh.write
+        return
+    q: queue.Queue = queue.Queue(maxsize=depth)
+    errors: List[BaseException] = []
+
+    def drain():
+        while True:
+            block = q.get()
+            if block is None:
+                return
+            if not errors:
+                try:
+                    fh.write(block)
+                except BaseException as e:
+                    errors.append(e)
+
+    thread = threading.Thread(target=drain, name='dbf-writer', daemon=True)
+    thread.start()
+
+    def write(block: bytes):
+        if errors:
+            raise errors[0]
+        q.put(block)
+
+    try:
+        yield write
+    finally:
+        q.put(None)
+        thread.join()
+    if errors:
+        raise errors[0]
+
+# -----------------------------------------------------------
+def process_dataframe(df: pd.DataFrame,
+                      nkvd03_map: ChildIndex,
+                      nkvd04_multi: ChildIndex,
+                      nkvd05_multi: ChildIndex,
+                      nkvd06_multi: ChildIndex,
+                      row_offset: int = 0,
+                      passthrough: Iterable[str] = ()) -> pd.DataFrame:
+    """
+    passthrough — колонки, прочитанные сырыми байтами (в df — номера строк
+    матрицы байт); они не преобразуются и уходят в writer как есть.
+    """
+    passthrough = set(passthrough)
+    rows = len(df)
+    # ROW_NUM (row_offset — номер первой строки блока при потоковой обработке)
+    if 'ROW_NUM' not in df.columns:
+        df['ROW_NUM'] = range(row_offset + 1, row_offset + len(df) + 1)
+
+    with pipeline_stage('transform:codes', rows):
+        # copy SNY
+        if 'SNY' not in passthrough:
+            df['SNY'] = plain_column(df.get('SNY', '')).fillna('').astype(str)
+
+        # OVD
+        if 'OVD' in df.columns:
+            df['OVD'] = map_column_values(plain_column(df['OVD']).fillna('').astype(str), 'OVD')
+
+        # LI0 transform
+        if 'LI0' in df.columns:
+            df['LI0'] = map_column_values(df['LI0'], 'LI0')
+        else:
+            df['LI0'] = ''
+
+        # VID_ED
+        df['VID_ED'] = map_column_values(df['LI0'], 'VID_ED')
+
+    with pipeline_stage('transform:dates', rows):
+        # Dates: DB, DA, DI, DC
+        for new_field, parts in DATE_GROUPS.items():
+            df[new_field] = combine_date_columns(df, parts)
+
+    with pipeline_stage('transform:ugd_merge', rows):
+        # ensure ugd_merge cols exist
+        for col in ugd_merge:
+            if col not in df.columns:
+                df[col] = ''
+
+        # build UGD_MERGE using new logic (depends on DC string)
+        df['UGD_MERGE'] = build_ugd_merge_column(df)
+
+    with pipeline_stage('transform:zav', rows):
+        # ZAV and POLUCH_IZ (restored)
+        src_zav_col = 'ZAV' if 'ZAV' in df.columns else None
+        if src_zav_col:
+            orig_zav = df[src_zav_col].copy()
+        else:
+            orig_zav = pd.Series([None] * len(df), index=df.index)
+        df['ZAV'] = map_column_values(orig_zav, 'ZAV')
+        df['POLUCH_IZ'] = map_column_values(orig_zav, 'POLUCH_IZ')
+
+    with pipeline_stage('transform:nkvd03_join', rows):
+        # ST*/PUNKT: диапазоны записей NKVD03 по целочисленному ключу ROW_NUM <-> P99999
+        row_keys = integer_join_key(plain_column(df['ROW_NUM']))
+        for field, values in lookup_nkvd03_values(nkvd03_map, row_keys).items():
+            df[field] = values
+
+    with pipeline_stage('transform:child_joins', rows):
+        # SFE, LIN, LI2: готовые агрегаты дочерних таблиц по ключу ROW_NUM
+        df['SFE'] = lookup_child_values(nkvd04_multi, row_keys, SFE_SEPARATOR)
+        df['LIN'] = lookup_child_values(nkvd05_multi, row_keys, LIN_SEPARATOR)
+        df['LI2'] = lookup_child_values(nkvd06_multi, row_keys, LI2_SEPARATOR)
+
+    with pipeline_stage('transform:extra_dates', rows):
+        # DD, SN, DR, RE from respective triples
+        for new_field, parts in EXTRA_DATE_GROUPS.items():
+            df[new_field] = combine_date_columns(df, parts)
+        # RE2 собирается из той же тройки RE1/RE2/RE3
+        df['RE2'] = df['RE'].copy()
+
+    with pipeline_stage('transform:oss_kud', rows):
+        # OSS, KUD, ARX, FAI, DOP (unchanged behavior)
+        df['OSS'] = map_column_values(df.get('OSS', ''), 'OSS')
+        df['KUD'] = map_column_values(df.get('KUD', ''), 'KUD')
+        for col in ('ARX', 'FAI', 'DOP'):
+            if col not in passthrough:
+                df[col] = plain_column(df.get(col, '')).fillna('').astype(str)
 
     return df
 
 # -----------------------------------------------------------
-def write_dbf(df: pd.DataFrame, path: str, encoding: str = ENCODING_OUT):
+# Схема выходного DBF: все поля — C, ширина каждого поля задаётся заранее
+# из ширин исходных полей NKVD01/03..06 и того, насколько их удлиняет преобразование;
+# для агрегатов SFE/LIN/LI2 — ещё из числа значений у ключа в индексах дочерних таблиц.
+# Индексы строятся до записи NKVD01, поэтому заголовок пишется до записей.
+# Значения длиннее поля не расширяют его: см. OUTPUT_OVERFLOW.
+
+DBF_MIN_CHAR_WIDTH = 10
+DBF_MAX_CHAR_WIDTH = 255
+DATE_TEXT_WIDTH = len('dd.mm.yyyy')
+
+# 'error' — прервать запись с отчётом о не поместившихся значениях,
+# 'truncate' — обрезать их до ширины поля и вывести отчёт в конце записи
+OUTPUT_OVERFLOW = 'error'
+
+def multi_value_width(item_width: int, items: int, separator: str) -> int:
+    return items * item_width + max(items - 1, 0) * len(separator)
+
+# Ширина выходного поля как функция w(имя) -> ширина текста исходного поля
+# (0, если поля нет). Поля дочерних таблиц адресуются как 'NKVD03.STA';
+# 'ITEMS.SFE' и т.п. — наибольшее число значений агрегата у одного ключа (см. multi_value_counts).
+OUTPUT_SCHEMA: Dict[str, Callable[[Callable[[str], int]], int]] = {
+    'ROW_NUM': lambda w: w('ROW_NUM'),
+    'OVD': lambda w: len('11150') + max(w('OVD'), 3),
+    'LI0': lambda w: len('00') + max(w('LI0'), 2),
+    'VID': lambda w: w('VID'),
+    'NOM': lambda w: w('NOM'),
+    'DB': lambda w: DATE_TEXT_WIDTH,
+    'DA': lambda w: DATE_TEXT_WIDTH,
+    'DI': lambda w: DATE_TEXT_WIDTH,
+    'FAB': lambda w: w('FAB'),
+    'ZAV': lambda w: 3,
+    'POLUCH_IZ': lambda w: 3,
+    F1: lambda w: w('NKVD03.STA') + 1 + max(w('NKVD03.ZNA'), 1) + w('NKVD03.CHA'),
+    F2: lambda w: w('NKVD03.PUN'),
+    F3: lambda w: w('NKVD03.STA') + 1 + max(w('NKVD03.ZNA'), 1) + w('NKVD03.CHA'),
+    F4: lambda w: w('NKVD03.PUN'),
+    F5: lambda w: w('NKVD03.STA') + 1 + max(w('NKVD03.ZNA'), 1) + w('NKVD03.CHA'),
+    F6: lambda w: w('NKVD03.PUN'),
+    'SFE': lambda w: multi_value_width(w('NKVD04.SFE'), w('ITEMS.SFE'), SFE_SEPARATOR),
+    # нормализованный LIN — цифры исходного значения или двузначная замена
+    'LIN': lambda w: multi_value_width(max(w('NKVD05.LIN'), 2), w('ITEMS.LIN'), LIN_SEPARATOR),
+    'LI2': lambda w: multi_value_width(w('NKVD06.LI2'), w('ITEMS.LI2'), LI2_SEPARATOR),
+    'SNY': lambda w: w('SNY'),
+    'DD': lambda w: DATE_TEXT_WIDTH,
+    'SN': lambda w: DATE_TEXT_WIDTH,
+    'VID_ED': lambda w: 5,
+    # максимум из нового (VD1+GOD+KOD+UGD(6)) и старого (UGD(5)+TER) формата
+    'UGD_MERGE': lambda w: max(w('VD1') + w('GOD') + w('KOD') + max(w('UGD'), 6),
+                               max(w('UGD'), 5) + w('TER')),
+    'DC': lambda w: DATE_TEXT_WIDTH,
+    'OSS': lambda w: max(w('OSS'), 2),
+    'KUD': lambda w: len('11150') + max(w('KUD'), 3),
+    'ARX': lambda w: w('ARX'),
+    'DR': lambda w: DATE_TEXT_WIDTH,
+    'FAI': lambda w: w('FAI'),
+    'DOP': lambda w: w('DOP'),
+    'RE': lambda w: DATE_TEXT_WIDTH,
+    'RE2': lambda w: DATE_TEXT_WIDTH,
+}
+
+def source_text_width(field: DbfField) -> int:
+    """
+    Наибольшая длина str() значения исходного поля в том виде, в каком его отдаёт ридер.
+    Числовое поле с пустыми значениями читается как float, отсюда запас на '.0'.
+    """
+    if field.type == 'C':
+        return field.length
+    if field.type in ('N', 'F'):
+        return field.length + 2
+    if field.type == 'D':
+        return len('yyyy-mm-dd')
+    if field.type == 'L':
+        return len('False')
+    return DBF_MAX_CHAR_WIDTH
+
+def read_dbf_file_header(path: str, encoding: str = ENCODING_IN) -> Optional[DbfHeader]:
+    # только заголовок и дескрипторы полей, без чтения записей
+    with open(path, 'rb') as fh:
+        head = fh.read(32)
+        if len(head) < 32:
+            return None
+        header_length = struct.unpack('<H', head[8:10])[0]
+        head += fh.read(max(header_length - len(head), 0))
+    return read_dbf_header(head, encoding)
+
+def header_text_widths(header: Optional[DbfHeader], prefix: str = '') -> Dict[str, int]:
+    if header is None:
+        return {}
+    return {prefix + f.name: source_text_width(f) for f in header.fields}
+
+def output_field_specs(source_widths: Dict[str, int]) -> List[Tuple[str, int]]:
+    """
+    Ширины всех полей columns_to_keep по схеме OUTPUT_SCHEMA,
+    в пределах DBF_MIN_CHAR_WIDTH..DBF_MAX_CHAR_WIDTH.
+    """
+    def w(name: str) -> int:
+        return source_widths.get(name, 0)
+    specs = []
+    for name in columns_to_keep:
+        width = OUTPUT_SCHEMA[name](w)
+        specs.append((name, min(max(width, DBF_MIN_CHAR_WIDTH), DBF_MAX_CHAR_WIDTH)))
+    return specs
+
+def multi_value_counts(child_indexes: Tuple[ChildIndex, ...]) -> Dict[str, int]:
+    # наибольшее число значений SFE/LIN/LI2 у одного ключа — размер самой большой группы индекса
+    _, nkvd04, nkvd05, nkvd06 = child_indexes
+    return {name: int(np.diff(index.offsets).max()) if len(index.keys) else 0
+            for name, index in (('SFE', nkvd04), ('LIN', nkvd05), ('LI2', nkvd06))}
+
+def archive_output_schema(paths: ArchivePaths, items: Dict[str, int]) -> List[Tuple[str, int]]:
+    """
+    Схема выходного DBF архива по заголовкам его входных файлов. Ширина SFE/LIN/LI2
+    рассчитана на items[поле] значений (см. multi_value_counts), но не больше DBF_MAX_CHAR_WIDTH.
+    Для NKVD06 берётся та же колонка значений, что и в build_nkvd06_multi.
+    """
+    widths = header_text_widths(read_dbf_file_header(paths.nkvd01))
+    widths.update({f'ITEMS.{name}': count for name, count in items.items()})
+    for label, path in (('NKVD03', paths.nkvd03), ('NKVD04', paths.nkvd04), ('NKVD05', paths.nkvd05)):
+        widths.update(header_text_widths(read_dbf_file_header(path), label + '.'))
+    nkvd06_header = read_dbf_file_header(paths.nkvd06)
+    nkvd06_widths = header_text_widths(nkvd06_header)
+    li2_column = next((c for c in LI2_CANDIDATES if c in nkvd06_widths), 'LI2')
+    widths['NKVD06.LI2'] = nkvd06_widths.get(li2_column, 0)
+    return output_field_specs(widths)
+
+def frame_field_specs(df: pd.DataFrame, schema: List[Tuple[str, int]]) -> List[Tuple[str, int]]:
+    # поля схемы для колонок df в их порядке
+    widths = dict(schema)
+    missing = [str(c) for c in df.columns if c not in widths]
+    if missing:
+        raise ValueError(f"Колонок нет в схеме выходного DBF: {missing}")
+    return [(str(c), widths[c]) for c in df.columns]
+
+def report_overflow(name: str, width: int, row_nums: list, lengths: list,
+                    overflows: Optional[Dict[str, dict]]):
+    """
+    Учёт значений, не поместившихся в поле name C(width): row_nums — ROW_NUM
+    этих записей, lengths — длины значений.
+    Без overflows (режим 'error') — ValueError с описанием, иначе сведения копятся в overflows.
+    """
+    longest = int(max(lengths))
+    if overflows is None:
+        raise ValueError(f"Значения не помещаются в поле {name} C({width}): {len(row_nums)} записей, "
+                         f"длина до {longest}, ROW_NUM {[str(r) for r in row_nums[:5]]}")
+    entry = overflows.setdefault(name, {'width': width, 'count': 0, 'max_length': 0, 'rows': []})
+    entry['count'] += len(row_nums)
+    entry['max_length'] = max(entry['max_length'], longest)
+    entry['rows'] += [str(r) for r in row_nums[:10 - len(entry['rows'])]]
+
+def print_overflow_report(overflows: Optional[Dict[str, dict]]):
+    for name, entry in (overflows or {}).items():
+        print(f"[warn] Поле {name} C({entry['width']}): обрезано {entry['count']} значений "
+              f"длиной до {entry['max_length']}, ROW_NUM {', '.join(entry['rows'])}")
+
+def new_overflow_report() -> Optional[Dict[str, dict]]:
+    return {} if OUTPUT_OVERFLOW == 'truncate' else None
+
+def merge_overflow_report(overflows: Optional[Dict[str, dict]], part: Optional[Dict[str, dict]]):
+    # сведения об обрезке блока, закодированного отдельно (рабочим процессом convert_parallel)
+    if overflows is None:
+        return
+    for name, entry in (part or {}).items():
+        total = overflows.setdefault(name, {'width': entry['width'], 'count': 0, 'max_length': 0, 'rows': []})
+        total['count'] += entry['count']
+        total['max_length'] = max(total['max_length'], entry['max_length'])
+        total['rows'] += entry['rows'][:10 - len(total['rows'])]
+
+# -----------------------------------------------------------
+# Байт языкового драйвера в заголовке DBF (как его пишет библиотека dbf)
+DBF_LANGUAGE_DRIVERS = {
+    'cp866': 0x26,
+    'cp1251': 0xC9,
+}
+# Другие байты тех же кодировок, которые встречаются во входных файлах (0x65 — Russian MS-DOS)
+DBF_LANGUAGE_DRIVER_ALIASES = {
+    0x65: 'cp866',
+}
+WRITE_CHUNK_ROWS = 65536
+# Размер блока преобразования в convert_in_memory (блоки преобразуются, пока пишутся предыдущие)
+TRANSFORM_BLOCK_ROWS = 4 * WRITE_CHUNK_ROWS
+
+def dbf_char_field_specs(df: pd.DataFrame, raw_text: Optional[Dict[str, np.ndarray]] = None
+                         ) -> List[Tuple[str, int]]:
+    # ширина C-поля: максимальная длина str(значения), но не меньше 10
+    raw_text = raw_text or {}
     field_specs = []
     for col in df.columns:
-        max_len = df[col].astype(str).map(len).max()
+        if col in raw_text:
+            # сырые значения не обрезаны, поэтому все имеют длину исходного поля
+            max_len = raw_text[col].shape[1] if len(df) else None
+        else:
+            max_len = df[col].astype(str).map(len).max()
         try:
             max_len = int(max_len)
         except:
             max_len = 10
         max_len = max(max_len, 10)
-        spec = f"{col} C({max_len})"
-        field_specs.append(spec)
-    spec = ';'.join(field_specs)
+        field_specs.append((str(col), max_len))
+    return field_specs
 
-    table = dbf.Table(path, spec, codepage=encoding)
-    table.open(dbf.READ_WRITE)
+def build_dbf_header(field_specs: List[Tuple[str, int]], record_count: int,
+                     encoding: str = ENCODING_OUT) -> bytes:
+    """
+    Заголовок dBase III (без memo) для набора C-полей, байт в байт как у dbf.Table.
+    """
+    today = datetime.date.today()
+    header_length = 32 + 32 * len(field_specs) + 1
+    record_length = 1 + sum(width for _, width in field_specs)
+    out = bytearray(struct.pack('<BBBBIHH', 0x03, today.year - 1900, today.month, today.day,
+                                record_count, header_length, record_length))
+    out += bytes(17)
+    out.append(DBF_LANGUAGE_DRIVERS[encoding])
+    out += bytes(2)
+    offset = 1
+    for name, width in field_specs:
+        name = name.upper()
+        if not 1 <= len(name) <= 10:
+            raise ValueError(f"Недопустимое имя поля DBF: {name!r}")
+        if not 1 <= width <= 255:
+            raise ValueError(f"Ширина C-поля {name} должна быть от 1 до 255, а не {width}")
+        out += name.encode('ascii').ljust(11, b'\x00')
+        out += b'C' + struct.pack('<IBB', offset, width, 0) + bytes(14)
+        offset += width
+    out.append(0x0D)
+    return bytes(out)
+
+@lru_cache(maxsize=None)
+def byte_translation(source: str, target: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Таблица перекодировки однобайтовых кодировок source -> target (256 байт),
+    маска байт, у символа которых есть соответствие в target, и маска пробельных
+    символов (в смысле str.isspace, как их срезает str.strip()).
+    """
+    table = np.zeros(256, dtype=np.uint8)
+    mappable = np.zeros(256, dtype=bool)
+    space = np.zeros(256, dtype=bool)
+    for b in range(256):
+        ch = bytes([b]).decode(source, errors='replace')
+        space[b] = ch.isspace()
+        try:
+            encoded = ch.encode(target)
+        except UnicodeEncodeError:
+            continue
+        if ch != '\ufffd' and len(encoded) == 1:
+            table[b] = encoded[0]
+            mappable[b] = True
+    return table, mappable, space
 
+def transcode_text_block(block: np.ndarray, width: int, source: str, target: str) -> Optional[np.ndarray]:
+    """
+    Сырые значения C-поля (n x length, кодировка source) -> (n x width) в target:
+    то же, что decode + strip() + ljust(width) + encode, но без str-объектов.
+    Несопоставимые символы не заменяются: если они есть, возвращается None и колонка
+    кодируется через str, с той же ошибкой кодировки, что и для прочих колонок.
+    """
+    table, mappable, space = byte_translation(source, target)
+    if not mappable[block].all():
+        return None
+    n, length = block.shape
+    out = np.full((n, width), 0x20, dtype=np.uint8)
+    if n == 0 or length == 0:
+        return out
+    keep = ~space[block]
+    has_text = keep.any(axis=1)
+    first = np.where(has_text, keep.argmax(axis=1), 0)
+    last = np.where(has_text, length - keep[:, ::-1].argmax(axis=1), 0)
+    translated = table[block]
+    positions = np.arange(length)
+    if first.any():
+        # сдвиг влево на число ведущих пробелов
+        positions = first[:, None] + positions
+        translated = np.take_along_axis(translated, np.minimum(positions, length - 1), axis=1)
+    out[:, :length] = np.where(positions < last[:, None], translated, 0x20)
+    return out
+
+def decode_passthrough(df: pd.DataFrame, raw_text: Dict[str, np.ndarray],
+                       encoding: str = ENCODING_IN) -> pd.DataFrame:
+    # сырые колонки -> обычные str-колонки (для writer'ов, которым нужны значения)
+    df = df.copy()
+    for name, block in raw_text.items():
+        if name in df.columns:
+            values = block[df[name].to_numpy()]
+            df[name] = decode_char_column(values.tobytes(), values.shape[1], encoding) if len(df) else []
+    return df
+
+def encode_dbf_records(df: pd.DataFrame, field_specs: List[Tuple[str, int]],
+                       encoding: str = ENCODING_OUT,
+                       raw_text: Optional[Dict[str, np.ndarray]] = None,
+                       overflows: Optional[Dict[str, dict]] = None) -> bytes:
+    """
+    Кодирование блока строк в записи фиксированной ширины.
+    Значения приводятся так же, как при table.append: NaN -> '', str(), strip(),
+    затем каждая колонка целиком дополняется пробелами и кодируется одним вызовом.
+    Категориальные колонки ридера пишутся как обычные (plain_column).
+    Колонки из raw_text перекодируются из ENCODING_IN побайтно (transcode_text_block).
+    Значения длиннее поля передаются в report_overflow (ошибка или обрезка, см. OUTPUT_OVERFLOW).
+    """
+    raw_text = raw_text or {}
+    n = len(df)
+    record_length = 1 + sum(width for _, width in field_specs)
+    records = np.full((n, record_length), 0x20, dtype=np.uint8)
+    offset = 1
+    for name, width in field_specs:
+        col = plain_column(df[name])
+        if name in raw_text:
+            values = raw_text[name][col.to_numpy()]
+            block = transcode_text_block(values, width, ENCODING_IN, encoding)
+            if block is not None:
+                records[:, offset:offset + width] = block
+                offset += width
+                continue
+            col = pd.Series(decode_char_column(values.tobytes(), values.shape[1], ENCODING_IN) if n else [],
+                            index=col.index, dtype=object)
+        text = col.where(col.notna(), '').astype(str).str.strip()
+        if n:
+            lengths = text.str.len().to_numpy()
+            too_long = lengths > width
+            if too_long.any():
+                positions = np.flatnonzero(too_long)
+                if 'ROW_NUM' in df.columns:
+                    row_nums = df['ROW_NUM'].to_numpy()[positions]
+                else:
+                    row_nums = df.index.to_numpy()[positions] + 1
+                report_overflow(name, width, list(row_nums), list(lengths[positions]), overflows)
+                text = text.str.slice(0, width)
+        text = text.str.ljust(width)
+        if n:
+            # cp1251 однобайтовая: длина в символах совпадает с длиной в байтах
+            block = ''.join(text.tolist()).encode(encoding)
+            if len(block) != n * width:
+                raise ValueError(f"Значение не помещается в поле {name} C({width})")
+            records[:, offset:offset + width] = np.frombuffer(block, dtype=np.uint8).reshape(n, width)
+        offset += width
+    return records.tobytes()
+
+def dbf_library_spec(field_specs: List[Tuple[str, int]]) -> str:
+    return ';'.join(f"{name} C({width})" for name, width in field_specs)
+
+def append_dbf_library_records(table, df: pd.DataFrame):
     for _, row in df.iterrows():
         rec = {c: ('' if pd.isna(row[c]) else str(row[c])) for c in df.columns}
         table.append(rec)
 
+def write_dbf_with_dbf_library(df: pd.DataFrame, path: str, encoding: str = ENCODING_OUT,
+                               field_specs: Optional[List[Tuple[str, int]]] = None):
+    table = dbf.Table(path, dbf_library_spec(field_specs or dbf_char_field_specs(df)), codepage=encoding)
+    table.open(dbf.READ_WRITE)
+    append_dbf_library_records(table, df)
     table.close()
 
+def write_dbf_streaming(chunks: Iterable[Tuple[pd.DataFrame, Dict[str, np.ndarray]]], path: str,
+                        schema: List[Tuple[str, int]], encoding: str = ENCODING_OUT) -> int:
+    """
+    Запись DBF из потока блоков (DataFrame, сырые колонки) за один проход.
+    Раскладка полей берётся из schema, поэтому заголовок пишется по первому блоку,
+    а число записей проставляется в него после последнего. Возвращает число записей.
+    """
+    overflows = new_overflow_report()
+    total = 0
+    if encoding not in DBF_LANGUAGE_DRIVERS:
+        table = None
+        for chunk, raw_text in chunks:
+            if table is None:
+                table = dbf.Table(path, dbf_library_spec(frame_field_specs(chunk, schema)), codepage=encoding)
+                table.open(dbf.READ_WRITE)
+            append_dbf_library_records(table, decode_passthrough(chunk, raw_text))
+            total += len(chunk)
+        if table is not None:
+            table.close()
+        return total
+
+    with open(path, 'wb') as fh:
+        with queued_writer(fh) as write:
+            field_specs = None
+            for chunk, raw_text in chunks:
+                if field_specs is None:
+                    field_specs = frame_field_specs(chunk, schema)
+                    write(build_dbf_header(field_specs, 0, encoding))
+                for start in range(0, len(chunk), WRITE_CHUNK_ROWS):
+                    write(encode_dbf_records(chunk.iloc[start:start + WRITE_CHUNK_ROWS], field_specs,
+                                             encoding, raw_text, overflows))
+                total += len(chunk)
+            if field_specs is None:
+                write(build_dbf_header([], 0, encoding))
+            write(b'\x1a')
+        fh.seek(4)
+        fh.write(struct.pack('<I', total))
+    print_overflow_report(overflows)
+    return total
+
+def write_dbf(df: pd.DataFrame, path: str, encoding: str = ENCODING_OUT,
+              raw_text: Optional[Dict[str, np.ndarray]] = None,
+              schema: Optional[List[Tuple[str, int]]] = None):
+    """
+    Запись DBF блоками: заголовок, затем записи кусками по WRITE_CHUNK_ROWS строк.
+    Ширины полей берутся из schema (см. archive_output_schema); без неё —
+    по данным, как раньше (dbf_char_field_specs).
+    Для кодировок без известного байта драйвера пишем через библиотеку dbf.
+    """
+    field_specs = frame_field_specs(df, schema) if schema is not None else dbf_char_field_specs(df, raw_text)
+    if encoding not in DBF_LANGUAGE_DRIVERS:
+        write_dbf_with_dbf_library(decode_passthrough(df, raw_text) if raw_text else df, path,
+                                   encoding=encoding, field_specs=field_specs)
+        return
+    overflows = new_overflow_report()
+    with open(path, 'wb') as fh, queued_writer(fh) as write:
+        write(build_dbf_header(field_specs, len(df), encoding))
+        for start in range(0, len(df), WRITE_CHUNK_ROWS):
+            chunk = df.iloc[start:start + WRITE_CHUNK_ROWS]
+            write(encode_dbf_records(chunk, field_specs, encoding, raw_text, overflows))
+        write(b'\x1a')
+    print_overflow_report(overflows)
+
 # -----------------------------------------------------------
-def main():
-    print(f"[read] Чтение {IN_DB} ...")
-    df = read_dbf_with_all_records(IN_DB, encoding=ENCODING_IN)
+# Дополнительные выходы (--sink): те же записи, что уходят в DBF, пишутся за тот же
+# проход по блокам в форматы для аналитического хранилища. Значения — строки, как в DBF
+# (пустое -> '', str(), strip()), но без дополнения и обрезки до ширины поля.
+# Выход — фабрика контекстных менеджеров sink(path), которая отдаёт функцию
+# write(колонки), где колонки — dict имя -> список строк одного блока.
+
+OutputSink = Callable[[str], ContextManager[Callable[[Dict[str, List[str]]], None]]]
+OUTPUT_SINKS: Dict[str, OutputSink] = {}
+OUTPUT_SINK_SUFFIXES: Dict[str, str] = {}
+# Выходы запуска: (формат, путь или None — рядом с выходным DBF), см. sink_targets
+SINK_TARGETS: List[Tuple[str, Optional[str]]] = []
+WRITE_DBF = True
+
+PARQUET_ROW_GROUP_ROWS = 128 * 1024
+CSV_ENCODING = 'utf-8'
+
+def register_output_sink(name: str, sink: OutputSink, suffix: str):
+    OUTPUT_SINKS[name] = sink
+    OUTPUT_SINK_SUFFIXES[name] = suffix
+
+def require_pyarrow():
+    # pyarrow — необязательная зависимость (extra 'arrow'), нужна только выходам parquet и arrow
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Для выходов parquet и arrow нужен pyarrow: pip install 'flint-conver-cronos[arrow]'") from None
+    return pyarrow
+
+def arrow_table(pa, columns: Dict[str, List[str]]):
+    return pa.table({name: pa.array(values, type=pa.string()) for name, values in columns.items()})
+
+@contextlib.contextmanager
+def parquet_sink(path: str) -> Iterator[Callable[[Dict[str, List[str]]], None]]:
+    """
+    Parquet: блоки копятся до PARQUET_ROW_GROUP_ROWS строк и пишутся группой строк,
+    колонки кодируются словарём (в выводе много повторяющихся кодов и дат).
+    """
+    pa = require_pyarrow()
+    buffer: Dict[str, List[str]] = {}
+    writer = None
+
+    def flush(rows: int):
+        nonlocal writer
+        table = arrow_table(pa, {name: values[:rows] for name, values in buffer.items()})
+        if writer is None:
+            writer = pa.parquet.ParquetWriter(path, table.schema, use_dictionary=True)
+        writer.write_table(table, row_group_size=PARQUET_ROW_GROUP_ROWS)
+        for values in buffer.values():
+            del values[:rows]
+
+    def write(columns: Dict[str, List[str]]):
+        for name, values in columns.items():
+            buffer.setdefault(name, []).extend(values)
+        while len(next(iter(buffer.values()), [])) >= PARQUET_ROW_GROUP_ROWS:
+            flush(PARQUET_ROW_GROUP_ROWS)
+
+    try:
+        yield write
+        rows = len(next(iter(buffer.values()), []))
+        if rows or writer is None:
+            flush(rows)
+    finally:
+        if writer is not None:
+            writer.close()
+
+@contextlib.contextmanager
+def arrow_sink(path: str) -> Iterator[Callable[[Dict[str, List[str]]], None]]:
+    # Arrow IPC (файловый формат): каждый блок — отдельные record batch'и
+    pa = require_pyarrow()
+    writer = None
+
+    def write(columns: Dict[str, List[str]]):
+        nonlocal writer
+        table = arrow_table(pa, columns)
+        if writer is None:
+            writer = pa.ipc.new_file(path, table.schema)
+        writer.write_table(table)
+
+    try:
+        yield write
+    finally:
+        if writer is not None:
+            writer.close()
+
+@contextlib.contextmanager
+def csv_sink(path: str) -> Iterator[Callable[[Dict[str, List[str]]], None]]:
+    # CSV с заголовком в CSV_ENCODING
+    with open(path, 'w', newline='', encoding=CSV_ENCODING) as f:
+        writer = csv.writer(f)
+        header = None
+
+        def write(columns: Dict[str, List[str]]):
+            nonlocal header
+            if header is None:
+                header = list(columns)
+                writer.writerow(header)
+            writer.writerows(zip(*columns.values()))
+
+        yield write
+
+register_output_sink('parquet', parquet_sink, '.parquet')
+register_output_sink('csv', csv_sink, '.csv')
+register_output_sink('arrow', arrow_sink, '.arrow')
+
+def sink_targets(out_path: str) -> List[Tuple[str, str]]:
+    # пути выходов: по умолчанию — имя выходного DBF с суффиксом формата,
+    # относительный путь — от каталога выходного DBF
+    directory = os.path.dirname(out_path)
+    targets = []
+    for name, path in SINK_TARGETS:
+        if path is None:
+            path = os.path.splitext(out_path)[0] + OUTPUT_SINK_SUFFIXES[name]
+        targets.append((name, os.path.join(directory, path)))
+    return targets
+
+@contextlib.contextmanager
+def output_sinks(out_path: str) -> Iterator[List[Callable[[Dict[str, List[str]]], None]]]:
+    # открытые выходы SINK_TARGETS (пустой список, если их нет)
+    with contextlib.ExitStack() as stack:
+        writers = []
+        for name, path in sink_targets(out_path):
+            print(f"[write] Создаём файл: {path}")
+            writers.append(stack.enter_context(OUTPUT_SINKS[name](path)))
+        yield writers
+
+def sink_columns(df: pd.DataFrame, raw_text: Dict[str, np.ndarray]) -> Dict[str, List[str]]:
+    # колонки блока в виде строк для выходов (сырые колонки декодируются, см. decode_passthrough)
+    if raw_text:
+        df = decode_passthrough(df, raw_text)
+    columns = {}
+    for c in df.columns:
+        col = plain_column(df[c])
+        columns[str(c)] = col.where(col.notna(), '').astype(str).str.strip().tolist()
+    return columns
+
+def write_outputs(chunks: Iterable[Tuple[pd.DataFrame, Dict[str, np.ndarray]]], out_path: str,
+                  schema: List[Tuple[str, int]]) -> int:
+    """
+    Выходной DBF (если WRITE_DBF) и выходы SINK_TARGETS из одного потока блоков.
+    Каждый блок передаётся выходам перед тем, как уйти в write_dbf_streaming.
+    Возвращает число записей.
+    """
+    with output_sinks(out_path) as writers:
+        def fanned_out() -> Iterator[Tuple[pd.DataFrame, Dict[str, np.ndarray]]]:
+            for chunk, raw_text in chunks:
+                if writers:
+                    columns = sink_columns(chunk, raw_text)
+                    for write in writers:
+                        write(columns)
+                yield chunk, raw_text
+
+        if WRITE_DBF:
+            print(f"[write] Создаём файл: {out_path}")
+            return write_dbf_streaming(fanned_out(), out_path, schema, encoding=ENCODING_OUT)
+        return sum(len(chunk) for chunk, _ in fanned_out())
+
+# -----------------------------------------------------------
+def select_output_columns(df: pd.DataFrame) -> pd.DataFrame:
+    return df[[c for c in columns_to_keep if c in df.columns]].copy()
+
+def report_unparsed_keys(label: str, index: ChildIndex):
+    if index.unparsed:
+        print(f"[warn] {label}: {index.unparsed} записей с P99999, который не является целым числом "
+              f"(в выход не попадают), например: {index.unparsed_samples}")
+
+def load_child_index(path: str, label: str, build: Callable[[pd.DataFrame], ChildIndex],
+                     on_table: Optional[Callable[[str, pd.DataFrame], None]] = None,
+                     columns: Optional[Iterable[str]] = None) -> ChildIndex:
+    """
+    Индекс дочерней таблицы. С кэшем (--cache-dir) готовый индекс берётся с диска,
+    пока не изменились файл и версия конвертера, — таблица тогда не читается вовсе;
+    on_table нужна сама таблица, поэтому с ним индекс всегда строится заново.
+    """
+    entry = key = None
+    if INPUT_CACHE_DIR is not None and on_table is None:
+        os.makedirs(INPUT_CACHE_DIR, exist_ok=True)
+        key = child_index_cache_key(path, label, columns)
+        entry = dbf_cache_entry(key)
+        index = load_cached_child_index(entry, key)
+        if index is not None:
+            print(f"[cache] {path}: индекс {label} взят из кэша")
+            report_unparsed_keys(label, index)
+            return index
+    print(f"[read] Чтение {path} ...")
+    with pipeline_stage(f'read:{label}') as stage:
+        child_df, _ = read_dbf_cached(path, encoding=ENCODING_IN, columns=columns)
+        stage['rows'] = len(child_df)
+    print(f"[info] {label}: прочитано {len(child_df)} записей, столбцы: {list(child_df.columns)}")
+    with pipeline_stage(f'index:{label}', len(child_df)):
+        index = build(child_df)
+    report_unparsed_keys(label, index)
+    if on_table is not None:
+        on_table(label, child_df)
+    if entry is not None:
+        try:
+            save_child_index(entry, key, index)
+            evict_input_cache(entry, INPUT_CACHE_MAX_BYTES)
+        except OSError as e:
+            print(f"[warn] Не удалось сохранить индекс {label} в кэш: {e}")
+    return index
+
+def load_child_indexes(paths: ArchivePaths,
+                       on_table: Optional[Callable[[str, pd.DataFrame], None]] = None
+                       ) -> Tuple[ChildIndex, ChildIndex, ChildIndex, ChildIndex]:
+    """
+    Чтение NKVD03..06 и построение компактных индексов по P99999, таблицы — одновременно
+    (run_concurrently). Сами таблицы после построения индекса не удерживаются;
+    on_table(метка, таблица), если задан, вызывается для каждой таблицы до её освобождения,
+    возможно из разных потоков.
+    """
+    return tuple(run_concurrently([
+        lambda: load_child_index(paths.nkvd03, 'NKVD03', build_nkvd03_map, on_table, NKVD03_SOURCE_FIELDS),
+        lambda: load_child_index(paths.nkvd04, 'NKVD04', build_nkvd04_multi, on_table, NKVD04_SOURCE_FIELDS),
+        lambda: load_child_index(paths.nkvd05, 'NKVD05', build_nkvd05_multi, on_table, NKVD05_SOURCE_FIELDS),
+        lambda: load_child_index(paths.nkvd06, 'NKVD06', build_nkvd06_multi, on_table, NKVD06_SOURCE_FIELDS),
+    ]))
+
+def read_nkvd01(paths: ArchivePaths, passthrough: Iterable[str] = ()
+                ) -> Tuple[pd.DataFrame, Dict[str, np.ndarray]]:
+    print(f"[read] Чтение {paths.nkvd01} ...")
+    with pipeline_stage('read:NKVD01') as stage:
+        df, raw_text = read_dbf_cached(paths.nkvd01, passthrough, encoding=ENCODING_IN, columns=NKVD01_SOURCE_FIELDS)
+        stage['rows'] = len(df)
     print(f"[info] Прочитано {len(df)} записей, столбцы: {list(df.columns)}")
+    return df, raw_text
+
+def load_archive(paths: ArchivePaths, passthrough: Iterable[str] = (),
+                 on_table: Optional[Callable[[str, pd.DataFrame], None]] = None):
+    # NKVD01 читается одновременно с NKVD03..06 и построением их индексов
+    (df, raw_text), child_indexes = run_concurrently([
+        lambda: read_nkvd01(paths, passthrough),
+        lambda: load_child_indexes(paths, on_table),
+    ])
+    return df, raw_text, child_indexes
+
+def convert_in_memory(paths: Optional[ArchivePaths] = None):
+    """
+    NKVD01 читается целиком, преобразуется блоками по TRANSFORM_BLOCK_ROWS записей
+    в фоновом потоке; готовые блоки кодируются и пишутся, пока преобразуется следующий.
+    """
+    paths = paths or archive_paths()
+    df, raw_text, child_indexes = load_archive(paths, PASSTHROUGH_FIELDS)
+
+    def transformed_blocks() -> Iterator[Tuple[pd.DataFrame, Dict[str, np.ndarray]]]:
+        for start in range(0, len(df), TRANSFORM_BLOCK_ROWS):
+            block = df.iloc[start:start + TRANSFORM_BLOCK_ROWS].copy()
+            block = process_dataframe(block, *child_indexes, row_offset=start, passthrough=raw_text)
+            yield select_output_columns(block), raw_text
+        if not len(df):
+            yield select_output_columns(process_dataframe(df, *child_indexes, passthrough=raw_text)), raw_text
+
+    with pipeline_stage('write', len(df)):
+        write_outputs(prefetch(transformed_blocks()), paths.out,
+                      archive_output_schema(paths, multi_value_counts(child_indexes)))
+
+# -----------------------------------------------------------
+# Лёгкий движок для малых архивов (ежедневные дельты в сотни записей).
+# Таблицы читаются в списки значений без pandas/numpy, к записям-словарям применяются
+# те же скалярные правила (combine_date_parts, build_ugd_merge_for_row_using_dc,
+# VALUE_MAPPERS, build_st_zn_ch), а дочерние таблицы сводятся в dict по ключу P99999.
+# Результат совпадает с convert_in_memory байт в байт. При --engine auto движок
+# выбирается, если во всех пяти таблицах архива вместе не больше LEAN_MAX_ROWS записей.
+
+ENGINE = 'auto'
+LEAN_MAX_ROWS = 20000
+# Поля вывода, которые появляются только при наличии одноимённого поля в NKVD01
+SOURCE_OUTPUT_FIELDS = ('OVD', 'VID', 'NOM', 'FAB')
+
+def join_key(v) -> Optional[int]:
+    # скалярный integer_join_key
+    s = str(v).strip()
+    return int(s) if re.fullmatch(JOIN_KEY_PATTERN, s) else None
+
+def lean_column_values(values: list, field: DbfField) -> list:
+    """
+    N/F-колонка в том виде, в каком её отдаёт DataFrame полного чтения
+    (см. numeric_field_dtypes): int без пустых значений, float с NaN при пустых
+    значениях или дробной части, None — если значений нет совсем.
+    """
+    if field.type not in ('N', 'F') or all(v is None for v in values):
+        return values
+    if field.decimals or any(v is None for v in values):
+        return [float('nan') if v is None else float(v) for v in values]
+    return values
+
+def read_dbf_lean(path: str, columns: Iterable[str], encoding: str = ENCODING_IN
+                  ) -> Optional[Tuple[int, Dict[str, list]]]:
+    """
+    Чтение таблицы в списки значений по колонкам (только поля из columns).
+    None, если файл не читается нативным ридером или записей в нём меньше,
+    чем в заголовке: такие архивы конвертирует convert_in_memory.
+    """
+    with open(path, 'rb') as fh:
+        data = fh.read()
+    layout = native_dbf_layout(data, encoding)
+    if layout is None or layout[1] < layout[0].record_count:
+        return None
+    header, n = layout
+    table: Dict[str, list] = {}
+    if n == 0:
+        # как pd.DataFrame([]) в read_dbf_native_passthrough: таблица без колонок
+        return n, table
+    starts = range(header.header_length, header.header_length + n * header.record_length,
+                   header.record_length)
+    for field in projected_fields(header, columns):
+        block = b''.join([data[start + field.offset:start + field.offset + field.length] for start in starts])
+        table[field.name] = lean_column_values(decode_field_block(block, field, encoding), field)
+    return n, table
+
+def lean_column(table: Dict[str, list], name: str, n: int) -> list:
+    # отсутствующая колонка ведёт себя как пустые значения (см. child_column)
+    return table[name] if name in table else [None] * n
+
+def build_nkvd03_lean(n: int, table: Dict[str, list]) -> Dict[int, List[str]]:
+    """
+    Словарный вариант build_nkvd03_map: ключ P99999 -> [ST1, P1, ST2, P2, ST3, P3]
+    по первым трём дочерним записям ключа в порядке файла.
+    """
+    index: Dict[int, List[str]] = {}
+    for p99999, sta, zna, cha, pun in zip(*(lean_column(table, f, n) for f in NKVD03_SOURCE_FIELDS)):
+        key = join_key(p99999)
+        if key is None:
+            continue
+        slots = index.setdefault(key, [])
+        if len(slots) < 6:
+            slots += [build_st_zn_ch(sta, zna, cha), '' if is_missing(pun) or not pun else pun]
+    return {key: slots + [''] * (6 - len(slots)) for key, slots in index.items()}
+
+def aggregate_child_values_lean(n: int, table: Dict[str, list], key_column: str, value_column: str,
+                                separator: str, normalizer: Optional[str] = None) -> Tuple[Dict[int, str], int]:
+    # словарный вариант aggregate_child_values: ключ -> уникальные значения через separator
+    # и наибольшее число значений у ключа (см. multi_value_counts)
+    func = VALUE_MAPPERS[normalizer] if normalizer is not None else None
+    groups: Dict[int, Dict[str, None]] = {}
+    for key, value in zip(lean_column(table, key_column, n), lean_column(table, value_column, n)):
+        value = '' if is_missing(value) else str(value).strip()
+        if func is not None:
+            value = func(value)
+            value = '' if is_missing(value) else str(value).strip()
+        key = join_key(key)
+        if key is not None and value:
+            groups.setdefault(key, {})[value] = None
+    return ({key: separator.join(values) for key, values in groups.items()},
+            max(map(len, groups.values()), default=0))
+
+def build_child_indexes_lean(tables: Dict[str, Tuple[int, Dict[str, list]]]) -> Tuple[tuple, Dict[str, int]]:
+    # индексы для process_records и число значений SFE/LIN/LI2 для archive_output_schema
+    nkvd06_rows, nkvd06 = tables['NKVD06']
+    li2_column = next((c for c in LI2_CANDIDATES if c in nkvd06), LI2_CANDIDATES[0])
+    sfe, sfe_items = aggregate_child_values_lean(*tables['NKVD04'], 'P99999', 'SFE', SFE_SEPARATOR)
+    lin, lin_items = aggregate_child_values_lean(*tables['NKVD05'], 'P99999', 'LIN', LIN_SEPARATOR,
+                                                 normalizer='LIN')
+    li2, li2_items = aggregate_child_values_lean(nkvd06_rows, nkvd06, 'P99999', li2_column, LI2_SEPARATOR)
+    return ((build_nkvd03_lean(*tables['NKVD03']), sfe, lin, li2),
+            {'SFE': sfe_items, 'LIN': lin_items, 'LI2': li2_items})
+
+def process_records(table: Dict[str, list],
+                    nkvd03_map: Dict[int, List[str]],
+                    nkvd04_multi: Dict[int, str],
+                    nkvd05_multi: Dict[int, str],
+                    nkvd06_multi: Dict[int, str]) -> Tuple[List[str], List[tuple]]:
+    """
+    Построчный вариант process_dataframe для лёгкого движка.
+    Возвращает колонки вывода (как select_output_columns) и записи-кортежи в их порядке.
+    """
+    mappers = VALUE_MAPPERS
+    no_children = [''] * 6
+    records = []
+    for i, row in enumerate(dict(zip(table, values)) for values in zip(*table.values())):
+        out = {'ROW_NUM': row['ROW_NUM'] if 'ROW_NUM' in row else i + 1}
+        for col in ('SNY', 'ARX', 'FAI', 'DOP', 'VID', 'NOM', 'FAB'):
+            out[col] = row.get(col, '')
+        if 'OVD' in row:
+            out['OVD'] = mappers['OVD']('' if is_missing(row['OVD']) else str(row['OVD']))
+        out['LI0'] = mappers['LI0'](row['LI0']) if 'LI0' in row else ''
+        out['VID_ED'] = mappers['VID_ED'](out['LI0'])
+        for new_field, parts in DATE_GROUPS.items():
+            out[new_field] = combine_date_parts(parts, row)
+
+        ugd_row = {col: mappers['UGD_PART'](row.get(col, '')) for col in ugd_merge}
+        ugd_row['DC'] = out['DC']
+        out['UGD_MERGE'] = build_ugd_merge_for_row_using_dc(ugd_row)
+
+        out['ZAV'] = mappers['ZAV'](row.get('ZAV'))
+        out['POLUCH_IZ'] = mappers['POLUCH_IZ'](row.get('ZAV'))
+
+        key = join_key(out['ROW_NUM'])
+        out.update(zip((F1, F2, F3, F4, F5, F6), nkvd03_map.get(key, no_children)))
+        out['SFE'] = nkvd04_multi.get(key, '')
+        out['LIN'] = nkvd05_multi.get(key, '')
+        out['LI2'] = nkvd06_multi.get(key, '')
+
+        for new_field, parts in EXTRA_DATE_GROUPS.items():
+            out[new_field] = combine_date_parts(parts, row)
+        out['RE2'] = out['RE']
+        out['OSS'] = mappers['OSS'](row.get('OSS'))
+        out['KUD'] = mappers['KUD'](row.get('KUD'))
+        records.append(out)
+
+    columns = [c for c in columns_to_keep if c not in SOURCE_OUTPUT_FIELDS or c in table]
+    return columns, [tuple(out[c] for c in columns) for out in records]
+
+def lean_text_columns(columns: List[str], records: List[tuple]) -> Dict[str, List[str]]:
+    # значения записей так, как их приводит encode_dbf_records: пустое -> '', str(), strip()
+    return {name: ['' if is_missing(rec[j]) else str(rec[j]).strip() for rec in records]
+            for j, name in enumerate(columns)}
+
+def write_dbf_lean(texts: Dict[str, List[str]], row_nums: list, path: str,
+                   schema: List[Tuple[str, int]], encoding: str = ENCODING_OUT):
+    """
+    Запись DBF из строковых колонок lean_text_columns; ширины полей — из schema,
+    row_nums — ROW_NUM записей для отчёта о значениях длиннее поля.
+    """
+    widths = dict(schema)
+    field_specs = [(c, widths[c]) for c in texts]
+    overflows = new_overflow_report()
+    padded = []
+    for name, width in field_specs:
+        text = texts[name]
+        too_long = [i for i, t in enumerate(text) if len(t) > width]
+        if too_long:
+            report_overflow(name, width, [row_nums[i] for i in too_long], [len(text[i]) for i in too_long],
+                            overflows)
+            text = [t[:width] for t in text]
+        padded.append([t.ljust(width) for t in text])
+    with open(path, 'wb') as fh:
+        fh.write(build_dbf_header(field_specs, len(row_nums), encoding))
+        fh.write(b''.join((' ' + ''.join(values)).encode(encoding) for values in zip(*padded)))
+        fh.write(b'\x1a')
+    print_overflow_report(overflows)
+
+def use_lean_engine(paths: ArchivePaths) -> bool:
+    # лёгкий движок: по --engine, а при auto — если архив мал (по заголовкам таблиц)
+    if ENGINE == 'pandas' or ENCODING_OUT not in DBF_LANGUAGE_DRIVERS:
+        return False
+    if ENGINE == 'lean':
+        return True
+    total = 0
+    for path in paths[:len(ARCHIVE_FILES)]:
+        header = read_dbf_file_header(path)
+        if header is None:
+            return False
+        total += header.record_count
+    return total <= LEAN_MAX_ROWS
+
+def convert_lean(paths: Optional[ArchivePaths] = None) -> bool:
+    """
+    Конвертация архива лёгким движком. False (ничего не записано), если какая-то
+    таблица не читается read_dbf_lean: тогда результат с точностью до байта
+    даёт только convert_in_memory.
+    """
+    paths = paths or archive_paths()
+    tables: Dict[str, Tuple[int, Dict[str, list]]] = {}
+    for label, path, columns in (('NKVD01', paths.nkvd01, NKVD01_SOURCE_FIELDS),
+                                 ('NKVD03', paths.nkvd03, NKVD03_SOURCE_FIELDS),
+                                 ('NKVD04', paths.nkvd04, NKVD04_SOURCE_FIELDS),
+                                 ('NKVD05', paths.nkvd05, NKVD05_SOURCE_FIELDS),
+                                 ('NKVD06', paths.nkvd06, NKVD06_SOURCE_FIELDS)):
+        print(f"[read] Чтение {path} ...")
+        with pipeline_stage(f'read:{label}') as stage:
+            result = read_dbf_lean(path, columns)
+            stage['rows'] = result[0] if result else 0
+        if result is None:
+            print(f"[info] {label}: формат не поддерживается лёгким движком")
+            return False
+        tables[label] = result
+    rows, table = tables['NKVD01']
+    print(f"[info] Лёгкий движок: прочитано {rows} записей, столбцы: {list(table)}")
+
+    with pipeline_stage('index', sum(n for n, _ in tables.values()) - rows):
+        child_indexes, items = build_child_indexes_lean(tables)
+    with pipeline_stage('transform', rows):
+        columns, records = process_records(table, *child_indexes)
+
+    with pipeline_stage('write', len(records)):
+        texts = lean_text_columns(columns, records)
+        with output_sinks(paths.out) as writers:
+            for write in writers:
+                write(texts)
+        if WRITE_DBF:
+            print(f"[write] Создаём файл: {paths.out}")
+            row_nums = [rec[columns.index('ROW_NUM')] for rec in records]
+            write_dbf_lean(texts, row_nums, paths.out, archive_output_schema(paths, items),
+                           encoding=ENCODING_OUT)
+    return True
+
+def convert_archive(paths: Optional[ArchivePaths] = None):
+    # конвертация целиком в памяти: малые архивы — лёгким движком, остальные — convert_in_memory
+    paths = paths or archive_paths()
+    if use_lean_engine(paths) and convert_lean(paths):
+        return
+    convert_in_memory(paths)
+
+def convert_streaming(chunk_rows: int, paths: Optional[ArchivePaths] = None):
+    """
+    Потоковый режим: NKVD01 читается и преобразуется блоками по chunk_rows записей,
+    дочерние таблицы держатся в памяти только в виде индексов по P99999.
+    Результат совпадает с convert_in_memory байт в байт.
+    """
+    paths = paths or archive_paths()
+    child_indexes = load_child_indexes(paths)
+
+    def transformed_chunks() -> Iterator[pd.DataFrame]:
+        produced = False
+        for chunk, raw_text in iter_dbf_chunks(paths.nkvd01, chunk_rows, encoding=ENCODING_IN,
+                                               passthrough=PASSTHROUGH_FIELDS, columns=NKVD01_SOURCE_FIELDS):
+            produced = True
+            chunk = process_dataframe(chunk, *child_indexes, row_offset=chunk.index[0], passthrough=raw_text)
+            print(f"[info] Обработаны записи {chunk.index[0] + 1}..{chunk.index[-1] + 1}")
+            yield select_output_columns(chunk), raw_text
+        if not produced:
+            yield select_output_columns(process_dataframe(pd.DataFrame([]), *child_indexes)), {}
+
+    print(f"[read] Потоковое чтение {paths.nkvd01} блоками по {chunk_rows} записей ...")
+    written = write_outputs(prefetch(transformed_chunks()), paths.out,
+                            archive_output_schema(paths, multi_value_counts(child_indexes)))
+    print(f"[info] Записано {written} записей")
+
+# Способ запуска рабочих процессов. Родитель к этому времени уже запустил потоки
+# (prefetch, run_concurrently), а fork из многопоточного процесса может унаследовать
+# захваченную блокировку, поэтому процессы порождает forkserver (или spawn, где его нет)
+WORKER_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+def worker_context():
+    context = multiprocessing.get_context(WORKER_START_METHOD)
+    if WORKER_START_METHOD == 'forkserver':
+        # процессы ответвляются от сервера, уже загрузившего pandas/numpy/dbf, а не грузят их каждый сам
+        context.set_forkserver_preload(['__main__', 'pandas', 'numpy', 'dbf'])
+    return context
+
+# Индексы NKVD03..06 рабочего процесса convert_parallel: передаются один раз
+# при запуске процесса (init_row_range_worker), а не с каждым диапазоном строк
+WORKER_CHILD_INDEXES: Tuple[ChildIndex, ...] = ()
+
+class RowRangePart(NamedTuple):
+    path: str                                   # префикс файлов блока: .dbf — записи, .sink — колонки выходов
+    rows: int
+    field_specs: List[Tuple[str, int]]
+    overflows: Optional[Dict[str, dict]]        # обрезанные значения блока (режим 'truncate')
+
+def init_row_range_worker(settings: dict, child_indexes: Tuple[ChildIndex, ...]):
+    global WORKER_CHILD_INDEXES
+    apply_worker_settings(settings)
+    WORKER_CHILD_INDEXES = child_indexes
+
+def convert_row_range(path: str, start: int, stop: int, header: DbfHeader,
+                      dtypes: Dict[str, Optional[str]], schema: List[Tuple[str, int]],
+                      spill_dir: str) -> RowRangePart:
+    """
+    Задача рабочего процесса: читает свой диапазон NKVD01 напрямую из файла (mmap),
+    преобразует его и пишет во временный файл готовые записи DBF (encode_dbf_records),
+    а для выходов --sink — ещё и строковые колонки блока.
+    """
+    chunk, raw_text = read_dbf_row_range(path, start, stop, header, dtypes, encoding=ENCODING_IN,
+                                         passthrough=PASSTHROUGH_FIELDS, columns=NKVD01_SOURCE_FIELDS)
+    chunk = select_output_columns(process_dataframe(chunk, *WORKER_CHILD_INDEXES, row_offset=start,
+                                                    passthrough=raw_text))
+    field_specs = frame_field_specs(chunk, schema)
+    overflows = new_overflow_report()
+    part_path = os.path.join(spill_dir, f"part_{start:012d}")
+    if SINK_TARGETS:
+        with open(part_path + '.sink', 'wb') as f:
+            pickle.dump(sink_columns(chunk, raw_text), f, protocol=pickle.HIGHEST_PROTOCOL)
+    if WRITE_DBF:
+        with open(part_path + '.dbf', 'wb') as f:
+            for block_start in range(0, len(chunk), WRITE_CHUNK_ROWS):
+                f.write(encode_dbf_records(chunk.iloc[block_start:block_start + WRITE_CHUNK_ROWS], field_specs,
+                                           ENCODING_OUT, raw_text, overflows))
+    return RowRangePart(part_path, len(chunk), field_specs, overflows)
+
+def write_row_range_parts(parts: Iterable[RowRangePart], out_path: str) -> int:
+    """
+    Сборка результата convert_parallel: записи блоков дописываются в выходной DBF
+    в порядке ROW_NUM как есть, колонки блоков уходят в выходы SINK_TARGETS.
+    Возвращает число записей.
+    """
+    overflows = new_overflow_report()
+    total = 0
+    with output_sinks(out_path) as writers, contextlib.ExitStack() as stack:
+        fh = None
+        if WRITE_DBF:
+            print(f"[write] Создаём файл: {out_path}")
+            fh = stack.enter_context(open(out_path, 'wb'))
+        for part in parts:
+            if writers:
+                with open(part.path + '.sink', 'rb') as f:
+                    columns = pickle.load(f)
+                os.remove(part.path + '.sink')
+                for write in writers:
+                    write(columns)
+            if fh is not None:
+                if fh.tell() == 0:
+                    fh.write(build_dbf_header(part.field_specs, 0, ENCODING_OUT))
+                with open(part.path + '.dbf', 'rb') as f:
+                    shutil.copyfileobj(f, fh, 1024 * 1024)
+                os.remove(part.path + '.dbf')
+                merge_overflow_report(overflows, part.overflows)
+            total += part.rows
+        if fh is not None:
+            fh.write(b'\x1a')
+            fh.seek(4)
+            fh.write(struct.pack('<I', total))
+    print_overflow_report(overflows)
+    return total
+
+def convert_parallel(workers: int, chunk_rows: Optional[int] = None, paths: Optional[ArchivePaths] = None):
+    """
+    Параллельный режим: NKVD01 делится на диапазоны строк, которые обрабатываются в пуле процессов.
+    Процессы читают NKVD01 из файла сами, индексы NKVD03..06 получают один раз при запуске,
+    а возвращают готовые записи DBF через временные файлы — DataFrame'ы между процессами не передаются.
+    Записи собираются в порядке ROW_NUM.
+    """
+    paths = paths or archive_paths()
+    rows_hint = chunk_rows or 65536
+    plan = dbf_chunk_plan(paths.nkvd01, rows_hint, encoding=ENCODING_IN, columns=NKVD01_SOURCE_FIELDS)
+    if plan is None or plan[1] == 0 or ENCODING_OUT not in DBF_LANGUAGE_DRIVERS:
+        print("[info] Параллельный режим недоступен для этого файла, работаем в одном процессе")
+        convert_in_memory(paths)
+        return
+    header, n, dtypes = plan
+    if not chunk_rows:
+        # несколько диапазонов на процесс, чтобы выровнять нагрузку
+        chunk_rows = max(1, -(-n // (workers * 4)))
+    ranges = [(start, min(start + chunk_rows, n)) for start in range(0, n, chunk_rows)]
+
+    child_indexes = load_child_indexes(paths)
+    schema = archive_output_schema(paths, multi_value_counts(child_indexes))
+
+    print(f"[info] Параллельная обработка {paths.nkvd01}: {n} записей, {len(ranges)} диапазонов, {workers} процессов")
+    with tempfile.TemporaryDirectory() as spill_dir, \
+            ProcessPoolExecutor(max_workers=workers, mp_context=worker_context(),
+                                initializer=init_row_range_worker, initargs=(worker_settings(), child_indexes)) as pool:
+        futures = [pool.submit(convert_row_range, paths.nkvd01, start, stop, header, dtypes, schema, spill_dir)
+                   for start, stop in ranges]
+        written = write_row_range_parts((future.result() for future in futures), paths.out)
+    print(f"[info] Записано {written} записей")
+
+# -----------------------------------------------------------
+# Инкрементальная конвертация по манифесту отпечатков записей
+
+# Версия правил преобразования: при изменении маппингов её нужно увеличить,
+# тогда инкрементальный режим сделает полную пересборку
+CONVERTER_VERSION = '0.1.0'
+MANIFEST_SUFFIX = '.manifest.npz'
 
-    print(f"[read] Чтение {NKVD03_DB} ...")
-    nkvd03_df = read_dbf_with_all_records(NKVD03_DB, encoding=ENCODING_IN)
-    print(f"[info] NKVD03: прочитано {len(nkvd03_df)} записей, столбцы: {list(nkvd03_df.columns)}")
+def frame_row_hashes(df: pd.DataFrame) -> np.ndarray:
+    # 64-битный отпечаток содержимого каждой строки (детерминированный между запусками)
+    if len(df.columns) == 0:
+        return np.zeros(len(df), dtype=np.uint64)
+    return pd.util.hash_pandas_object(df, index=False).to_numpy(dtype=np.uint64)
 
-    print(f"[read] Чтение {NKVD04_DB} ...")
-    nkvd04_df = read_dbf_with_all_records(NKVD04_DB, encoding=ENCODING_IN)
-    print(f"[info] NKVD04: прочитано {len(nkvd04_df)} записей, столбцы: {list(nkvd04_df.columns)}")
+def child_key_hashes(child_df: pd.DataFrame) -> pd.Series:
+    """
+    Отпечаток всех строк дочерней таблицы по ключу P99999 с учётом их порядка в файле.
+    """
+    keys = integer_join_key(child_column(child_df, 'P99999'))
+    rows = pd.DataFrame({'KEY': keys, 'H': frame_row_hashes(child_df)})
+    rows = rows[rows['KEY'].notna()]
+    rows['POS'] = rows.groupby('KEY', sort=False).cumcount()
+    rows['H'] = pd.util.hash_pandas_object(rows[['H', 'POS']], index=False).to_numpy(dtype=np.uint64)
+    return rows.groupby('KEY', sort=False)['H'].sum()
+
+def record_fingerprints(df: pd.DataFrame, row_keys: pd.Series, child_hashes: List[pd.Series]) -> np.ndarray:
+    """
+    Отпечаток исходной записи NKVD01 вместе со строками NKVD03..06 по её ключу.
+    """
+    parts = {'ROW': frame_row_hashes(df)}
+    keys = row_keys.to_numpy()
+    for i, hashes in enumerate(child_hashes):
+        parts[f'C{i}'] = hashes.reindex(keys, fill_value=0).to_numpy(dtype=np.uint64)
+    return pd.util.hash_pandas_object(pd.DataFrame(parts), index=False).to_numpy(dtype=np.uint64)
+
+def schema_fingerprint(df: pd.DataFrame, child_columns: List[List[str]],
+                       output_schema: List[Tuple[str, int]]) -> str:
+    # всё, что влияет на правила и раскладку вывода, кроме самих данных
+    parts = [CONVERTER_VERSION, pd.__version__, ENCODING_IN, ENCODING_OUT, repr(output_schema),
+             repr([(c, str(t)) for c, t in df.dtypes.items()]), repr(child_columns)]
+    return hashlib.sha256('\n'.join(parts).encode('utf-8')).hexdigest()
+
+def load_manifest(path: str) -> Optional[Tuple[dict, np.ndarray]]:
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data['meta']))
+            hashes = data['hashes'].astype(np.uint64)
+    except (OSError, ValueError, KeyError):
+        return None
+    return meta, hashes
+
+def save_manifest(path: str, schema: str, hashes: np.ndarray, out_path: str):
+    st = os.stat(out_path)
+    meta = {'version': CONVERTER_VERSION, 'schema': schema,
+            'out_size': st.st_size, 'out_mtime_ns': st.st_mtime_ns}
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as fh:
+        np.savez(fh, meta=np.array(json.dumps(meta)), hashes=hashes)
+    os.replace(tmp_path, path)
+
+def patch_dbf_records(path: str, df: pd.DataFrame, positions: np.ndarray,
+                      schema: List[Tuple[str, int]], encoding: str = ENCODING_OUT) -> bool:
+    """
+    Перезапись/дозапись записей выходного DBF на месте.
+    positions — номера записей (с 0) для строк df; позиции за концом файла дописываются.
+    Возвращает False (ничего не меняя), если раскладка полей файла не совпадает со schema.
+    """
+    header = read_dbf_file_header(path, encoding)
+    field_specs = frame_field_specs(df, schema)
+    if header is None or any(f.type != 'C' for f in header.fields):
+        return False
+    if [(f.name, f.length) for f in header.fields] != [(name.upper(), width) for name, width in field_specs]:
+        return False
+
+    new_count = max(header.record_count, int(positions.max()) + 1 if len(positions) else 0)
+    if len(np.setdiff1d(np.arange(header.record_count, new_count), positions)):
+        # дозапись допускается только сплошным хвостом
+        return False
+    overflows = new_overflow_report()
+    records = np.frombuffer(encode_dbf_records(df, field_specs, encoding, overflows=overflows), dtype=np.uint8)
+    records = records.reshape(len(df), header.record_length)
+    today = datetime.date.today()
+    with open(path, 'r+b') as fh:
+        fh.write(struct.pack('<BBBBI', header.version, today.year - 1900, today.month, today.day, new_count))
+        order = np.argsort(positions, kind='stable')
+        # соседние записи пишем одним куском
+        run_start = 0
+        sorted_positions = positions[order]
+        for i in range(1, len(order) + 1):
+            if i == len(order) or sorted_positions[i] != sorted_positions[i - 1] + 1:
+                fh.seek(header.header_length + int(sorted_positions[run_start]) * header.record_length)
+                fh.write(records[order[run_start:i]].tobytes())
+                run_start = i
+        if new_count > header.record_count:
+            fh.seek(header.header_length + new_count * header.record_length)
+            fh.write(b'\x1a')
+            fh.truncate()
+    print_overflow_report(overflows)
+    return True
+
+def convert_incremental(paths: Optional[ArchivePaths] = None):
+    """
+    Инкрементальный режим: рядом с выходным DBF хранится манифест с отпечатком каждой
+    исходной записи (строка NKVD01 + строки NKVD03..06 по её ключу).
+    Преобразуются только новые и изменённые записи, они переписываются в выходной DBF на месте.
+    Полная пересборка — при смене версии конвертера или схемы, при пропаже/изменении
+    выходного DBF, при уменьшении числа записей или если раскладка его полей не совпадает со схемой.
+    """
+    paths = paths or archive_paths()
+    child_fingerprints: Dict[str, Tuple[pd.Series, List[str]]] = {}
 
-    print(f"[read] Чтение {NKVD05_DB} ...")
-    nkvd05_df = read_dbf_with_all_records(NKVD05_DB, encoding=ENCODING_IN)
-    print(f"[info] NKVD05: прочитано {len(nkvd05_df)} записей, столбцы: {list(nkvd05_df.columns)}")
+    def fingerprint_child(label: str, child_df: pd.DataFrame):
+        child_fingerprints[label] = (child_key_hashes(child_df), [f"{c}:{t}" for c, t in child_df.dtypes.items()])
 
-    print(f"[read] Чтение {NKVD06_DB} ...")
-    nkvd06_df = read_dbf_with_all_records(NKVD06_DB, encoding=ENCODING_IN)
-    print(f"[info] NKVD06: прочитано {len(nkvd06_df)} записей, столбцы: {list(nkvd06_df.columns)}")
+    # отпечатки считаются по значениям, поэтому здесь все колонки декодируются
+    df, _, child_indexes = load_archive(paths, on_table=fingerprint_child)
+    child_hashes = [child_fingerprints[label][0] for label in CHILD_TABLE_LABELS]
+    child_columns = [child_fingerprints[label][1] for label in CHILD_TABLE_LABELS]
 
-    nkvd03_map = build_nkvd03_map(nkvd03_df)
-    nkvd04_multi = build_nkvd04_multi(nkvd04_df)
-    nkvd05_multi = build_nkvd05_multi(nkvd05_df)
-    nkvd06_multi = build_nkvd06_multi(nkvd06_df)
+    if 'ROW_NUM' not in df.columns:
+        df['ROW_NUM'] = range(1, len(df) + 1)
+    fingerprints = record_fingerprints(df, integer_join_key(plain_column(df['ROW_NUM'])), child_hashes)
+    output_schema = archive_output_schema(paths, multi_value_counts(child_indexes))
+    schema = schema_fingerprint(df, child_columns, output_schema)
+    manifest_path = paths.out + MANIFEST_SUFFIX
+
+    reason = None
+    manifest = load_manifest(manifest_path)
+    if manifest is None:
+        reason = "манифест не найден"
+    elif manifest[0].get('version') != CONVERTER_VERSION or manifest[0].get('schema') != schema:
+        reason = "изменилась версия конвертера или схема таблиц"
+    elif not os.path.exists(paths.out):
+        reason = f"{paths.out} не найден"
+    else:
+        st = os.stat(paths.out)
+        if st.st_size != manifest[0].get('out_size') or st.st_mtime_ns != manifest[0].get('out_mtime_ns'):
+            reason = f"{paths.out} изменён вне конвертера"
+        elif len(fingerprints) < len(manifest[1]):
+            reason = "число записей NKVD01 уменьшилось"
+
+    if reason is None:
+        old_hashes = manifest[1]
+        changed = np.flatnonzero(fingerprints[:len(old_hashes)] != old_hashes)
+        positions = np.concatenate([changed, np.arange(len(old_hashes), len(fingerprints))])
+        print(f"[info] Инкрементально: изменено {len(changed)}, добавлено {len(fingerprints) - len(old_hashes)}, "
+              f"без изменений {len(old_hashes) - len(changed)}")
+        if len(positions):
+            part = df.iloc[positions].copy()
+            part = select_output_columns(process_dataframe(part, *child_indexes))
+            print(f"[write] Обновляем файл: {paths.out}")
+            if not patch_dbf_records(paths.out, part, positions, output_schema, encoding=ENCODING_OUT):
+                reason = "раскладка полей выходного файла не совпадает со схемой"
+
+    if reason is not None:
+        print(f"[info] Полная пересборка: {reason}")
+        df = process_dataframe(df, *child_indexes)
+        print(f"[write] Создаём файл: {paths.out}")
+        write_dbf(select_output_columns(df), paths.out, encoding=ENCODING_OUT, schema=output_schema)
+
+    save_manifest(manifest_path, schema, fingerprints, paths.out)
 
-    df = process_dataframe(df, nkvd03_map, nkvd04_multi, nkvd05_multi, nkvd06_multi)
+# -----------------------------------------------------------
+# Пакетная конвертация многих архивов
 
-    # Итоговый порядок полей (включил ZAV и POLUCH_IZ, остальные поля не тронуты)
-    columns_to_keep = [
-        'ROW_NUM', 'OVD', 'LI0', 'VID', 'NOM', 'DB', 'DA', 'DI',
-        'FAB', 'ZAV', 'POLUCH_IZ',
-        F1, F2, F3, F4, F5, F6,
-        'SFE', 'LIN', 'LI2', 'SNY', 'DD', 'SN', 'VID_ED',
-        'UGD_MERGE', 'DC',
-        'OSS', 'KUD', 'ARX', 'DR', 'FAI', 'DOP', 'RE', 'RE2'
-    ]
+ARCHIVE_FILES = (IN_DB, NKVD03_DB, NKVD04_DB, NKVD05_DB, NKVD06_DB)
 
-    df_to_write = df[[c for c in columns_to_keep if c in df.columns]].copy()
+def find_archive(directory: str) -> Optional[ArchivePaths]:
+    """
+    Набор NKVD01/03/04/05/06 в каталоге (имена без учёта регистра) или None, если набор неполный.
+    Выходной файл кладётся в тот же каталог.
+    """
+    try:
+        names = {name.upper(): name for name in os.listdir(directory)}
+    except OSError:
+        return None
+    found = []
+    for name in ARCHIVE_FILES:
+        if name.upper() not in names:
+            return None
+        found.append(os.path.join(directory, names[name.upper()]))
+    return ArchivePaths(*found, os.path.join(directory, OUT_DB))
+
+def discover_archives(patterns: List[str]) -> Tuple[List[ArchivePaths], List[str]]:
+    """
+    Каталоги из списка путей/glob-шаблонов -> найденные архивы и каталоги без полного набора.
+    """
+    archives: List[ArchivePaths] = []
+    incomplete: List[str] = []
+    seen = set()
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) or [pattern]
+        for directory in matches:
+            if not os.path.isdir(directory):
+                continue
+            key = os.path.realpath(directory)
+            if key in seen:
+                continue
+            seen.add(key)
+            paths = find_archive(directory)
+            if paths is None:
+                incomplete.append(directory)
+            else:
+                archives.append(paths)
+    return archives, incomplete
+
+def worker_settings() -> dict:
+    # настройки конвертера из аргументов запуска; передаются рабочим процессам
+    # через initializer, а не наследованием при fork (spawn/forkserver их не копируют)
+    return {'cache_dir': INPUT_CACHE_DIR, 'cache_max_bytes': INPUT_CACHE_MAX_BYTES,
+            'overflow': OUTPUT_OVERFLOW, 'io_threads': IO_THREADS, 'engine': ENGINE,
+            'sinks': SINK_TARGETS, 'write_dbf': WRITE_DBF}
+
+def apply_worker_settings(settings: dict):
+    global INPUT_CACHE_DIR, INPUT_CACHE_MAX_BYTES, OUTPUT_OVERFLOW, IO_THREADS, ENGINE, SINK_TARGETS, WRITE_DBF
+    INPUT_CACHE_DIR = settings['cache_dir']
+    INPUT_CACHE_MAX_BYTES = settings['cache_max_bytes']
+    OUTPUT_OVERFLOW = settings['overflow']
+    IO_THREADS = settings['io_threads']
+    ENGINE = settings['engine']
+    SINK_TARGETS = settings['sinks']
+    WRITE_DBF = settings['write_dbf']
+
+def run_batch_job(paths: ArchivePaths, chunk_rows: Optional[int], incremental: bool) -> Tuple[bool, float, str]:
+    """
+    Конвертация одного архива в рабочем процессе пакета.
+    Вывод конвертации собирается в строку; исключение не выходит наружу,
+    а возвращается как неуспех с текстом ошибки.
+    """
+    log = io.StringIO()
+    started = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(log):
+            if incremental:
+                convert_incremental(paths=paths)
+            elif chunk_rows:
+                convert_streaming(chunk_rows, paths=paths)
+            else:
+                convert_archive(paths=paths)
+        ok = True
+    except Exception:
+        log.write(traceback.format_exc())
+        ok = False
+    return ok, time.perf_counter() - started, log.getvalue()
+
+def convert_batch(patterns: List[str], jobs: int, chunk_rows: Optional[int] = None,
+                  incremental: bool = False) -> int:
+    """
+    Пакетный режим: находит архивы по списку каталогов/шаблонов и конвертирует их
+    в пуле из jobs процессов. Падение одного архива не останавливает остальные.
+    Возвращает число неуспешных архивов.
+    """
+    archives, incomplete = discover_archives(patterns)
+    for directory in incomplete:
+        print(f"[skip] {directory}: нет полного набора {', '.join(ARCHIVE_FILES)}")
+    print(f"[batch] Найдено архивов: {len(archives)}, параллельно: {jobs}")
+
+    failed = []
+    durations = []
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max(1, jobs), mp_context=worker_context(),
+                             initializer=apply_worker_settings, initargs=(worker_settings(),)) as pool:
+        futures = {pool.submit(run_batch_job, paths, chunk_rows, incremental): paths for paths in archives}
+        for future in as_completed(futures):
+            paths = futures[future]
+            directory = os.path.dirname(paths.out) or '.'
+            try:
+                ok, elapsed, log = future.result()
+            except Exception as e:
+                # например, рабочий процесс упал целиком
+                ok, elapsed, log = False, 0.0, f"{type(e).__name__}: {e}\n"
+            if ok:
+                durations.append(elapsed)
+                print(f"[ok] {directory}: {elapsed:.2f} с")
+            else:
+                failed.append(directory)
+                print(f"[fail] {directory}: {elapsed:.2f} с")
+                for line in log.rstrip().splitlines()[-10:]:
+                    print(f"    {line}")
+
+    total = time.perf_counter() - started
+    print(f"[batch] Готово за {total:.2f} с: успешно {len(durations)}, с ошибками {len(failed)}, "
+          f"пропущено {len(incomplete)}")
+    if durations:
+        print(f"[batch] Время на архив: среднее {sum(durations) / len(durations):.2f} с, "
+              f"максимум {max(durations):.2f} с")
+    for directory in failed:
+        print(f"[batch] Ошибка: {directory}")
+    return len(failed)
 
-    print(f"[write] Создаём файл: {OUT_DB}")
-    write_dbf(df_to_write, OUT_DB, encoding=ENCODING_OUT)
+# -----------------------------------------------------------
+# Режим службы: наблюдение за входящим каталогом
+#
+# Архив — подкаталог inbox с полным набором NKVD01/03/04/05/06 (или сам набор в корне inbox).
+# Готовый архив переносится в spool/work и конвертируется в пуле прогретых процессов;
+# результат появляется в outbox/<имя>/ одним переименованием. Исходники успешных архивов
+# уходят в spool/done, после WATCH_RETRIES неудачных попыток — в spool/quarantine.
+
+WATCH_POLL_SECONDS = 2.0
+WATCH_SETTLE_SECONDS = 5.0
+WATCH_RETRIES = 3
+WATCH_RETRY_DELAY_SECONDS = 30.0
+WATCH_HISTORY = 100
+
+def dbf_file_complete(path: str) -> bool:
+    # файл дописан до конца: все записи из заголовка уже на диске
+    try:
+        header = read_dbf_file_header(path)
+        size = os.path.getsize(path)
+    except (OSError, struct.error, UnicodeDecodeError):
+        return False
+    if header is None or header.header_length == 0:
+        return False
+    return size >= header.header_length + header.record_count * header.record_length
+
+def archive_signature(paths: ArchivePaths) -> Optional[tuple]:
+    try:
+        return tuple((os.path.getsize(p), os.stat(p).st_mtime_ns) for p in paths[:len(ARCHIVE_FILES)])
+    except OSError:
+        return None
+
+def unique_path(directory: str, name: str) -> str:
+    path = os.path.join(directory, name)
+    suffix = 1
+    while os.path.exists(path):
+        path = os.path.join(directory, f"{name}.{suffix}")
+        suffix += 1
+    return path
+
+def scan_inbox(inbox: str, pending: Dict[str, Tuple[tuple, float]], settle: float) -> List[Tuple[str, ArchivePaths]]:
+    """
+    Архивы inbox, готовые к обработке: набор полный, все файлы дописаны и не менялись
+    settle секунд. pending хранит подпись набора и время её последнего изменения.
+    Возвращает пары (имя задания, пути набора); у набора из корня inbox имя строится по времени.
+    """
+    candidates = [('', inbox)]
+    try:
+        candidates += [(name, os.path.join(inbox, name)) for name in sorted(os.listdir(inbox))
+                       if not name.startswith('.') and os.path.isdir(os.path.join(inbox, name))]
+    except OSError:
+        return []
+    ready = []
+    now = time.monotonic()
+    for name, directory in candidates:
+        paths = find_archive(directory)
+        signature = archive_signature(paths) if paths else None
+        if signature is None:
+            pending.pop(directory, None)
+            continue
+        if directory not in pending or pending[directory][0] != signature:
+            pending[directory] = (signature, now)
+            continue
+        if now - pending[directory][1] < settle or not all(dbf_file_complete(p) for p in paths[:len(ARCHIVE_FILES)]):
+            continue
+        del pending[directory]
+        ready.append((name or 'inbox-' + datetime.datetime.now().strftime('%Y%m%d-%H%M%S'), paths))
+    return ready
+
+def claim_archive(name: str, paths: ArchivePaths, inbox: str, work_dir: str) -> Tuple[str, ArchivePaths]:
+    """
+    Перенос набора в spool/work (rename в пределах одной файловой системы).
+    Каталог архива переносится целиком, набор из корня inbox — по файлам.
+    """
+    target = unique_path(work_dir, name)
+    source_dir = os.path.dirname(paths.nkvd01)
+    if os.path.realpath(source_dir) != os.path.realpath(inbox):
+        os.rename(source_dir, target)
+    else:
+        os.makedirs(target)
+        for path in paths[:len(ARCHIVE_FILES)]:
+            os.rename(path, os.path.join(target, os.path.basename(path)))
+    return target, find_archive(target)
+
+def warm_worker(settings: dict):
+    """
+    Инициализация процесса пула службы: настройки конвертера и прогрев таблиц,
+    которые иначе строились бы при первом задании.
+    """
+    # Ctrl+C получает вся группа процессов; останавливает задания только сама служба
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    apply_worker_settings(settings)
+    byte_translation(ENCODING_IN, ENCODING_OUT)
+    for name in VALUE_MAPPERS:
+        map_column_values(pd.Series([''], dtype=object), name)
+
+def run_watch_job(paths: ArchivePaths, out_dir: str, chunk_rows: Optional[int]) -> Tuple[bool, float, str]:
+    """
+    Задание службы: конвертация во временный каталог outbox и публикация его
+    переименованием в out_dir, так что в outbox не бывает недописанных файлов.
+    """
+    staging = tempfile.mkdtemp(prefix='.tmp-', dir=os.path.dirname(out_dir))
+    ok, elapsed, log = run_batch_job(paths._replace(out=os.path.join(staging, OUT_DB)), chunk_rows, False)
+    if ok:
+        try:
+            os.replace(staging, unique_path(os.path.dirname(out_dir), os.path.basename(out_dir)))
+            return ok, elapsed, log
+        except OSError as e:
+            ok, log = False, log + f"{type(e).__name__}: {e}\n"
+    shutil.rmtree(staging, ignore_errors=True)
+    return ok, elapsed, log
+
+def write_watch_status(path: str, status: dict):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(status, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+def requeue_work(work_dir: str, inbox: str):
+    # задания, прерванные прошлым запуском службы, возвращаются во входящий каталог
+    if not os.path.isdir(work_dir):
+        return
+    for name in sorted(os.listdir(work_dir)):
+        os.rename(os.path.join(work_dir, name), unique_path(inbox, name))
+        print(f"[watch] Возвращён в очередь: {name}")
+
+def watch_inbox(inbox: str, outbox: str, jobs: int, chunk_rows: Optional[int] = None,
+                spool: Optional[str] = None, status_path: Optional[str] = None,
+                poll: float = WATCH_POLL_SECONDS, settle: float = WATCH_SETTLE_SECONDS,
+                retries: int = WATCH_RETRIES, stop: Optional[threading.Event] = None):
+    """
+    Служба: опрашивает inbox, готовые архивы ставит в очередь пула из jobs процессов.
+    Очередь, выполняемые задания и задержка каждого (от обнаружения до публикации)
+    пишутся в status_path (JSON, обновляется атомарно на каждом шаге).
+    Неудачное задание повторяется через WATCH_RETRY_DELAY_SECONDS, после retries
+    попыток набор уходит в spool/quarantine вместе с error.log.
+    Если рабочий процесс погиб (segfault, OOM, os._exit), пул пересоздаётся. Задание,
+    которое выполнялось одно, сразу уходит в карантин; если их было несколько, виновник
+    неизвестен, и каждое из них перезапускается отдельно от остальных.
+    Останавливается по SIGINT/SIGTERM (или stop): новые задания не берутся,
+    выполняемые дорабатываются.
+    """
+    spool = spool or os.path.join(outbox, '.spool')
+    status_path = status_path or os.path.join(outbox, 'status.json')
+    work_dir, done_dir, quarantine_dir = (os.path.join(spool, d) for d in ('work', 'done', 'quarantine'))
+    for directory in (inbox, outbox, work_dir, done_dir, quarantine_dir):
+        os.makedirs(directory, exist_ok=True)
+    requeue_work(work_dir, inbox)
+
+    stop = stop or threading.Event()
+    if threading.current_thread() is threading.main_thread():
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: stop.set())
+
+    settings = worker_settings()
+    pending: Dict[str, Tuple[tuple, float]] = {}
+    queued: List[dict] = []      # ждут свободного процесса или повторной попытки
+    running: Dict[object, dict] = {}
+    history: List[dict] = []
+    counters = {'done': 0, 'failed_attempts': 0, 'quarantined': 0, 'worker_crashes': 0}
+    started_at = datetime.datetime.now().isoformat(timespec='seconds')
+    print(f"[watch] Каталог {inbox}, результаты в {outbox}, процессов: {jobs}")
+
+    def publish_status():
+        now = time.monotonic()
+        write_watch_status(status_path, {
+            'pid': os.getpid(),
+            'started_at': started_at,
+            'stopping': stop.is_set(),
+            'queue_depth': len(queued),
+            'running': [{'name': job['name'], 'attempt': job['attempts'],
+                         'seconds': round(now - job['started'], 3)} for job in running.values()],
+            **counters,
+            'recent': history[-WATCH_HISTORY:],
+        })
+
+    def finish(job: dict, ok: bool, elapsed: float, log: str, quarantine: bool = False):
+        now = time.monotonic()
+        record = {'name': job['name'], 'attempt': job['attempts'], 'ok': ok,
+                  'convert_seconds': round(elapsed, 3), 'latency_seconds': round(now - job['detected'], 3),
+                  'finished_at': datetime.datetime.now().isoformat(timespec='seconds')}
+        if ok:
+            counters['done'] += 1
+            os.rename(job['dir'], unique_path(done_dir, job['name']))
+            print(f"[ok] {job['name']}: {elapsed:.2f} с, задержка {record['latency_seconds']:.2f} с")
+        elif job['attempts'] < retries and not quarantine:
+            counters['failed_attempts'] += 1
+            job['not_before'] = now + WATCH_RETRY_DELAY_SECONDS
+            queued.append(job)
+            record['retry'] = True
+            print(f"[retry] {job['name']}: попытка {job['attempts']} из {retries} неудачна")
+        else:
+            counters['failed_attempts'] += 1
+            counters['quarantined'] += 1
+            target = unique_path(quarantine_dir, job['name'])
+            os.rename(job['dir'], target)
+            with open(os.path.join(target, 'error.log'), 'w', encoding='utf-8') as f:
+                f.write(log)
+            record['quarantine'] = target
+            print(f"[quarantine] {job['name']}: {target}")
+        if not ok:
+            for line in log.rstrip().splitlines()[-10:]:
+                print(f"    {line}")
+        history.append(record)
+        del history[:-WATCH_HISTORY]
+
+    def new_pool() -> ProcessPoolExecutor:
+        # служба многопоточна (сигналы, вызов из потока): процессы не порождаются через fork.
+        # Процессы запускаются сразу все: порождённый по требованию (при втором задании)
+        # пул отслеживает только со следующего своего события, и его падение посреди
+        # долгого соседнего задания замечалось бы лишь по окончании того
+        pool = ProcessPoolExecutor(max_workers=max(1, jobs), mp_context=worker_context(),
+                                   initializer=warm_worker, initargs=(settings,))
+        for _ in as_completed([pool.submit(os.getpid) for _ in range(max(1, jobs))]):
+            pass
+        return pool
+
+    def collect():
+        # разбор завершившихся заданий; упавшие вместе с рабочим процессом — см. docstring
+        crashed = []
+        for future in [f for f in running if f.done()]:
+            job = running.pop(future)
+            try:
+                ok, elapsed, log = future.result()
+            except BrokenProcessPool:
+                crashed.append(job)
+                continue
+            except Exception as e:
+                ok, elapsed, log = False, time.monotonic() - job['started'], f"{type(e).__name__}: {e}\n"
+            finish(job, ok, elapsed, log)
+        if crashed:
+            counters['worker_crashes'] += 1
+            log = "BrokenProcessPool: рабочий процесс завершился аварийно во время задания\n"
+            if len(crashed) == 1:
+                job = crashed[0]
+                finish(job, False, time.monotonic() - job['started'], log, quarantine=True)
+            else:
+                for job in reversed(crashed):
+                    job['isolate'] = True
+                    queued.insert(0, job)
+                print(f"[crash] Рабочий процесс упал, задания перезапускаются по одному: "
+                      f"{', '.join(j['name'] for j in crashed)}")
+
+    pool = new_pool()
+    try:
+        while True:
+            broken = False
+            if not stop.is_set():
+                for name, paths in scan_inbox(inbox, pending, settle):
+                    try:
+                        job_dir, job_paths = claim_archive(name, paths, inbox, work_dir)
+                    except OSError as e:
+                        print(f"[warn] Не удалось забрать {name}: {e}")
+                        continue
+                    name = os.path.basename(job_dir)
+                    queued.append({'name': name, 'dir': job_dir, 'paths': job_paths, 'attempts': 0,
+                                   'detected': time.monotonic(), 'not_before': 0.0})
+                    print(f"[watch] В очереди: {name}")
+
+                now = time.monotonic()
+                for job in [j for j in queued if j['not_before'] <= now]:
+                    # задание после падения пула выполняется одно, пока не станет ясно, оно ли виновато
+                    if len(running) >= jobs or any(j.get('isolate') for j in running.values()):
+                        break
+                    if job.get('isolate') and running:
+                        break
+                    try:
+                        future = pool.submit(run_watch_job, job['paths'], os.path.join(outbox, job['name']), chunk_rows)
+                    except BrokenProcessPool:
+                        # пул сломался после прошлой проверки: задание остаётся в очереди
+                        broken = True
+                        break
+                    queued.remove(job)
+                    job['attempts'] += 1
+                    job['started'] = now
+                    running[future] = job
+
+            if broken or any(f.done() and isinstance(f.exception(), BrokenProcessPool) for f in running):
+                # сломанный пул завершает все свои задания: дожидаемся этого и разбираем их разом
+                pool.shutdown(wait=True)
+                broken = True
+            collect()
+            if broken:
+                pool = new_pool()
+                print("[watch] Пул рабочих процессов пересоздан")
+
+            publish_status()
+            if stop.is_set() and not running:
+                break
+            stop.wait(poll)
+    finally:
+        pool.shutdown(wait=True)
+
+    # незапущенные задания остаются в spool/work и берутся при следующем запуске
+    for job in queued:
+        print(f"[watch] Не обработан (остался в {work_dir}): {job['name']}")
+    publish_status()
+    print("[watch] Остановлено")
+
+# -----------------------------------------------------------
+# Проверка вывода: потоковое сравнение двух DBF и отпечаток файла для эталона.
+# Файлы читаются через mmap блоками по DIFF_BLOCK_ROWS записей, целиком в память не загружаются.
+
+DIFF_BLOCK_ROWS = 65536
+# Смещения даты последнего изменения в заголовке dBase III: в отпечаток не входят
+DBF_HEADER_DATE = slice(1, 4)
+
+def dbf_text_encoding(mm) -> str:
+    # кодировка по байту языкового драйвера (как его пишет build_dbf_header или синоним из входных файлов)
+    drivers = {**DBF_LANGUAGE_DRIVER_ALIASES, **{code: name for name, code in DBF_LANGUAGE_DRIVERS.items()}}
+    return drivers.get(mm[29], ENCODING_OUT) if len(mm) > 29 else ENCODING_OUT
+
+def dbf_digest(path: str) -> str:
+    """
+    SHA-256 DBF-файла без даты изменения в заголовке: два прогона конвертера
+    в разные дни с одинаковым результатом дают одинаковый отпечаток.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fh:
+        head = bytearray(fh.read(32))
+        head[DBF_HEADER_DATE] = bytes(len(head[DBF_HEADER_DATE]))
+        digest.update(head)
+        for block in iter(lambda: fh.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def diff_dbf_headers(a: DbfHeader, b: DbfHeader, encoding_a: str, encoding_b: str) -> List[str]:
+    lines = []
+    if a.version != b.version:
+        lines.append(f"версия: {a.version:#04x} != {b.version:#04x}")
+    if encoding_a != encoding_b:
+        lines.append(f"кодировка: {encoding_a} != {encoding_b}")
+    if a.record_count != b.record_count:
+        lines.append(f"число записей: {a.record_count} != {b.record_count}")
+    fields_a = {f.name: f for f in a.fields}
+    fields_b = {f.name: f for f in b.fields}
+    for f in a.fields:
+        other = fields_b.get(f.name)
+        if other is None:
+            lines.append(f"поле {f.name}: только в первом файле")
+        elif (f.type, f.length, f.decimals) != (other.type, other.length, other.decimals):
+            lines.append(f"поле {f.name}: {f.type}({f.length},{f.decimals}) != "
+                         f"{other.type}({other.length},{other.decimals})")
+    for f in b.fields:
+        if f.name not in fields_a:
+            lines.append(f"поле {f.name}: только во втором файле")
+    if [f.name for f in a.fields if f.name in fields_b] != [f.name for f in b.fields if f.name in fields_a]:
+        lines.append("порядок полей различается")
+    return lines
+
+def padded_field(records: np.ndarray, field: DbfField, width: int) -> np.ndarray:
+    # байты поля, дополненные пробелами до width: значения разной ширины сравниваются без strip
+    block = records[:, field.offset:field.offset + field.length]
+    if field.length == width:
+        return block
+    out = np.full((len(records), width), 0x20, dtype=np.uint8)
+    out[:, :field.length] = block
+    return out
+
+def diff_dbf(path_a: str, path_b: str, limit: int = 20) -> int:
+    """
+    Сравнение двух DBF: заголовки, затем записи по порядку блоками.
+    При одинаковой раскладке блоки сравниваются целиком, при разной — по общим полям
+    с выравниванием пробелами (ширины полей могут отличаться). Для первых limit
+    различающихся записей печатаются различающиеся поля; запись обозначается ROW_NUM,
+    если это поле есть, иначе номером. Возвращает число различий (заголовок + записи).
+    """
+    for path in (path_a, path_b):
+        if os.path.getsize(path) < 32:
+            print(f"[diff] {path}: не DBF-файл (меньше заголовка)")
+            return 1
+    with open(path_a, 'rb') as fa, open(path_b, 'rb') as fb, \
+            mmap.mmap(fa.fileno(), 0, access=mmap.ACCESS_READ) as mm_a, \
+            mmap.mmap(fb.fileno(), 0, access=mmap.ACCESS_READ) as mm_b:
+        encoding_a, encoding_b = dbf_text_encoding(mm_a), dbf_text_encoding(mm_b)
+        header_a, header_b = read_dbf_header(mm_a, encoding_a), read_dbf_header(mm_b, encoding_b)
+        header_lines = diff_dbf_headers(header_a, header_b, encoding_a, encoding_b)
+        for line in header_lines:
+            print(f"[diff] заголовок: {line}")
+
+        n_a = max(len(mm_a) - header_a.header_length, 0) // max(header_a.record_length, 1)
+        n_b = max(len(mm_b) - header_b.header_length, 0) // max(header_b.record_length, 1)
+        n_a, n_b = min(n_a, header_a.record_count), min(n_b, header_b.record_count)
+        fields_b = {f.name: f for f in header_b.fields}
+        common = [(f, fields_b[f.name]) for f in header_a.fields if f.name in fields_b]
+        same_layout = [(f.name, f.type, f.length) for f in header_a.fields] == \
+                      [(f.name, f.type, f.length) for f in header_b.fields]
+        key_field = next((pair for pair in common if pair[0].name == 'ROW_NUM'), None)
+
+        differing = 0
+        shown = 0
+        for start in range(0, min(n_a, n_b), DIFF_BLOCK_ROWS):
+            stop = min(start + DIFF_BLOCK_ROWS, n_a, n_b)
+            rec_a = dbf_record_block(mm_a, header_a, start, stop)
+            rec_b = dbf_record_block(mm_b, header_b, start, stop)
+            if same_layout:
+                row_mask = (rec_a != rec_b).any(axis=1)
+            else:
+                row_mask = rec_a[:, 0] != rec_b[:, 0]
+                for f_a, f_b in common:
+                    width = max(f_a.length, f_b.length)
+                    row_mask |= (padded_field(rec_a, f_a, width) != padded_field(rec_b, f_b, width)).any(axis=1)
+            rows = np.flatnonzero(row_mask)
+            differing += len(rows)
+            for row in rows[:max(0, limit - shown)]:
+                shown += 1
+                key = f"#{start + row + 1}"
+                if key_field is not None:
+                    raw = bytes(rec_a[row, key_field[0].offset:key_field[0].offset + key_field[0].length])
+                    key = f"ROW_NUM {raw.decode(encoding_a).strip()} ({key})"
+                print(f"[diff] запись {key}:")
+                if rec_a[row, 0] != rec_b[row, 0]:
+                    print(f"    флаг удаления: {bytes([rec_a[row, 0]])!r} != {bytes([rec_b[row, 0]])!r}")
+                for f_a, f_b in common:
+                    value_a = bytes(rec_a[row, f_a.offset:f_a.offset + f_a.length]).decode(encoding_a).rstrip()
+                    value_b = bytes(rec_b[row, f_b.offset:f_b.offset + f_b.length]).decode(encoding_b).rstrip()
+                    if value_a != value_b:
+                        print(f"    {f_a.name}: {value_a!r} != {value_b!r}")
+        # представления записей держат mmap открытым
+        rec_a = rec_b = None
+
+    if n_a != n_b:
+        print(f"[diff] записей только в {'первом' if n_a > n_b else 'втором'} файле: {abs(n_a - n_b)}")
+    differing += abs(n_a - n_b)
+    if shown < differing - abs(n_a - n_b):
+        print(f"[diff] ... показано {shown} из {differing - abs(n_a - n_b)} различающихся записей")
+    total = len(header_lines) + differing
+    print(f"[diff] {'различий нет' if total == 0 else f'различий: {total}'}")
+    return total
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Конвертация NKVD01..06 в формат Kronos")
+    parser.add_argument('--chunk-rows', type=int, default=None,
+                        help="потоковый режим: читать и обрабатывать NKVD01 блоками по N записей")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="число процессов для обработки NKVD01 (по умолчанию 1)")
+    parser.add_argument('--incremental', action='store_true',
+                        help="инкрементальный режим: преобразовать только новые и изменённые записи")
+    parser.add_argument('--batch', nargs='+', metavar='DIR',
+                        help="пакетный режим: каталоги или glob-шаблоны каталогов с архивами NKVD01..06")
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                        help="пакетный режим: сколько архивов конвертировать одновременно")
+    parser.add_argument('--watch', metavar='INBOX',
+                        help="режим службы: забирать архивы NKVD01..06 из INBOX по мере поступления")
+    parser.add_argument('--outbox', metavar='DIR',
+                        help="режим службы: каталог результатов (по умолчанию INBOX/../outbox)")
+    parser.add_argument('--spool', metavar='DIR',
+                        help="режим службы: рабочие каталоги work/done/quarantine (по умолчанию OUTBOX/.spool)")
+    parser.add_argument('--status', metavar='FILE',
+                        help="режим службы: файл состояния JSON (по умолчанию OUTBOX/status.json)")
+    parser.add_argument('--retries', type=int, default=WATCH_RETRIES,
+                        help="режим службы: попыток на архив до переноса в quarantine")
+    parser.add_argument('--diff', nargs=2, metavar=('OLD', 'NEW'),
+                        help="сравнить два выходных DBF по записям (код выхода 1 при различиях)")
+    parser.add_argument('--diff-limit', type=int, default=20,
+                        help="сколько различающихся записей показывать подробно (по умолчанию 20)")
+    parser.add_argument('--digest', nargs='+', metavar='FILE',
+                        help="отпечаток SHA-256 DBF-файлов без даты в заголовке")
+    parser.add_argument('--expect', metavar='SHA256',
+                        help="для --digest: ожидаемый отпечаток эталона (код выхода 1 при несовпадении)")
+    parser.add_argument('--engine', choices=('auto', 'lean', 'pandas'), default=ENGINE,
+                        help="движок конвертации в памяти: lean — без pandas (быстрый запуск на малых архивах), "
+                             f"pandas — колоночный, auto — lean, если в архиве не больше {LEAN_MAX_ROWS} записей")
+    parser.add_argument('--sink', action='append', default=[], metavar='FORMAT[=PATH]',
+                        help="дополнительный выход в том же проходе: parquet, csv или arrow; PATH по умолчанию — "
+                             "NKVD01_new с суффиксом формата, относительный PATH — от каталога выходного DBF "
+                             "(можно указать несколько раз)")
+    parser.add_argument('--no-dbf', action='store_true',
+                        help="не писать выходной DBF, только выходы --sink")
+    parser.add_argument('--io-threads', type=int, default=IO_THREADS,
+                        help="потоки для одновременного чтения таблиц и записи вывода (1 — последовательно, "
+                             "по умолчанию — число ядер, но не больше 5)")
+    parser.add_argument('--cache-dir', metavar='DIR',
+                        help="кэшировать разобранные входные таблицы и индексы NKVD03..06 в DIR (повторные запуски на тех же файлах)")
+    parser.add_argument('--cache-max-mb', type=int, default=INPUT_CACHE_MAX_BYTES // 1024 ** 2,
+                        help="предельный размер кэша, старые записи вытесняются (по умолчанию 2048)")
+    parser.add_argument('--on-overflow', choices=('error', 'truncate'), default=OUTPUT_OVERFLOW,
+                        help="значение длиннее поля выходного DBF: прервать запись (error) "
+                             "или обрезать с отчётом (truncate)")
+    parser.add_argument('--metrics', metavar='FILE',
+                        help="дописать в FILE (JSONL) замеры этапов: время, CPU, строки, пиковая память")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="для --metrics: пик памяти этапов через tracemalloc (заметно замедляет работу)")
+    parser.add_argument('--profile', metavar='FILE',
+                        help="сохранить cProfile всего запуска в FILE (формат pstats)")
+    args = parser.parse_args(argv)
+    sinks = []
+    for value in args.sink:
+        name, _, path = value.partition('=')
+        if name not in OUTPUT_SINKS:
+            parser.error(f"--sink: неизвестный формат {name!r} (есть: {', '.join(OUTPUT_SINKS)})")
+        if name in ('parquet', 'arrow'):
+            try:
+                require_pyarrow()
+            except RuntimeError as e:
+                parser.error(f"--sink {name}: {e}")
+        sinks.append((name, path or None))
+    args.sink = sinks
+    if args.no_dbf and not sinks:
+        parser.error("--no-dbf: не задан ни один выход --sink")
+    if args.incremental and (sinks or args.no_dbf):
+        parser.error("--sink и --no-dbf не поддерживаются в инкрементальном режиме")
+    if (args.batch or args.watch) and any(path and os.path.isabs(path) for _, path in sinks):
+        # у каждого архива свой выходной каталог; общий абсолютный путь перезаписывался бы каждым заданием
+        parser.error("--sink FORMAT=PATH: в пакетном режиме и режиме службы PATH должен быть относительным "
+                     "(от каталога выходного DBF каждого архива)")
+    return args
+
+def run_mode(args: argparse.Namespace) -> str:
+    if args.watch:
+        return 'watch'
+    if args.batch:
+        return 'batch'
+    if args.incremental:
+        return 'incremental'
+    if args.workers > 1:
+        return 'parallel'
+    return 'streaming' if args.chunk_rows else 'in_memory'
+
+def main(argv: Optional[List[str]] = None):
+    global INPUT_CACHE_DIR, INPUT_CACHE_MAX_BYTES, OUTPUT_OVERFLOW, IO_THREADS, ENGINE, SINK_TARGETS, WRITE_DBF
+    args = parse_args(argv)
+    if args.diff:
+        sys.exit(1 if diff_dbf(*args.diff, limit=args.diff_limit) else 0)
+    if args.digest:
+        mismatched = 0
+        for path in args.digest:
+            digest = dbf_digest(path)
+            mismatched += bool(args.expect) and digest != args.expect.strip().lower()
+            print(f"{digest}  {path}")
+        if args.expect:
+            print(f"[digest] {'совпадает с эталоном' if not mismatched else f'не совпадает с эталоном: {mismatched}'}")
+        sys.exit(1 if mismatched else 0)
+    OUTPUT_OVERFLOW = args.on_overflow
+    IO_THREADS = args.io_threads
+    ENGINE = args.engine
+    SINK_TARGETS = args.sink
+    WRITE_DBF = not args.no_dbf
+    if args.cache_dir:
+        INPUT_CACHE_DIR = os.path.abspath(args.cache_dir)
+        INPUT_CACHE_MAX_BYTES = args.cache_max_mb * 1024 ** 2
+    mode = run_mode(args)
+    failed = 0
+    with run_instrumentation(args.metrics, args.profile, args.trace_memory, mode):
+        if args.watch:
+            outbox = args.outbox or os.path.join(os.path.dirname(os.path.abspath(args.watch)), 'outbox')
+            watch_inbox(args.watch, outbox, args.jobs, chunk_rows=args.chunk_rows, spool=args.spool,
+                        status_path=args.status, retries=args.retries)
+        elif args.batch:
+            failed = convert_batch(args.batch, args.jobs, chunk_rows=args.chunk_rows, incremental=args.incremental)
+        elif args.incremental:
+            convert_incremental()
+        elif args.workers > 1:
+            convert_parallel(args.workers, args.chunk_rows)
+        elif args.chunk_rows:
+            convert_streaming(args.chunk_rows)
+        else:
+            convert_archive()
+    if args.watch:
+        return
+    if args.batch:
+        sys.exit(1 if failed else 0)
     print(f"[ok] Pipeline завершён успешно. Записано полей: {columns_to_keep}")
 
 # -----------------------------------------------------------
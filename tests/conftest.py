@@ -0,0 +1,39 @@
+"""
+Общие данные тестов: синтетический архив из benchmarks/generate_archive.py
+(те же «грязные» пулы значений, что в живых архивах) и NKVD01 из него.
+"""
+import os
+import shutil
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+sys.path.insert(0, ROOT)
+
+import main  # noqa: E402
+from generate_archive import generate_archive  # noqa: E402
+
+ARCHIVE_ROWS = 3000
+
+@pytest.fixture(scope='session')
+def archive(tmp_path_factory) -> main.ArchivePaths:
+    return generate_archive(str(tmp_path_factory.mktemp('archive')), ARCHIVE_ROWS, fanout=1.5, seed=7)
+
+@pytest.fixture(scope='session')
+def nkvd01(archive):
+    return read_table(archive.nkvd01)
+
+def read_table(path: str):
+    return main.read_dbf_with_all_records(path, encoding=main.ENCODING_IN)
+
+def truncated_archive(archive: main.ArchivePaths, directory: str, missing: int) -> main.ArchivePaths:
+    # копия архива, в NKVD01 которого недописаны последние missing записей (счётчик в заголовке прежний)
+    paths = main.archive_paths(directory)
+    for src, dst in zip(archive[:-1], paths[:-1]):
+        shutil.copyfile(src, dst)
+    header = main.read_dbf_file_header(paths.nkvd01)
+    with open(paths.nkvd01, 'r+b') as f:
+        f.truncate(header.header_length + (header.record_count - missing) * header.record_length)
+    return paths
@@ -0,0 +1,101 @@
+"""
+Агрегаты SFE/LIN/LI2 (aggregate_child_values + lookup_child_values) против исходных
+словарей str(P99999) -> список значений и join_unique_preserve_order на каждую запись.
+"""
+import random
+
+import numpy as np
+import pandas as pd
+
+import main
+from conftest import read_table
+
+
+def reference_multi(child: pd.DataFrame, candidates) -> dict:
+    multi = {}
+    for _, row in child.iterrows():
+        key = str(row.get('P99999', '')).strip()
+        value = None
+        for candidate in candidates:
+            value = row.get(candidate)
+            if value is not None:
+                break
+        if value is None or pd.isna(value) or str(value).strip() == '':
+            continue
+        multi.setdefault(key, []).append(str(value).strip())
+    return multi
+
+
+def reference_values(multi: dict, row_nums, separator: str, normalize_lin: bool = False) -> list:
+    out = []
+    for row_num in row_nums:
+        values = multi.get(str(row_num), [])
+        if normalize_lin:
+            values = [main.normalize_lin_value(v) for v in values]
+            values = [v for v in values if v != '']
+        out.append(main.join_unique_preserve_order(values, separator) if values else '')
+    return out
+
+
+def joined_values(index, row_nums, separator: str) -> list:
+    return list(main.lookup_child_values(index, main.integer_join_key(pd.Series(row_nums)), separator))
+
+
+def test_archive_matches_row_wise_join(archive, nkvd01):
+    row_nums = list(range(1, len(nkvd01) + 1))
+    nkvd04, nkvd05, nkvd06 = (read_table(p) for p in (archive.nkvd04, archive.nkvd05, archive.nkvd06))
+    assert joined_values(main.build_nkvd04_multi(nkvd04), row_nums, main.SFE_SEPARATOR) == \
+        reference_values(reference_multi(nkvd04, ['SFE']), row_nums, main.SFE_SEPARATOR)
+    assert joined_values(main.build_nkvd05_multi(nkvd05), row_nums, main.LIN_SEPARATOR) == \
+        reference_values(reference_multi(nkvd05, ['LIN']), row_nums, main.LIN_SEPARATOR, normalize_lin=True)
+    assert joined_values(main.build_nkvd06_multi(nkvd06), row_nums, main.LI2_SEPARATOR) == \
+        reference_values(reference_multi(nkvd06, main.LI2_CANDIDATES), row_nums, main.LI2_SEPARATOR)
+
+
+def fuzzed_child(rng: random.Random, column: str, pool) -> pd.DataFrame:
+    keys = [rng.choice([1, 2, 3, 5, 8, 13, -4, 0]) for _ in range(500)] + [' 2', '02', '2.0', '', None]
+    rng.shuffle(keys)
+    return pd.DataFrame({'P99999': pd.Series(keys, dtype=object),
+                         column: pd.Series([rng.choice(pool) for _ in keys], dtype=object)})
+
+
+def test_fuzzed_sfe_and_lin():
+    rng = random.Random(11)
+    row_nums = list(range(-5, 16))
+    sfe = fuzzed_child(rng, 'SFE', ['', ' ', None, np.nan, 'A1', ' A1 ', 'B2', 'ВВ', 1.5, 2])
+    assert joined_values(main.build_nkvd04_multi(sfe), row_nums, main.SFE_SEPARATOR) == \
+        reference_values(reference_multi(sfe, ['SFE']), row_nums, main.SFE_SEPARATOR)
+    lin = fuzzed_child(rng, 'LIN', ['', None, '33', '045', '44', '57', '012', '7', '0', 'x', '100', 33, 45.0])
+    assert joined_values(main.build_nkvd05_multi(lin), row_nums, main.LIN_SEPARATOR) == \
+        reference_values(reference_multi(lin, ['LIN']), row_nums, main.LIN_SEPARATOR, normalize_lin=True)
+
+
+def test_li2_candidate_columns():
+    rng = random.Random(5)
+    row_nums = list(range(0, 15))
+    for column in main.LI2_CANDIDATES:
+        child = fuzzed_child(rng, column, ['', '01', '02', 'zz', None])
+        assert joined_values(main.build_nkvd06_multi(child), row_nums, main.LI2_SEPARATOR) == \
+            reference_values(reference_multi(child, main.LI2_CANDIDATES), row_nums, main.LI2_SEPARATOR), column
+
+
+
+def test_unparsed_keys_are_reported_and_skipped(tmp_path, capsys):
+    # нецелые и не помещающиеся в int64 ключи считаются, печатаются строкой [warn] и в вывод не попадают
+    big = str(10 ** 18)
+    child = pd.DataFrame({'P99999': ['1', 'abc', '2.5', big, '1' * 25, ' 3 ', '', '-0'],
+                          'SFE': ['A1', 'X1', 'X2', 'X3', 'X4', 'B2', 'X5', 'X6']})
+    path = str(tmp_path / 'NKVD04.DBF')
+    main.write_dbf(child, path, encoding=main.ENCODING_IN, schema=[('P99999', 25), ('SFE', 10)])
+    index = main.load_child_index(path, 'NKVD04', main.build_nkvd04_multi)
+    warnings = [line for line in capsys.readouterr().out.splitlines() if line.startswith('[warn]')]
+    assert warnings == ["[warn] NKVD04: 5 записей с P99999, который не является целым числом (в выход не попадают), "
+                        f"например: ['abc', '2.5', '{big}', '{'1' * 25}', '-0']"]
+    assert joined_values(index, [1, 2, 3, 10 ** 18, 0], main.SFE_SEPARATOR) == ['A1', '', 'B2', '', '']
+
+    # числовое поле: за пределами 18 знаков ключа нет
+    numeric = pd.DataFrame({'P99999': np.array([1, 10 ** 18, -10 ** 18, 5], dtype=np.int64),
+                            'SFE': ['A1', 'X1', 'X2', 'B2']})
+    index = main.build_nkvd04_multi(numeric)
+    assert (index.unparsed, index.unparsed_samples) == (2, [big, str(-10 ** 18)])
+    assert list(index.keys) == [1, 5]
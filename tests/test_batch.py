@@ -0,0 +1,37 @@
+"""
+Пакетный режим (--batch): архивы конвертируются в пуле процессов так же, как по одному.
+"""
+import os
+import shutil
+import threading
+import warnings
+
+import main
+
+
+def test_batch_matches_single_archive(archive, tmp_path, capsys):
+    single = archive._replace(out=str(tmp_path / 'single.DBF'))
+    main.convert_in_memory(single)
+    for name in ('a', 'b'):
+        os.makedirs(tmp_path / 'batch' / name)
+        for path in archive[:-1]:
+            shutil.copy(path, tmp_path / 'batch' / name)
+    # у родителя есть живой поток: процессы пула не должны порождаться через fork
+    release = threading.Event()
+    thread = threading.Thread(target=release.wait)
+    thread.start()
+    try:
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always', DeprecationWarning)
+            failed = main.convert_batch([str(tmp_path / 'batch' / '*')], jobs=2)
+    finally:
+        release.set()
+        thread.join()
+    capsys.readouterr()
+    assert failed == 0
+    assert not [w for w in caught if 'fork()' in str(w.message)]
+    with open(single.out, 'rb') as f:
+        expected = f.read()[4:]
+    for name in ('a', 'b'):
+        with open(tmp_path / 'batch' / name / main.OUT_DB, 'rb') as f:
+            assert f.read()[4:] == expected
@@ -0,0 +1,31 @@
+"""
+benchmarks/run_benchmarks.py: без baseline сравнение завершается с ошибкой,
+а не считается пройденным.
+"""
+import json
+
+import run_benchmarks
+
+
+def bench(tmp_path, *extra) -> int:
+    return run_benchmarks.main_bench(['--rows', '300', '--repeat', '1', '--archive-dir', str(tmp_path / 'archive'),
+                                      '--baseline', str(tmp_path / 'baseline.json'), *extra])
+
+
+def test_missing_baseline_fails(tmp_path, capsys):
+    assert bench(tmp_path) == 2
+    assert '[bench] Baseline не найден' in capsys.readouterr().out
+    assert not (tmp_path / 'archive').exists()
+    assert bench(tmp_path, '--report-only') == 0
+
+
+def test_compare_with_saved_baseline(tmp_path, capsys):
+    assert bench(tmp_path, '--save-baseline') == 0
+    assert bench(tmp_path, '--threshold', '1000') == 0
+    with open(tmp_path / 'baseline.json', encoding='utf-8') as f:
+        baseline = json.load(f)
+    baseline['total_seconds'] /= 100
+    with open(tmp_path / 'baseline.json', 'w', encoding='utf-8') as f:
+        json.dump(baseline, f)
+    assert bench(tmp_path) == 1
+    assert '[regression] total:' in capsys.readouterr().out
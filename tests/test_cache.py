@@ -0,0 +1,127 @@
+"""
+Кэш входных таблиц и индексов дочерних таблиц (--cache-dir): повторное чтение берётся
+из кэша, изменение исходного файла его сбрасывает, сверх INPUT_CACHE_MAX_BYTES
+вытесняются записи с самым старым использованием (mtime meta.json).
+"""
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import main
+
+
+@pytest.fixture
+def paths(archive, tmp_path, monkeypatch) -> main.ArchivePaths:
+    monkeypatch.setattr(main, 'INPUT_CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(main, 'INPUT_CACHE_MAX_BYTES', 2 * 1024 ** 3)
+    copy = main.archive_paths(str(tmp_path))
+    for src, dst in zip(archive[:-1], copy[:-1]):
+        shutil.copyfile(src, dst)
+    return copy
+
+
+def read(path: str, capsys):
+    df, raw_text = main.read_dbf_cached(path, main.PASSTHROUGH_FIELDS)
+    return df, raw_text, '[cache]' in capsys.readouterr().out
+
+
+def assert_same_table(a, b):
+    pd.testing.assert_frame_equal(a[0], b[0])
+    assert a[1].keys() == b[1].keys()
+    for name in a[1]:
+        assert np.array_equal(a[1][name], b[1][name])
+
+
+def overwrite_field(path: str, row: int, field: str, value: str):
+    header = main.read_dbf_file_header(path)
+    spec = next(f for f in header.fields if f.name == field)
+    with open(path, 'r+b') as f:
+        f.seek(header.header_length + row * header.record_length + spec.offset)
+        f.write(value.ljust(spec.length).encode(main.ENCODING_IN))
+
+
+def test_table_hit(paths, capsys):
+    expected = main.read_dbf_passthrough(paths.nkvd01, main.PASSTHROUGH_FIELDS)
+    first = read(paths.nkvd01, capsys)
+    second = read(paths.nkvd01, capsys)
+    assert not first[2] and second[2]
+    assert_same_table(first[:2], expected)
+    assert_same_table(second[:2], expected)
+
+
+def test_changed_source_is_reread(paths, capsys):
+    read(paths.nkvd04, capsys)
+    # только отметка времени: запись кэша устарела, данные те же
+    st = os.stat(paths.nkvd04)
+    os.utime(paths.nkvd04, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    df, _, hit = read(paths.nkvd04, capsys)
+    assert not hit
+    assert read(paths.nkvd04, capsys)[2]
+
+    overwrite_field(paths.nkvd04, 0, 'SFE', 'ИЗМЕНЕНО')
+    df, _, hit = read(paths.nkvd04, capsys)
+    assert not hit and df['SFE'].iloc[0].strip() == 'ИЗМЕНЕНО'
+    # та же длина и mtime, но другой заголовок (описание полей)
+    header = main.read_dbf_file_header(paths.nkvd04)
+    st = os.stat(paths.nkvd04)
+    with open(paths.nkvd04, 'r+b') as f:
+        f.seek(32 + 11)
+        f.write(b'N' if header.fields[0].type != 'N' else b'C')
+    os.utime(paths.nkvd04, ns=(st.st_atime_ns, st.st_mtime_ns))
+    key = main.dbf_cache_key(paths.nkvd04, main.ENCODING_IN, main.PASSTHROUGH_FIELDS)
+    assert main.load_cached_table(main.dbf_cache_entry(key), key) is None
+
+
+def test_lru_eviction(paths, capsys, monkeypatch):
+    tables = [paths.nkvd03, paths.nkvd04, paths.nkvd05, paths.nkvd06]
+    entries, sizes = [], []
+    for path in tables:
+        read(path, capsys)
+        key = main.dbf_cache_key(path, main.ENCODING_IN, main.PASSTHROUGH_FIELDS)
+        entries.append(main.dbf_cache_entry(key))
+        sizes.append(main.cache_entry_size(entries[-1]))
+    shutil.rmtree(entries[3])
+    # 03 создан раньше всех, но использован последним: вытесняется 04
+    now = time.time()
+    for age, entry in zip((300, 200, 100), entries[:3]):
+        os.utime(os.path.join(entry, 'meta.json'), (now - age, now - age))
+    assert read(paths.nkvd03, capsys)[2]
+    monkeypatch.setattr(main, 'INPUT_CACHE_MAX_BYTES', sizes[0] + sizes[2] + sizes[3])
+    read(paths.nkvd06, capsys)
+    assert [os.path.exists(e) for e in entries] == [True, False, True, True]
+    assert read(paths.nkvd03, capsys)[2]
+    assert not read(paths.nkvd04, capsys)[2]
+
+
+def same_index(a: main.ChildIndex, b: main.ChildIndex) -> bool:
+    return (np.array_equal(a.keys, b.keys) and np.array_equal(a.offsets, b.offsets)
+            and a.codes.keys() == b.codes.keys()
+            and all(np.array_equal(a.codes[n], b.codes[n]) for n in a.codes)
+            and all(list(a.values[n]) == list(b.values[n]) for n in a.values)
+            and (a.unparsed, a.unparsed_samples) == (b.unparsed, b.unparsed_samples))
+
+
+def index_hits(log: str) -> list:
+    return sorted(line.split()[-4] for line in log.splitlines() if 'взят из кэша' in line)
+
+
+def test_child_index_cache(paths, capsys, monkeypatch):
+    first = main.load_child_indexes(paths)
+    assert index_hits(capsys.readouterr().out) == []
+    second = main.load_child_indexes(paths)
+    assert index_hits(capsys.readouterr().out) == ['NKVD03', 'NKVD04', 'NKVD05', 'NKVD06']
+    assert all(same_index(a, b) for a, b in zip(first, second))
+
+    overwrite_field(paths.nkvd05, 0, 'LIN', '77')
+    third = main.load_child_indexes(paths)
+    assert index_hits(capsys.readouterr().out) == ['NKVD03', 'NKVD04', 'NKVD06']
+    assert not same_index(third[2], first[2])
+
+    # другая версия правил индексов: все строятся заново
+    monkeypatch.setattr(main, 'CONVERTER_VERSION', main.CONVERTER_VERSION + '-next')
+    main.load_child_indexes(paths)
+    assert index_hits(capsys.readouterr().out) == []
@@ -0,0 +1,50 @@
+"""
+combine_date_columns (сборка дат по уникальным тройкам) против построчного
+combine_date_parts, как его вызывал df.apply(axis=1).
+"""
+import random
+
+import numpy as np
+import pandas as pd
+
+import main
+
+# части дат в том виде, в каком их отдают ридеры: строки C-полей, числа N-полей
+# (float с NaN, если в колонке есть пустые), None
+PART_POOL = ['', ' ', None, np.nan, '0', '00', '1', '01', ' 7 ', '12', '13', '31', '32', 'x', '1a',
+             '17', '99', '017', '2017', '1999', '20170', 5, 12, 2017, 5.0, 31.0, 2017.0]
+
+
+def reference_dates(df: pd.DataFrame, fields) -> list:
+    # в NKVD01 всегда есть текстовые колонки, поэтому строка apply — object и числа не приводятся к float
+    return df.astype(object).apply(lambda row: main.combine_date_parts(fields, row), axis=1).tolist()
+
+
+def test_archive_dates_match_combine_date_parts(nkvd01):
+    for new_field, parts in {**main.DATE_GROUPS, **main.EXTRA_DATE_GROUPS}.items():
+        expected = reference_dates(nkvd01, parts)
+        assert main.combine_date_columns(nkvd01, parts).tolist() == expected, new_field
+
+
+def test_fuzzed_dates_match_combine_date_parts():
+    rng = random.Random(20)
+    fields = ['D1', 'D2', 'D3']
+    df = pd.DataFrame({f: [rng.choice(PART_POOL) for _ in range(5000)] for f in fields})
+    df.loc[len(df)] = ['', '', '']
+    assert main.combine_date_columns(df, fields).tolist() == reference_dates(df, fields)
+
+
+def test_numeric_date_columns():
+    # N-поля без пустых читаются как int, с пустыми — как float с NaN
+    fields = ['D1', 'D2', 'D3']
+    df = pd.DataFrame({'D1': [1, 15, 31, 0], 'D2': [2.0, np.nan, 12.0, 1.0], 'D3': [2017, 17, 1999, 5]})
+    assert main.combine_date_columns(df, fields).tolist() == reference_dates(df, fields)
+
+
+def test_missing_columns_are_blank():
+    df = pd.DataFrame({'D3': ['2017', '', None]})
+    assert main.combine_date_columns(df, ['D1', 'D2', 'D3']).tolist() == ['01.01.2017', '', '']
+
+
+def test_date_cache_is_bounded():
+    assert main.normalize_date_triple.cache_info().maxsize == main.DATE_TRIPLE_CACHE_SIZE
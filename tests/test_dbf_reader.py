@@ -0,0 +1,36 @@
+"""
+Нативный ридер DBF на недописанном файле: записи, которых нет в файле, добиваются
+пустыми до счётчика из заголовка, как в старом ридере.
+"""
+import warnings
+
+import main
+from conftest import ARCHIVE_ROWS, truncated_archive
+
+MISSING = 5
+
+
+def read_nkvd01(path: str, columns=None, passthrough=()):
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        df, _ = main.read_dbf_passthrough(path, passthrough, columns=columns)
+    return df
+
+
+def test_short_file_is_padded(archive, tmp_path):
+    short = truncated_archive(archive, str(tmp_path), MISSING)
+    kept = ARCHIVE_ROWS - MISSING
+    for columns in (None, main.NKVD01_SOURCE_FIELDS):
+        full = read_nkvd01(archive.nkvd01, columns)
+        # сырые байты на недописанном файле не отдаются: колонки декодируются
+        df = read_nkvd01(short.nkvd01, columns, main.PASSTHROUGH_FIELDS)
+        assert len(df) == ARCHIVE_ROWS
+        assert list(df.columns) == list(full.columns)
+        for name in df.columns:
+            col = df[name]
+            assert col.dtype != 'category', name
+            assert col.iloc[kept:].isna().all(), name
+            head = main.plain_column(full[name]).iloc[:kept]
+            assert [str(v) for v in col.iloc[:kept]] == [str(v) for v in head], name
+        # object-колонки добиваются None (как склейка с кадром из None), а не NaN
+        assert all(v is None for v in df['OVD'].iloc[kept:])
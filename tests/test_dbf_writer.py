@@ -0,0 +1,48 @@
+"""
+Запись DBF блоками записей (write_dbf) против библиотеки dbf (dbf.Table.append):
+файлы совпадают байт в байт, кроме даты в заголовке.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import main
+
+
+def file_bytes(path) -> bytes:
+    # без даты изменения в заголовке (байты 1..3)
+    with open(path, 'rb') as f:
+        data = f.read()
+    return data[:1] + data[4:]
+
+
+def sample_frame() -> pd.DataFrame:
+    return pd.DataFrame({
+        'ROW_NUM': [1, 2, 3, 4, 5],
+        'TXT': ['Щука', None, '  пробелы по краям  ', np.nan, 'ёЁ №'],
+        'NUM': [1.5, np.nan, 3.0, 10.0, -2.25],
+        'INT': pd.Series([7, None, 0, 12, None], dtype=object),
+        'EMPTY': [None] * 5,
+    })
+
+
+@pytest.mark.parametrize('encoding', ['cp1251', 'cp866'])
+@pytest.mark.parametrize('rows', [5, 1, 0])
+def test_matches_dbf_library(tmp_path, encoding, rows):
+    df = sample_frame().iloc[:rows]
+    specs = [('ROW_NUM', 10), ('TXT', 20), ('NUM', 10), ('INT', 10), ('EMPTY', 10)]
+    main.write_dbf(df, str(tmp_path / 'blocks.DBF'), encoding=encoding, schema=specs)
+    main.write_dbf_with_dbf_library(df, str(tmp_path / 'library.DBF'), encoding=encoding, field_specs=specs)
+    assert file_bytes(tmp_path / 'blocks.DBF') == file_bytes(tmp_path / 'library.DBF')
+
+
+def test_passthrough_bytes_match_dbf_library(tmp_path):
+    # сырые cp866-байты поля перекодируются таблицей и дают то же, что декодированный текст
+    values = ['Щука', '', 'ёЁ №', 'abc', 'Ящик']
+    raw = np.array([list(v.ljust(8).encode('cp866')) for v in values], dtype=np.uint8)
+    df = pd.DataFrame({'ROW_NUM': [1, 2, 3, 4, 5], 'NOM': np.arange(5)})
+    specs = [('ROW_NUM', 10), ('NOM', 8)]
+    main.write_dbf(df, str(tmp_path / 'blocks.DBF'), raw_text={'NOM': raw}, schema=specs)
+    decoded = pd.DataFrame({'ROW_NUM': [1, 2, 3, 4, 5], 'NOM': values})
+    main.write_dbf_with_dbf_library(decoded, str(tmp_path / 'library.DBF'), field_specs=specs)
+    assert file_bytes(tmp_path / 'blocks.DBF') == file_bytes(tmp_path / 'library.DBF')
@@ -0,0 +1,96 @@
+"""
+Проверка вывода: dbf_digest не зависит от даты в заголовке, diff_dbf называет
+различающуюся запись (ROW_NUM) и поле.
+"""
+import shutil
+
+import pandas as pd
+import pytest
+
+import main
+
+
+def sample_frame(rows: int = 10) -> pd.DataFrame:
+    return pd.DataFrame({'ROW_NUM': list(range(1, rows + 1)),
+                         'TXT': [f'значение {i}' for i in range(rows)],
+                         'VID': ['A', 'B'] * (rows // 2)})
+
+
+SPECS = [('ROW_NUM', 10), ('TXT', 20), ('VID', 10)]
+
+
+def write(path, df=None, specs=SPECS) -> str:
+    main.write_dbf(sample_frame() if df is None else df, str(path), schema=specs)
+    return str(path)
+
+
+def patch_field(path: str, row: int, field: str, value: str):
+    header = main.read_dbf_file_header(path)
+    spec = next(f for f in header.fields if f.name == field)
+    with open(path, 'r+b') as f:
+        f.seek(header.header_length + row * header.record_length + spec.offset)
+        f.write(value.ljust(spec.length).encode(main.ENCODING_OUT))
+
+
+def diff_lines(capsys) -> list:
+    return capsys.readouterr().out.splitlines()
+
+
+def test_digest_ignores_header_date(tmp_path):
+    a = write(tmp_path / 'a.DBF')
+    b = shutil.copyfile(a, tmp_path / 'b.DBF')
+    with open(b, 'r+b') as f:
+        f.seek(1)
+        f.write(bytes([99, 12, 31]))
+    with open(a, 'rb') as fa, open(b, 'rb') as fb:
+        assert fa.read() != fb.read()
+    assert main.dbf_digest(a) == main.dbf_digest(str(b))
+    patch_field(str(b), 9, 'VID', 'C')
+    assert main.dbf_digest(a) != main.dbf_digest(str(b))
+
+
+@pytest.mark.parametrize('block_rows', [65536, 3])
+def test_one_field_difference(tmp_path, capsys, monkeypatch, block_rows):
+    monkeypatch.setattr(main, 'DIFF_BLOCK_ROWS', block_rows)
+    a = write(tmp_path / 'a.DBF')
+    b = str(shutil.copyfile(a, tmp_path / 'b.DBF'))
+    with open(b, 'r+b') as f:
+        f.seek(1)
+        f.write(bytes([99, 12, 31]))
+    assert main.diff_dbf(a, b) == 0
+    assert diff_lines(capsys) == ['[diff] различий нет']
+
+    patch_field(b, 6, 'TXT', 'другое')
+    assert main.diff_dbf(a, b) == 1
+    assert diff_lines(capsys) == [
+        '[diff] запись ROW_NUM 7 (#7):',
+        "    TXT: 'значение 6' != 'другое'",
+        '[diff] различий: 1',
+    ]
+
+
+def test_different_widths_compare_values(tmp_path, capsys):
+    a = write(tmp_path / 'a.DBF')
+    b = write(tmp_path / 'b.DBF', specs=[('ROW_NUM', 10), ('TXT', 32), ('VID', 10)])
+    assert main.diff_dbf(a, b) == 1
+    assert diff_lines(capsys) == ['[diff] заголовок: поле TXT: C(20,0) != C(32,0)', '[diff] различий: 1']
+
+    df = sample_frame()
+    df.loc[3, 'VID'] = 'Z'
+    b = write(tmp_path / 'c.DBF', df, specs=[('ROW_NUM', 10), ('TXT', 32), ('VID', 10)])
+    assert main.diff_dbf(a, b) == 2
+    assert "    VID: 'B' != 'Z'" in diff_lines(capsys)
+
+
+def test_limit_and_missing_records(tmp_path, capsys):
+    a = write(tmp_path / 'a.DBF')
+    df = sample_frame(8)
+    df['VID'] = 'Q'
+    b = write(tmp_path / 'b.DBF', df)
+    assert main.diff_dbf(a, b, limit=2) == 1 + 8 + 2
+    lines = diff_lines(capsys)
+    assert [line for line in lines if line.startswith('[diff] запись')] == \
+        ['[diff] запись ROW_NUM 1 (#1):', '[diff] запись ROW_NUM 2 (#2):']
+    assert lines[-3:] == ['[diff] записей только в первом файле: 2',
+                          '[diff] ... показано 2 из 8 различающихся записей',
+                          '[diff] различий: 11']
@@ -0,0 +1,86 @@
+"""
+Инкрементальный режим (--incremental): после изменения исходных записей в выходном DBF
+переписываются только они, и результат совпадает со свежей полной конвертацией.
+"""
+import shutil
+
+import pytest
+
+import main
+from conftest import read_table
+
+
+def copy_archive(archive, directory) -> main.ArchivePaths:
+    paths = main.archive_paths(str(directory))
+    for src, dst in zip(archive[:-1], paths[:-1]):
+        shutil.copyfile(src, dst)
+    return paths
+
+
+def output_records(path: str) -> list:
+    header = main.read_dbf_file_header(path)
+    with open(path, 'rb') as f:
+        data = f.read()[header.header_length:header.header_length + header.record_count * header.record_length]
+    return [data[i:i + header.record_length] for i in range(0, len(data), header.record_length)]
+
+
+def set_child_value(path: str, field: str, value: str) -> int:
+    # значение поля в первой записи дочерней таблицы с ключом P99999 (на месте, в cp866); возвращает ключ
+    table = read_table(path)
+    position, key = next((i, int(v)) for i, v in enumerate(table['P99999']) if str(v).strip().isdigit())
+    header = main.read_dbf_file_header(path)
+    spec = next(f for f in header.fields if f.name == field)
+    with open(path, 'r+b') as f:
+        f.seek(header.header_length + position * header.record_length + spec.offset)
+        f.write(value.ljust(spec.length).encode(main.ENCODING_IN))
+    return key
+
+
+def fresh_digest(paths: main.ArchivePaths, directory) -> str:
+    fresh = paths._replace(out=str(directory / 'fresh.DBF'))
+    main.convert_in_memory(fresh)
+    return main.dbf_digest(fresh.out)
+
+
+@pytest.fixture
+def converted(archive, tmp_path, capsys) -> main.ArchivePaths:
+    paths = copy_archive(archive, tmp_path)
+    main.convert_incremental(paths)
+    assert 'Полная пересборка: манифест не найден' in capsys.readouterr().out
+    return paths
+
+
+def test_child_change_patches_one_record(converted, tmp_path, capsys):
+    before = output_records(converted.out)
+    key = set_child_value(converted.nkvd04, 'SFE', 'Изменено')
+    main.convert_incremental(converted)
+    log = capsys.readouterr().out
+    assert 'Инкрементально: изменено 1, добавлено 0' in log
+    assert 'Полная пересборка' not in log
+    after = output_records(converted.out)
+    assert [i for i, (a, b) in enumerate(zip(before, after)) if a != b] == [key - 1]
+    assert main.dbf_digest(converted.out) == fresh_digest(converted, tmp_path)
+
+
+def test_unchanged_archive_rewrites_nothing(converted, capsys):
+    digest = main.dbf_digest(converted.out)
+    main.convert_incremental(converted)
+    assert 'Инкрементально: изменено 0, добавлено 0' in capsys.readouterr().out
+    assert main.dbf_digest(converted.out) == digest
+
+
+def test_converter_version_forces_full_rebuild(converted, tmp_path, capsys, monkeypatch):
+    monkeypatch.setattr(main, 'CONVERTER_VERSION', main.CONVERTER_VERSION + '+test')
+    main.convert_incremental(converted)
+    assert 'Полная пересборка: изменилась версия конвертера или схема таблиц' in capsys.readouterr().out
+    assert main.dbf_digest(converted.out) == fresh_digest(converted, tmp_path)
+
+
+def test_output_schema_forces_full_rebuild(converted, tmp_path, capsys, monkeypatch):
+    schema = main.archive_output_schema
+    monkeypatch.setattr(main, 'archive_output_schema',
+                        lambda paths, items: [(n, w + 1 if n == 'OVD' else w) for n, w in schema(paths, items)])
+    set_child_value(converted.nkvd04, 'SFE', 'Изменено')
+    main.convert_incremental(converted)
+    assert 'Полная пересборка: изменилась версия конвертера или схема таблиц' in capsys.readouterr().out
+    assert main.dbf_digest(converted.out) == fresh_digest(converted, tmp_path)
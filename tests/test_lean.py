@@ -0,0 +1,71 @@
+"""
+Лёгкий движок (--engine lean): тот же результат, что у convert_in_memory, байт в байт;
+архивы, которые он не читает, конвертируются через pandas.
+"""
+import os
+
+import pytest
+
+import main
+from conftest import truncated_archive
+
+
+def convert(archive, out: str, engine: str, monkeypatch) -> str:
+    monkeypatch.setattr(main, 'ENGINE', engine)
+    main.convert_archive(archive._replace(out=out))
+    return main.dbf_digest(out)
+
+
+def test_lean_matches_pandas(archive, tmp_path, capsys, monkeypatch):
+    monkeypatch.setattr(main, 'SINK_TARGETS', [('csv', None)])
+    lean = convert(archive, str(tmp_path / 'lean.DBF'), 'lean', monkeypatch)
+    assert '[info] Лёгкий движок' in capsys.readouterr().out
+    assert lean == convert(archive, str(tmp_path / 'pandas.DBF'), 'pandas', monkeypatch)
+    with open(tmp_path / 'lean.csv', 'rb') as a, open(tmp_path / 'pandas.csv', 'rb') as b:
+        assert a.read() == b.read()
+
+
+def test_unreadable_archive_falls_back(archive, tmp_path, capsys, monkeypatch):
+    # недописанный NKVD01 лёгкий движок не читает: convert_lean ничего не пишет
+    short = truncated_archive(archive, str(tmp_path), 5)
+    assert main.convert_lean(short) is False
+    assert not os.path.exists(short.out)
+    lean = convert(short, str(tmp_path / 'lean.DBF'), 'lean', monkeypatch)
+    assert lean == convert(short, str(tmp_path / 'pandas.DBF'), 'pandas', monkeypatch)
+    capsys.readouterr()
+
+
+@pytest.mark.parametrize('engine', ['auto', 'lean'])
+def test_false_from_convert_lean_runs_pandas(archive, tmp_path, capsys, monkeypatch, engine):
+    calls = []
+    monkeypatch.setattr(main, 'convert_lean', lambda paths: calls.append(paths) or False)
+    monkeypatch.setattr(main, 'LEAN_MAX_ROWS', 10 ** 9)
+    digest = convert(archive, str(tmp_path / 'fallback.DBF'), engine, monkeypatch)
+    assert len(calls) == 1
+    assert digest == convert(archive, str(tmp_path / 'pandas.DBF'), 'pandas', monkeypatch)
+    capsys.readouterr()
+
+
+
+@pytest.mark.parametrize('gaps', [False, True])
+def test_numeric_pun_matches_pandas(archive, tmp_path, capsys, monkeypatch, gaps):
+    # PUN — числовое поле N: без пустых значений ридер даёт целые и в P*_PUNKT пишется '5',
+    # с пустыми — float, и пишется '5.0' (как str(PUN) в исходном построчном заполнении)
+    import dbf
+    paths = truncated_archive(archive, str(tmp_path), 0)
+    nkvd03 = main.read_dbf_with_all_records(paths.nkvd03, encoding=main.ENCODING_IN)
+    os.remove(paths.nkvd03)
+    table = dbf.Table(paths.nkvd03, 'P99999 N(6,0); STA C(4); ZNA C(3); CHA C(3); PUN N(3,0)',
+                      codepage=main.ENCODING_IN)
+    table.open(dbf.READ_WRITE)
+    for i, row in enumerate(nkvd03.itertuples()):
+        table.append((int(row.P99999), row.STA, row.ZNA, row.CHA, None if gaps and i % 5 == 0 else i % 7))
+    table.close()
+
+    lean = convert(paths, str(tmp_path / 'lean.DBF'), 'lean', monkeypatch)
+    assert '[info] Лёгкий движок' in capsys.readouterr().out
+    assert lean == convert(paths, str(tmp_path / 'pandas.DBF'), 'pandas', monkeypatch)
+    capsys.readouterr()
+    out = main.read_dbf_with_all_records(str(tmp_path / 'lean.DBF'), encoding=main.ENCODING_OUT)
+    values = set(out['P1_PUNKT'].astype(str).str.strip()) - {''}
+    assert values == ({'1.0', '2.0', '3.0', '4.0', '5.0', '6.0'} if gaps else {'1', '2', '3', '4', '5', '6'})
@@ -0,0 +1,79 @@
+"""
+Разворот NKVD03 в ST1..ST3_ZN_CH / P1..P3_PUNKT (build_nkvd03_map + lookup_nkvd03_values)
+против исходного построчного заполнения: словарь по str(P99999), первые три записи ключа.
+"""
+import random
+
+import numpy as np
+import pandas as pd
+
+import main
+from conftest import read_table
+
+FIELDS = (main.F1, main.F2, main.F3, main.F4, main.F5, main.F6)
+
+
+def reference_st_punkt(nkvd03: pd.DataFrame, row_nums) -> dict:
+    mapping = {}
+    for _, row in nkvd03.iterrows():
+        key = str(row.get('P99999', '')).strip()
+        entry = {f: '' if pd.isna(row.get(f)) else row.get(f) for f in ('STA', 'ZNA', 'CHA', 'PUN')}
+        mapping.setdefault(key, []).append(entry)
+    columns = {f: [] for f in FIELDS}
+    for row_num in row_nums:
+        entries = mapping.get(str(row_num), [])
+        for i in range(3):
+            st_field, pun_field = FIELDS[2 * i], FIELDS[2 * i + 1]
+            if i < len(entries):
+                ent = entries[i]
+                columns[st_field].append(main.build_st_zn_ch(ent['STA'], ent['ZNA'], ent['CHA']))
+                columns[pun_field].append(str(ent['PUN']) if ent['PUN'] else '')
+            else:
+                columns[st_field].append('')
+                columns[pun_field].append('')
+    return columns
+
+
+def joined_st_punkt(nkvd03: pd.DataFrame, row_nums) -> dict:
+    row_keys = main.integer_join_key(pd.Series(row_nums))
+    columns = main.lookup_nkvd03_values(main.build_nkvd03_map(nkvd03), row_keys)
+    return {f: list(values) for f, values in columns.items()}
+
+
+def test_archive_matches_row_wise_fill(archive, nkvd01):
+    nkvd03 = read_table(archive.nkvd03)
+    row_nums = list(range(1, len(nkvd01) + 1))
+    assert joined_st_punkt(nkvd03, row_nums) == reference_st_punkt(nkvd03, row_nums)
+
+
+def test_fuzzed_keys_and_values():
+    rng = random.Random(3)
+    keys = [rng.choice([1, 2, 3, 4, 5, 7, 8, 9, -1, 0, 10 ** 12]) for _ in range(400)]
+    keys += [' 5', '05', '5.0', '', None, 'x']
+    rng.shuffle(keys)
+    nkvd03 = pd.DataFrame({
+        'P99999': pd.Series(keys, dtype=object),
+        'STA': [rng.choice(['158', '', None, 'x2', 105, np.nan]) for _ in keys],
+        'ZNA': [rng.choice(['', '0', '002', None, 10]) for _ in keys],
+        'CHA': [rng.choice(['', '1', '01', None]) for _ in keys],
+        'PUN': [rng.choice(['', 'а', '1', None, '  ']) for _ in keys],
+    })
+    row_nums = list(range(-2, 12)) + [10 ** 12]
+    assert joined_st_punkt(nkvd03, row_nums) == reference_st_punkt(nkvd03, row_nums)
+
+
+def test_numeric_keys_and_pun():
+    # N-поля: целые без пустых значений и float с NaN
+    nkvd03 = pd.DataFrame({'P99999': [3, 1, 3, 3, 3, 1], 'STA': [1, 2, 3, 4, 5, 6],
+                           'ZNA': ['0'] * 6, 'CHA': [''] * 6, 'PUN': [5, 0, 12, 7, 8, 9]})
+    row_nums = [1, 2, 3]
+    assert joined_st_punkt(nkvd03, row_nums) == reference_st_punkt(nkvd03, row_nums)
+    nkvd03['P99999'] = [3.0, 1.0, np.nan, 3.0, 3.0, 1.0]
+    assert joined_st_punkt(nkvd03, row_nums) == {f: [''] * 3 for f in FIELDS}
+
+
+def test_missing_columns_and_empty_table():
+    nkvd03 = pd.DataFrame({'P99999': [1, 1, 2]})
+    assert joined_st_punkt(nkvd03, [1, 2, 3]) == reference_st_punkt(nkvd03, [1, 2, 3])
+    empty = pd.DataFrame({'P99999': pd.Series([], dtype=object)})
+    assert joined_st_punkt(empty, [1, 2]) == {f: ['', ''] for f in FIELDS}
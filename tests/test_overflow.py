@@ -0,0 +1,76 @@
+"""
+Значения длиннее поля выходной схемы (OUTPUT_OVERFLOW): 'error' прерывает запись
+с перечнем ROW_NUM, 'truncate' обрезает их и печатает отчёт report_overflow.
+"""
+import pandas as pd
+import pytest
+
+import main
+
+
+def sample_frame() -> pd.DataFrame:
+    return pd.DataFrame({'ROW_NUM': [11, 12, 13, 14], 'TXT': ['abc', 'abcdefg', ' ab ', 'ЩукаЩука']})
+
+
+SPECS = [('ROW_NUM', 10), ('TXT', 4)]
+
+
+def test_error_lists_rows():
+    with pytest.raises(ValueError, match=r"TXT C\(4\): 2 записей, длина до 8, ROW_NUM \['12', '14'\]"):
+        main.encode_dbf_records(sample_frame(), SPECS)
+
+
+def test_truncate_cuts_and_reports(capsys):
+    overflows = {}
+    records = main.encode_dbf_records(sample_frame(), SPECS, overflows=overflows)
+    texts = [records[i * 15 + 11:(i + 1) * 15].decode('cp1251') for i in range(4)]
+    assert texts == ['abc ', 'abcd', 'ab  ', 'Щука']
+    assert overflows == {'TXT': {'width': 4, 'count': 2, 'max_length': 8, 'rows': ['12', '14']}}
+    main.print_overflow_report(overflows)
+    assert capsys.readouterr().out == "[warn] Поле TXT C(4): обрезано 2 значений длиной до 8, ROW_NUM 12, 14\n"
+
+
+def test_report_keeps_ten_rows():
+    overflows = {}
+    for start in (0, 8):
+        part = {}
+        df = pd.DataFrame({'ROW_NUM': range(start + 1, start + 9), 'TXT': ['abcdef'] * 7 + ['abcdefghi']})
+        main.encode_dbf_records(df, SPECS, overflows=part)
+        main.merge_overflow_report(overflows, part)
+    assert overflows['TXT']['count'] == 16
+    assert overflows['TXT']['max_length'] == 9
+    assert overflows['TXT']['rows'] == [str(r) for r in range(1, 11)]
+    main.merge_overflow_report(None, part)
+
+
+def narrow_schema(monkeypatch, width: int = 6):
+    schema = main.archive_output_schema
+    monkeypatch.setattr(main, 'archive_output_schema',
+                        lambda paths, items: [(n, width if n in ('UGD_MERGE', 'SFE') else w)
+                                              for n, w in schema(paths, items)])
+
+
+def test_conversion_policies(archive, tmp_path, capsys, monkeypatch):
+    full = archive._replace(out=str(tmp_path / 'full.DBF'))
+    main.convert_in_memory(full)
+    capsys.readouterr()
+
+    narrow_schema(monkeypatch)
+    with pytest.raises(ValueError, match=r"не помещаются в поле (UGD_MERGE|SFE) C\(6\)"):
+        main.convert_in_memory(archive._replace(out=str(tmp_path / 'error.DBF')))
+
+    monkeypatch.setattr(main, 'OUTPUT_OVERFLOW', 'truncate')
+    truncated = archive._replace(out=str(tmp_path / 'truncated.DBF'))
+    main.convert_in_memory(truncated)
+    report = [line for line in capsys.readouterr().out.splitlines() if line.startswith('[warn] Поле')]
+    assert sorted(line.split(':')[0] for line in report) == ['[warn] Поле SFE C(6)', '[warn] Поле UGD_MERGE C(6)']
+
+    expected = main.read_dbf_with_all_records(full.out, encoding=main.ENCODING_OUT)
+    actual = main.read_dbf_with_all_records(truncated.out, encoding=main.ENCODING_OUT)
+    for name in ('UGD_MERGE', 'SFE'):
+        cut = expected[name].fillna('').astype(str).str.strip().str.slice(0, 6).str.rstrip()
+        assert actual[name].fillna('').astype(str).str.strip().tolist() == cut.tolist()
+        long = (expected[name].fillna('').astype(str).str.strip().str.len() > 6).sum()
+        assert f"обрезано {long} значений" in next(line for line in report if f"Поле {name} " in line)
+    others = [c for c in expected.columns if c not in ('UGD_MERGE', 'SFE')]
+    pd.testing.assert_frame_equal(actual[others], expected[others])
@@ -0,0 +1,81 @@
+"""
+Параллельный режим (convert_parallel: записи DBF кодируются в рабочих процессах
+и склеиваются в родительском) против convert_in_memory в одном процессе.
+"""
+import threading
+import warnings
+
+import main
+from conftest import ARCHIVE_ROWS
+
+
+def run_both(archive, tmp_path, capsys, workers=2, chunk_rows=700):
+    single = archive._replace(out=str(tmp_path / 'single.DBF'))
+    parallel = archive._replace(out=str(tmp_path / 'parallel.DBF'))
+    main.convert_in_memory(single)
+    single_log = capsys.readouterr().out
+    main.convert_parallel(workers, chunk_rows, paths=parallel)
+    parallel_log = capsys.readouterr().out
+    return single, parallel, single_log, parallel_log
+
+
+def read_records(path: str) -> bytes:
+    # без даты в заголовке (байты 1..3)
+    with open(path, 'rb') as f:
+        data = f.read()
+    return data[:1] + data[4:]
+
+
+def overflow_warnings(log: str) -> list:
+    return [line for line in log.splitlines() if line.startswith('[warn] Поле')]
+
+
+def test_matches_single_process(archive, tmp_path, capsys):
+    single, parallel, _, _ = run_both(archive, tmp_path, capsys)
+    assert read_records(parallel.out) == read_records(single.out)
+
+
+def test_workers_are_not_forked(archive, tmp_path, capsys):
+    # у родителя есть живые потоки (как у службы --watch): fork из него даёт DeprecationWarning
+    # и риск взаимоблокировки в дочернем процессе
+    release = threading.Event()
+    thread = threading.Thread(target=release.wait)
+    thread.start()
+    try:
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always', DeprecationWarning)
+            single, parallel, _, _ = run_both(archive, tmp_path, capsys)
+    finally:
+        release.set()
+        thread.join()
+    assert not [w for w in caught if 'fork()' in str(w.message)]
+    assert read_records(parallel.out) == read_records(single.out)
+
+
+def test_one_row_range(archive, tmp_path, capsys):
+    # последний диапазон — одна запись
+    single, parallel, _, _ = run_both(archive, tmp_path, capsys, workers=3, chunk_rows=ARCHIVE_ROWS - 1)
+    assert read_records(parallel.out) == read_records(single.out)
+
+
+def test_truncate_report_is_merged(archive, tmp_path, capsys, monkeypatch):
+    schema = main.archive_output_schema
+    monkeypatch.setattr(main, 'archive_output_schema',
+                        lambda paths, items: [(n, 6 if n in ('UGD_MERGE', 'SFE') else w) for n, w in schema(paths, items)])
+    monkeypatch.setattr(main, 'OUTPUT_OVERFLOW', 'truncate')
+    single, parallel, single_log, parallel_log = run_both(archive, tmp_path, capsys)
+    assert overflow_warnings(single_log)
+    assert overflow_warnings(parallel_log) == overflow_warnings(single_log)
+    assert read_records(parallel.out) == read_records(single.out)
+
+
+def test_sinks(archive, tmp_path, capsys, monkeypatch):
+    monkeypatch.setattr(main, 'SINK_TARGETS', [('csv', None)])
+    single, parallel, _, _ = run_both(archive, tmp_path, capsys)
+    with open(tmp_path / 'single.csv', 'rb') as a, open(tmp_path / 'parallel.csv', 'rb') as b:
+        assert a.read() == b.read()
+    monkeypatch.setattr(main, 'WRITE_DBF', False)
+    main.convert_parallel(2, 700, paths=archive._replace(out=str(tmp_path / 'no_dbf.DBF')))
+    assert not (tmp_path / 'no_dbf.DBF').exists()
+    with open(tmp_path / 'single.csv', 'rb') as a, open(tmp_path / 'no_dbf.csv', 'rb') as b:
+        assert a.read() == b.read()
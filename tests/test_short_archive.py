@@ -0,0 +1,41 @@
+"""
+Конвертация архива с недописанным NKVD01: сырые байты выключены, узкие колонки
+ридера категориальные, недостающие записи добиваются пустыми.
+"""
+import numpy as np
+import pandas as pd
+
+import main
+from conftest import ARCHIVE_ROWS, truncated_archive
+
+MISSING = 5
+
+
+def records(path: str) -> list:
+    header = main.read_dbf_file_header(path)
+    with open(path, 'rb') as f:
+        data = f.read()[header.header_length:header.header_length + header.record_count * header.record_length]
+    return [data[i:i + header.record_length] for i in range(0, len(data), header.record_length)]
+
+
+def test_short_archive_converts(archive, tmp_path, capsys):
+    full = archive._replace(out=str(tmp_path / 'full.DBF'))
+    main.convert_in_memory(full)
+    short = truncated_archive(archive, str(tmp_path), MISSING)
+    expected = records(full.out)[:ARCHIVE_ROWS - MISSING]
+    # --engine pandas и --workers, который на недописанном файле уходит в convert_in_memory
+    for convert in (lambda: main.convert_in_memory(short), lambda: main.convert_parallel(2, 700, paths=short)):
+        convert()
+        written = records(short.out)
+        assert len(written) == ARCHIVE_ROWS
+        assert written[:ARCHIVE_ROWS - MISSING] == expected
+    capsys.readouterr()
+
+
+def test_categorical_column_with_missing_values():
+    values = ['А1', None, 'Б', 'А1', None]
+    df = pd.DataFrame({'VID': pd.Series(values, dtype='category'), 'GOD': [1.0, np.nan, 3.0, 4.0, np.nan]})
+    plain = pd.DataFrame({'VID': pd.Series(values, dtype=object), 'GOD': df['GOD']})
+    specs = [('VID', 4), ('GOD', 6)]
+    assert main.encode_dbf_records(df, specs) == main.encode_dbf_records(plain, specs)
+    assert main.sink_columns(df, {}) == main.sink_columns(plain, {})
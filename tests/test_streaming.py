@@ -0,0 +1,31 @@
+"""
+Потоковый режим (--chunk-rows): NKVD01 читается и преобразуется блоками,
+результат побайтно совпадает с convert_in_memory.
+"""
+import pytest
+
+import main
+from conftest import ARCHIVE_ROWS, truncated_archive
+
+
+@pytest.fixture(scope='module')
+def in_memory_digest(archive, tmp_path_factory):
+    single = archive._replace(out=str(tmp_path_factory.mktemp('single') / 'single.DBF'))
+    main.convert_in_memory(single)
+    return main.dbf_digest(single.out)
+
+
+@pytest.mark.parametrize('chunk_rows', [97, 500, ARCHIVE_ROWS - 1, ARCHIVE_ROWS, 10 * ARCHIVE_ROWS])
+def test_matches_in_memory(archive, tmp_path, capsys, in_memory_digest, chunk_rows):
+    streamed = archive._replace(out=str(tmp_path / 'streamed.DBF'))
+    main.convert_streaming(chunk_rows, paths=streamed)
+    capsys.readouterr()
+    assert main.dbf_digest(streamed.out) == in_memory_digest
+
+
+def test_short_archive_matches_in_memory(archive, tmp_path, capsys):
+    short = truncated_archive(archive, str(tmp_path), 5)
+    main.convert_in_memory(short._replace(out=str(tmp_path / 'single.DBF')))
+    main.convert_streaming(500, paths=short)
+    capsys.readouterr()
+    assert main.dbf_digest(short.out) == main.dbf_digest(str(tmp_path / 'single.DBF'))
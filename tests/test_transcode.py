@@ -0,0 +1,52 @@
+"""
+Перекодировка сырых байт cp866 -> cp1251 таблицей (byte_translation, transcode_text_block)
+против bytes.decode/str.encode.
+"""
+import random
+
+import numpy as np
+import pytest
+
+import main
+
+
+def test_table_matches_codecs():
+    table, mappable, space = main.byte_translation('cp866', 'cp1251')
+    for b in range(256):
+        ch = bytes([b]).decode('cp866')
+        assert space[b] == ch.isspace(), hex(b)
+        try:
+            expected = ch.encode('cp1251')
+        except UnicodeEncodeError:
+            assert not mappable[b], hex(b)
+            continue
+        assert mappable[b], hex(b)
+        assert table[b] == expected[0], hex(b)
+
+
+@pytest.mark.parametrize('width', [8, 12])
+def test_block_matches_decode_strip_encode(width):
+    _, mappable, _ = main.byte_translation('cp866', 'cp1251')
+    alphabet = [b for b in range(256) if mappable[b]] + [0x20] * 40 + [0xFF] * 5
+    rng = random.Random(14)
+    rows = [bytes(rng.choice(alphabet) for _ in range(8)) for _ in range(2000)]
+    rows += [b' ' * 8, b'  ab  cd', b'\xff\xffx\xff    ', b'\x00' * 8]
+    block = np.frombuffer(b''.join(rows), dtype=np.uint8).reshape(len(rows), 8)
+    out = main.transcode_text_block(block, width, 'cp866', 'cp1251')
+    expected = [r.decode('cp866').strip().ljust(width).encode('cp1251') for r in rows]
+    assert [bytes(row) for row in out] == expected
+
+
+def test_unmappable_bytes_fall_back_to_str_encoding():
+    # псевдографика cp866 (0xB0 '░') в cp1251 не кодируется: таблица отказывается,
+    # и колонка даёт ту же ошибку, что и декодированный текст
+    _, mappable, _ = main.byte_translation('cp866', 'cp1251')
+    assert not mappable[0xB0]
+    block = np.frombuffer(b'ab\xb0     ' + b'cd      ', dtype=np.uint8).reshape(2, 8)
+    assert main.transcode_text_block(block, 8, 'cp866', 'cp1251') is None
+    df = main.pd.DataFrame({'NOM': np.arange(2)})
+    with pytest.raises(UnicodeEncodeError):
+        main.encode_dbf_records(df, [('NOM', 8)], 'cp1251', raw_text={'NOM': block})
+    decoded = main.pd.DataFrame({'NOM': [r.decode('cp866') for r in (b'ab\xb0     ', b'cd      ')]})
+    with pytest.raises(UnicodeEncodeError):
+        main.encode_dbf_records(decoded, [('NOM', 8)], 'cp1251')
@@ -0,0 +1,55 @@
+"""
+Колоночная сборка UGD_MERGE (build_ugd_merge_column) против исходного
+построчного правила build_ugd_merge_for_row_using_dc.
+"""
+import random
+
+import numpy as np
+import pandas as pd
+
+import main
+from conftest import read_table
+
+
+def reference_ugd_merge(df: pd.DataFrame) -> list:
+    return list(df.astype(object).apply(main.build_ugd_merge_for_row_using_dc, axis=1))
+
+
+def test_archive_matches_row_wise_rule(archive):
+    df = read_table(archive.nkvd01)
+    for col in main.ugd_merge:
+        if col not in df.columns:
+            df[col] = ''
+    df['DC'] = main.combine_date_columns(df, main.DATE_GROUPS['DC'])
+    assert list(main.build_ugd_merge_column(df)) == reference_ugd_merge(df)
+
+
+# VD1/GOD/KOD в исходном правиле склеиваются как строки, поэтому только строки и пустые;
+# UGD/TER проходят через str() и могут быть числами и пропусками.
+TEXT_POOL = ['', ' ', None, '1', '01', ' 2 ', 'А1', '0']
+NUMBER_POOL = TEXT_POOL + [0, 7, 123, 1234567, 12.0, np.nan, '0012', '12-34', ' 5 6 ', '00']
+DC_POOL = ['', None, '31.01.2017', '01.02.2017', '02.02.2017', '29.02.2016', '29.02.2017',
+           '31.12.2030', '1.2.2017', '01.13.2018', '00.01.2018', ' 01.03.2019 ', 'мусор']
+
+
+def test_fuzzed_parts_and_dates():
+    rng = random.Random(11)
+    rows = 3000
+    df = pd.DataFrame({
+        'VD1': [rng.choice(TEXT_POOL) for _ in range(rows)],
+        'GOD': [rng.choice(TEXT_POOL) for _ in range(rows)],
+        'KOD': [rng.choice(TEXT_POOL) for _ in range(rows)],
+        'UGD': [rng.choice(NUMBER_POOL) for _ in range(rows)],
+        'TER': [rng.choice(NUMBER_POOL) for _ in range(rows)],
+        'DC': [rng.choice(DC_POOL) for _ in range(rows)],
+    })
+    assert list(main.build_ugd_merge_column(df)) == reference_ugd_merge(df)
+
+
+def test_numeric_columns():
+    df = pd.DataFrame({
+        'VD1': ['1', '2', ''], 'GOD': ['17', '', '18'], 'KOD': ['', '3', '4'],
+        'UGD': [5, 123456, 0], 'TER': [1.0, 0.0, 77.0],
+        'DC': ['01.02.2017', '31.01.2017', '15.05.2020'],
+    })
+    assert list(main.build_ugd_merge_column(df)) == reference_ugd_merge(df)
@@ -0,0 +1,77 @@
+"""
+Словарный слой map_column_values против поэлементного values.apply(маппер):
+на object-, смешанных и категориальных колонках, с повторными вызовами (кэш между блоками).
+"""
+import random
+
+import numpy as np
+import pandas as pd
+
+import main
+from generate_archive import NKVD01_POOLS
+
+MIXED_POOL = ['', ' ', None, np.nan, '1', '01', '3', '03', '04', '4', '007', '17', '08', '9', '53',
+              'x', 'ab', '12a3', 1, 1.0, 3, 4.0, 17, 8, True, 0, 0.0]
+
+
+def baseline_ovd(v: str) -> str:
+    return '11150' + (v if v.strip() != '' else '000')
+
+
+def baseline_li0(v) -> str:
+    s = ('' if pd.isna(v) else str(v).strip()) or '13'
+    s = s.zfill(2)
+    if s == '03':
+        return '0025'
+    if s == '04':
+        return '0010'
+    return '00' + s
+
+
+def baseline_vid_ed(v) -> str:
+    return '00001' if str(v) == '0010' else ''
+
+
+def assert_same(values: pd.Series, name: str, func):
+    # категориальная колонка ридера — те же значения с None на месте NA (см. plain_column)
+    expected = main.plain_column(values).apply(func).tolist()
+    # второй вызов идёт через уже заполненную таблицу значений
+    for _ in range(2):
+        assert main.map_column_values(values, name).tolist() == expected, name
+
+
+def test_registered_mappers_match_apply():
+    rng = random.Random(4)
+    mixed = pd.Series([rng.choice(MIXED_POOL) for _ in range(3000)], dtype=object)
+    strings = pd.Series([rng.choice(MIXED_POOL[:16]) for _ in range(3000)], dtype=object)
+    numeric = pd.Series([rng.choice([1.0, 3.0, np.nan, 17.0, 0.0]) for _ in range(3000)])
+    for name, func in main.VALUE_MAPPERS.items():
+        if name in ('OVD', 'VID_ED'):
+            continue
+        for values in (mixed, strings, numeric, strings.astype('category')):
+            assert_same(values, name, func)
+
+
+def test_archive_pools_match_baseline_rules():
+    rng = random.Random(9)
+    for column, name in (('OVD', 'OVD'), ('ZAV', 'ZAV'), ('ZAV', 'POLUCH_IZ'), ('OSS', 'OSS'),
+                         ('KUD', 'KUD'), ('LI0', 'LI0')):
+        values = pd.Series([rng.choice(NKVD01_POOLS[column]) for _ in range(2000)], dtype=object)
+        assert_same(values, name, main.VALUE_MAPPERS[name])
+    ovd = pd.Series([rng.choice(NKVD01_POOLS['OVD'] + [None]) for _ in range(2000)], dtype=object)
+    ovd = ovd.fillna('').astype(str)
+    assert main.map_column_values(ovd, 'OVD').tolist() == ovd.apply(baseline_ovd).tolist()
+    li0 = pd.Series([rng.choice(NKVD01_POOLS['LI0'] + [None, np.nan, 3, 4.0]) for _ in range(2000)], dtype=object)
+    mapped = main.map_column_values(li0, 'LI0')
+    assert mapped.tolist() == li0.apply(baseline_li0).tolist()
+    assert main.map_column_values(mapped, 'VID_ED').tolist() == mapped.apply(baseline_vid_ed).tolist()
+
+
+def test_reregistered_mapper_drops_cached_values():
+    values = pd.Series(['1', '2', '1'], dtype=object)
+    main.register_value_mapper('TEST_MAPPER', lambda v: 'a' + v)
+    assert main.map_column_values(values, 'TEST_MAPPER').tolist() == ['a1', 'a2', 'a1']
+    main.register_value_mapper('TEST_MAPPER', lambda v: 'b' + v)
+    assert main.map_column_values(values, 'TEST_MAPPER').tolist() == ['b1', 'b2', 'b1']
+    del main.VALUE_MAPPERS['TEST_MAPPER']
+    main.VALUE_MAPPER_CACHES.pop('TEST_MAPPER', None)
@@ -0,0 +1,77 @@
+"""
+Служба --watch: рабочий процесс, погибший во время задания (os._exit), ломает пул;
+служба пересоздаёт его, виновное задание уходит в карантин, остальные доделываются.
+"""
+import json
+import os
+import shutil
+import threading
+import time
+import warnings
+
+import pytest
+
+import main
+
+# в рабочем процессе (spawn/forkserver) модуль импортируется заново, и здесь — исходная функция
+RUN_WATCH_JOB = main.run_watch_job
+
+
+def crashing_job(paths, out_dir, chunk_rows):
+    # задание для архивов crash-*: процесс завершается без исключения, как при OOM или segfault.
+    # При метке .together (служба с двумя процессами) задания сперва оказываются в работе оба,
+    # и первый запуск good-* не завершается сам: его процесс гасит сломанный пул
+    outbox = os.path.dirname(out_dir)
+    together = os.path.exists(os.path.join(outbox, '.together'))
+    started = os.path.join(outbox, '.good-started')
+    if os.path.basename(out_dir).startswith('crash'):
+        wait_for(lambda: not together or os.path.exists(started), timeout=60.0)
+        os._exit(1)
+    first = not os.path.exists(started)
+    open(started, 'w').close()
+    if together and first:
+        time.sleep(60.0)
+    return RUN_WATCH_JOB(paths, out_dir, chunk_rows)
+
+
+def wait_for(condition, timeout: float = 120.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'служба не обработала архивы'
+        time.sleep(0.1)
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_worker_crash_quarantines_job(archive, tmp_path, monkeypatch, capsys, jobs):
+    monkeypatch.setattr(main, 'run_watch_job', crashing_job)
+    inbox, outbox = tmp_path / 'inbox', tmp_path / 'outbox'
+    for name in ('crash-a', 'good-b'):
+        os.makedirs(inbox / name)
+        for path in archive[:-1]:
+            shutil.copy(path, inbox / name)
+    if jobs > 1:
+        os.makedirs(outbox)
+        (outbox / '.together').touch()
+    stop = threading.Event()
+    service = threading.Thread(target=main.watch_inbox, args=(str(inbox), str(outbox), jobs),
+                               kwargs={'poll': 0.05, 'settle': 0.0, 'stop': stop})
+    quarantine = outbox / '.spool' / 'quarantine'
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always', DeprecationWarning)
+        service.start()
+        try:
+            wait_for(lambda: (outbox / 'good-b' / main.OUT_DB).exists() and (quarantine / 'crash-a').exists())
+        finally:
+            stop.set()
+            service.join()
+    out = capsys.readouterr().out
+    # служба работает в потоке: процессы пула не порождаются через fork
+    assert not [w for w in caught if 'fork()' in str(w.message)]
+
+    with open(quarantine / 'crash-a' / 'error.log', encoding='utf-8') as f:
+        assert 'BrokenProcessPool' in f.read()
+    assert (outbox / '.spool' / 'done' / 'good-b').exists()
+    with open(outbox / 'status.json', encoding='utf-8') as f:
+        status = json.load(f)
+    assert status['done'] == 1 and status['quarantined'] == 1
+    assert status['worker_crashes'] == jobs, out